@@ -0,0 +1,89 @@
+"""
+Compresión negociada de respuestas (brotli o gzip).
+
+Sustituye a GZipMiddleware para poder ofrecer brotli a los clientes que lo
+aceptan y fijar un umbral de tamaño: las respuestas pequeñas se envían sin
+comprimir porque el ahorro no compensa el coste de CPU. brotli es una
+dependencia opcional; sin ella solo se ofrece gzip.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+re_accept_encoding = _lazy_re_compile(r'\b(br|gzip)\b(?:\s*;\s*q=([0-9.]+))?')
+
+
+def elegir_codificacion(accept_encoding):
+    """Codificación preferida por el cliente entre las disponibles ('br', 'gzip' o None)"""
+    aceptadas = {}
+    for codificacion, q in re_accept_encoding.findall(accept_encoding or ''):
+        aceptadas[codificacion] = float(q) if q else 1.0
+
+    candidatas = ['br', 'gzip'] if brotli is not None else ['gzip']
+    candidatas = [c for c in candidatas if aceptadas.get(c, 0) > 0]
+    if not candidatas:
+        return None
+    # A igual preferencia gana brotli (comprime más los JSON)
+    return max(candidatas, key=lambda c: aceptadas[c])
+
+
+class CompresionMiddleware:
+    """Comprime con brotli o gzip las respuestas que superan COMPRESION_MIN_BYTES"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_bytes = getattr(settings, 'COMPRESION_MIN_BYTES', 1024)
+        self.calidad_brotli = getattr(settings, 'COMPRESION_CALIDAD_BROTLI', 4)
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        return self.comprimir(request, response)
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        return self.comprimir(request, response)
+
+    def comprimir(self, request, response):
+        # Los streams (p. ej. Server-Sent Events) deben llegar al cliente sin búfer
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < self.min_bytes:
+            return response
+
+        codificacion = elegir_codificacion(request.headers.get('Accept-Encoding'))
+        if codificacion == 'br':
+            contenido = brotli.compress(response.content, quality=self.calidad_brotli)
+        elif codificacion == 'gzip':
+            # Relleno aleatorio como GZipMiddleware, contra ataques tipo BREACH
+            contenido = compress_string(response.content, max_random_bytes=100)
+        else:
+            return response
+
+        if len(contenido) >= len(response.content):
+            return response
+
+        response.content = contenido
+        response['Content-Length'] = str(len(contenido))
+        response['Content-Encoding'] = codificacion
+        # El cuerpo cambia: un ETag fuerte pasa a ser débil
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
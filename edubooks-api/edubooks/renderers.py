@@ -0,0 +1,63 @@
+"""
+Renderer y parser JSON basados en orjson.
+
+orjson es una dependencia opcional: si no está instalado se usan las
+implementaciones estándar de DRF. La salida es la misma que la de
+JSONRenderer (fechas, decimales y demás tipos se codifican con el encoder
+de DRF); solo cambia la velocidad.
+"""
+import json
+
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # Las fechas pasan por el encoder de DRF para conservar su formato (p. ej. 'Z' en UTC)
+    OPCIONES_ORJSON = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+class JSONRapidoRenderer(renderers.JSONRenderer):
+    """JSONRenderer que codifica con orjson cuando está disponible"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Con indentación solicitada (p. ej. la API navegable) se usa el renderer estándar
+        if self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        return orjson.dumps(data, default=encoders.JSONEncoder().default, option=OPCIONES_ORJSON)
+
+
+class JSONRapidoParser(JSONParser):
+    """JSONParser que decodifica con orjson cuando está disponible"""
+    renderer_class = JSONRapidoRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+def renderizar_json(data):
+    """Codifica `data` igual que las vistas de la API (usado por la caché y las vistas asíncronas)"""
+    return JSONRapidoRenderer().render(data)
+
+
+def cargar_json(contenido):
+    """Decodifica una respuesta JSON ya renderizada (p. ej. servida desde la caché)"""
+    if orjson is None:
+        return json.loads(contenido)
+    return orjson.loads(contenido)
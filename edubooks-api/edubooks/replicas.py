@@ -0,0 +1,163 @@
+"""
+Enrutado de lecturas a réplicas de PostgreSQL.
+
+Las peticiones GET/HEAD leen de una réplica; el resto de peticiones y
+cualquier lectura dentro de una transacción usan la base de datos principal.
+Tras una escritura con éxito, las lecturas del mismo usuario vuelven a la
+principal durante DB_REPLICA_PEGADO_S segundos (leer las propias escrituras),
+y una réplica cuyo retraso supera DB_REPLICA_MAX_LAG_S se descarta.
+
+Lo que se guarda en una caché compartida lo leen después todos los usuarios,
+incluido quien acaba de escribir: esas lecturas se hacen en la principal
+(`en_principal`) para no guardar datos atrasados bajo la versión nueva.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+_peticion_actual = ContextVar('peticion_replica', default=None)
+
+METODOS_LECTURA = ('GET', 'HEAD', 'OPTIONS')
+
+CONSULTA_RETRASO = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def clave_pegado(usuario_id):
+    return f'replica:escritura:{usuario_id}'
+
+
+def replicas_configuradas():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica')]
+
+
+class EstadoReplicas:
+    """Retraso de replicación de cada réplica, consultado como mucho cada `intervalo` segundos"""
+
+    def __init__(self, intervalo=5):
+        self.intervalo = intervalo
+        self._retrasos = {}
+        self._lock = threading.Lock()
+
+    def retraso(self, alias):
+        ahora = time.monotonic()
+        with self._lock:
+            medido = self._retrasos.get(alias)
+            if medido and ahora - medido[1] < self.intervalo:
+                return medido[0]
+
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(CONSULTA_RETRASO)
+                retraso = float(cursor.fetchone()[0])
+        except DatabaseError:
+            retraso = float('inf')
+
+        with self._lock:
+            self._retrasos[alias] = (retraso, ahora)
+        return retraso
+
+    def disponibles(self):
+        maximo = getattr(settings, 'DB_REPLICA_MAX_LAG_S', 10)
+        return [alias for alias in replicas_configuradas() if self.retraso(alias) <= maximo]
+
+
+estado_replicas = EstadoReplicas()
+
+
+def elegir_base_lectura(peticion):
+    """Alias de la base de datos para una lectura de la petición dada (None = principal)"""
+    if peticion is None or connections['default'].in_atomic_block:
+        return None
+
+    usuario = getattr(peticion, 'user', None)
+    if usuario is not None and usuario.is_authenticated and cache.get(clave_pegado(usuario.pk)):
+        return None
+
+    disponibles = estado_replicas.disponibles()
+    return random.choice(disponibles) if disponibles else None
+
+
+@contextmanager
+def en_principal():
+    """Dentro del bloque todas las lecturas van a la base de datos principal"""
+    token = _peticion_actual.set(None)
+    try:
+        yield
+    finally:
+        _peticion_actual.reset(token)
+
+
+class ReplicaRouter:
+    """Envía las lecturas de las peticiones de solo lectura a las réplicas"""
+
+    def db_for_read(self, model, **hints):
+        return elegir_base_lectura(_peticion_actual.get())
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaMiddleware:
+    """Marca las peticiones de lectura y registra las escrituras para la lectura de las propias escrituras"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        lectura = request.method in METODOS_LECTURA
+        token = _peticion_actual.set(request if lectura else None)
+        try:
+            response = self.get_response(request)
+        finally:
+            _peticion_actual.reset(token)
+
+        if not lectura and response.status_code < 400:
+            self.registrar_escritura(request)
+        return response
+
+    async def __acall__(self, request):
+        # La variable de contexto se copia a los hilos de sync_to_async,
+        # así que el router la ve también en las consultas de las vistas síncronas
+        lectura = request.method in METODOS_LECTURA
+        token = _peticion_actual.set(request if lectura else None)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _peticion_actual.reset(token)
+
+        if not lectura and response.status_code < 400:
+            # request.user puede ser perezoso y consultar la base de datos
+            await sync_to_async(self.registrar_escritura)(request)
+        return response
+
+    def registrar_escritura(self, request):
+        usuario = getattr(request, 'user', None)
+        if usuario is not None and usuario.is_authenticated:
+            cache.set(clave_pegado(usuario.pk), True, getattr(settings, 'DB_REPLICA_PEGADO_S', 10))
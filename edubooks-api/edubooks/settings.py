@@ -1,6 +1,11 @@
+import importlib.util
+import os
 from pathlib import Path
 from datetime import timedelta
 
+import django
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -30,11 +35,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # Debe ir primero
+    'edubooks.compresion.CompresionMiddleware',  # Antes de cualquier middleware que lea el cuerpo
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'edubooks.replicas.ReplicaMiddleware',
+    'libros.middleware.TransaccionEscrituraMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -51,8 +59,22 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # orjson si está instalado; si no, el JSON estándar de DRF
+    'DEFAULT_RENDERER_CLASSES': [
+        'edubooks.renderers.JSONRapidoRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'edubooks.renderers.JSONRapidoParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# Compresión de respuestas (brotli si está instalado, si no gzip)
+COMPRESION_MIN_BYTES = int(os.environ.get('COMPRESION_MIN_BYTES', 1024))
+COMPRESION_CALIDAD_BROTLI = int(os.environ.get('COMPRESION_CALIDAD_BROTLI', 4))
+
 # Configuración de JWT
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
@@ -89,15 +111,135 @@ TEMPLATES = [
 WSGI_APPLICATION = 'edubooks.wsgi.application'
 
 # Database
+# Gestión de conexiones configurable por entorno:
+#   DB_MODO=persistente (por defecto): conexiones reutilizadas durante DB_CONN_MAX_AGE segundos
+#   DB_MODO=pool: pool de psycopg 3 en el proceso; requiere Django >= 5.1 y psycopg[pool]
+#       (con las versiones fijadas del proyecto arranca con ImproperlyConfigured)
+#   DB_MODO=pgbouncer: detrás de PgBouncer en modo transacción (sin cursores de servidor
+#       ni parámetros de arranque; el statement_timeout se define en el rol de la base de datos)
+DB_MODO = os.environ.get('DB_MODO', 'persistente')
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'edubooks',
-        'USER': 'postgres',
-        'PASSWORD': 'root',
-        'HOST': 'localhost',
-        'PORT': '5432',
+        'NAME': os.environ.get('DB_NAME', 'edubooks'),
+        'USER': os.environ.get('DB_USER', 'postgres'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'root'),
+        'HOST': os.environ.get('DB_HOST', 'localhost'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+        },
+    }
+}
+
+if DB_MODO == 'pgbouncer':
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+elif DB_STATEMENT_TIMEOUT_MS:
+    DATABASES['default']['OPTIONS']['options'] = f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}'
+
+# Réplicas de solo lectura: DB_REPLICAS="host1:5432,host2:5432"
+# (ver edubooks/replicas.py para las reglas de enrutado)
+DB_REPLICA_MAX_LAG_S = float(os.environ.get('DB_REPLICA_MAX_LAG_S', 10))
+DB_REPLICA_PEGADO_S = int(os.environ.get('DB_REPLICA_PEGADO_S', 10))
+
+for indice, replica in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    host, _, port = replica.strip().partition(':')
+    DATABASES[f'replica{indice}'] = {
+        **DATABASES['default'],
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['edubooks.replicas.ReplicaRouter']
+
+if DB_MODO not in ('persistente', 'pool', 'pgbouncer'):
+    raise ImproperlyConfigured(f'DB_MODO desconocido: {DB_MODO!r} (persistente, pool o pgbouncer)')
+
+if DB_MODO == 'pool':
+    # La opción 'pool' solo existe desde Django 5.1 y con psycopg 3; con psycopg2 la conexión fallaría
+    if django.VERSION < (5, 1) or importlib.util.find_spec('psycopg_pool') is None:
+        raise ImproperlyConfigured(
+            'DB_MODO=pool requiere Django 5.1 o posterior y psycopg 3 con psycopg_pool '
+            f'(instalado: Django {django.get_version()}); usa DB_MODO=persistente o pgbouncer'
+        )
+    for base in DATABASES.values():
+        base['CONN_MAX_AGE'] = 0
+        base['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX', 10)),
+            'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        }
+
+# Caché compartida (Redis si REDIS_URL está definida, memoria local en desarrollo)
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
     }
+
+# Caché de respuestas del catálogo (LRU local delante de la caché compartida)
+CACHE_CATALOGO = {
+    'ALIAS': 'default',
+    'MAX_ENTRADAS_LOCAL': int(os.environ.get('CACHE_CATALOGO_MAX_ENTRADAS', 1024)),
+    'TIMEOUT': int(os.environ.get('CACHE_CATALOGO_TIMEOUT', 300)),
+}
+
+# Bandeja de salida de eventos (libros.eventos)
+EVENTOS_CIRCULACION = {
+    # Segundos que los cursores esperan a que se confirme una fila con ID anterior a otras ya visibles
+    'VENTANA_VISIBILIDAD': int(os.environ.get('EVENTOS_VENTANA_VISIBILIDAD', 30)),
+    # Segundos que cada proceso reutiliza el horizonte de lectura (intervalo de sondeo del feed y del SSE)
+    'INTERVALO_HORIZONTE': 1,
+}
+
+# Índice de disponibilidad en memoria (libros.indice_disponibilidad)
+INDICE_DISPONIBILIDAD = {
+    'ACTIVO': os.environ.get('INDICE_DISPONIBILIDAD_ACTIVO', 'True') == 'True',
+    'PRECALENTAR': True,
+    'ALIAS': 'default',
+    # Segundos entre lecturas de la bandeja de salida y entre publicaciones de la instantánea compartida
+    'INTERVALO': 1,
+    'INTERVALO_PUBLICACION': 600,
+    # Segundos entre recorridos completos de la tabla de libros (eventos confirmados fuera de la ventana de visibilidad)
+    'INTERVALO_RECONCILIACION': 600,
+    # Con más libros agotados que este límite, disponible=true se filtra en SQL
+    'LIMITE_FILTRO': 1000,
+}
+
+# Índice de autocompletado en memoria (libros.sugerencias)
+SUGERENCIAS = {
+    'PRECALENTAR': True,
+    'INTERVALO': 1,
+    # Segundos entre reconstrucciones completas desde la base
+    'INTERVALO_RECONCILIACION': 600,
+}
+
+# Políticas de circulación (libros.politicas): valores generales, las reglas por rol y categoría se guardan en la base
+POLITICAS_CIRCULACION = {
+    'ALIAS': 'default',
+    # Segundos entre comprobaciones de la versión compartida de las reglas
+    'INTERVALO': 5,
+    'POR_DEFECTO': {
+        'dias_prestamo': 15,
+        'max_renovaciones': 2,
+        'dias_renovacion': 15,
+        'dias_reserva': 3,
+        'multa_diaria': 5000,
+    },
 }
 
 # Password validation
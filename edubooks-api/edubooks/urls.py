@@ -21,4 +21,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('usuarios.urls')),
     path('api/', include('libros.urls')),
+    # Endpoints de lectura asíncronos (despliegue ASGI)
+    path('api/async/auth/', include('usuarios.urls_async')),
+    path('api/async/', include('libros.urls_async')),
 ]
@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'edubooks.settings')
 
 application = get_wsgi_application()
+
+# Carga los índices en memoria del catálogo y las políticas de circulación antes de atender peticiones
+from libros import indice_disponibilidad, politicas, sugerencias  # noqa: E402
+
+indice_disponibilidad.precalentar()
+sugerencias.precalentar()
+politicas.precalentar()
@@ -1,6 +1,6 @@
 # libros/admin.py
 from django.contrib import admin
-from .models import Libro, Prestamo, Reserva, Bibliografia, Sancion
+from .models import Libro, Ejemplar, Prestamo, Reserva, Bibliografia, Sancion, PoliticaCirculacion
 
 @admin.register(Libro)
 class LibroAdmin(admin.ModelAdmin):
@@ -9,6 +9,13 @@ class LibroAdmin(admin.ModelAdmin):
     search_fields = ['titulo', 'autor', 'isbn']
     readonly_fields = ['fecha_registro']
     
+@admin.register(Ejemplar)
+class EjemplarAdmin(admin.ModelAdmin):
+    list_display = ['codigo_barras', 'libro', 'ubicacion', 'estado']
+    list_filter = ['estado']
+    search_fields = ['codigo_barras', 'libro__titulo']
+    readonly_fields = ['fecha_registro']
+    
 @admin.register(Prestamo)
 class PrestamoAdmin(admin.ModelAdmin):
     list_display = ['libro', 'usuario', 'fecha_prestamo', 'fecha_devolucion_esperada', 'estado']
@@ -37,3 +44,9 @@ class SancionAdmin(admin.ModelAdmin):
     list_filter = ['tipo', 'estado', 'fecha_inicio']
     search_fields = ['usuario__nombre', 'usuario__apellido']
     readonly_fields = ['fecha_inicio']
+    
+@admin.register(PoliticaCirculacion)
+class PoliticaCirculacionAdmin(admin.ModelAdmin):
+    list_display = ['rol', 'categoria', 'dias_prestamo', 'max_renovaciones', 'dias_renovacion', 'dias_reserva', 'multa_diaria', 'activa']
+    list_filter = ['rol', 'activa']
+    search_fields = ['categoria']
@@ -0,0 +1,209 @@
+# libros/async_views.py
+"""
+Versiones asíncronas de los endpoints de lectura más usados.
+
+Pensadas para un despliegue ASGI (edubooks/asgi.py); se publican bajo
+/api/async/ con las mismas respuestas que sus equivalentes síncronos.
+"""
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Sum
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import exceptions
+from . import eventos
+from .disponibilidad import CAMPOS as CAMPOS_DISPONIBILIDAD, canal_disponibilidad
+from .models import Libro, Prestamo, Reserva, Sancion
+from .serializers import LibroListSerializer, LibroSerializer, PrestamoListSerializer
+from .views import filtrar_catalogo
+from usuarios.async_utils import api_async, consultas_concurrentes, paginar, respuesta_json
+
+# ============ VISTAS DE LIBROS ============
+
+@api_async()
+async def libro_list(request):
+    """Lista y búsqueda de libros en el catálogo"""
+    data = await paginar(request, filtrar_catalogo(request.GET), LibroListSerializer)
+    return respuesta_json(data)
+
+@api_async()
+async def libro_detail(request, pk):
+    """Detalle de un libro con sus préstamos y reservas activas"""
+    try:
+        libro = await Libro.objects.aget(pk=pk)
+    except Libro.DoesNotExist:
+        raise exceptions.NotFound()
+    
+    conteos = await consultas_concurrentes(
+        prestamos_activos=lambda: libro.prestamos.filter(estado='Activo').count(),
+        reservas_activas=lambda: libro.reservas.filter(estado='Activa').count(),
+    )
+    data = LibroSerializer(libro).data
+    data.update(conteos)
+    return respuesta_json(data)
+
+@api_async()
+async def obtener_categorias(request):
+    """Obtiene todas las categorías disponibles"""
+    categorias = Libro.objects.values_list('categoria', flat=True).distinct().order_by('categoria')
+    return respuesta_json({'categorias': [categoria async for categoria in categorias]})
+
+MAX_LIBROS_OBSERVADOS = 50
+# Pasado este tiempo se cierra el stream y el cliente se reconecta (EventSource lo hace solo)
+DURACION_MAXIMA_SSE = 300
+INTERVALO_PING_SSE = 15
+
+def _evento_sse(datos):
+    return f"event: disponibilidad\ndata: {json.dumps(datos)}\n\n"
+
+@api_async()
+async def disponibilidad_libros(request):
+    """Server-Sent Events con los cambios de estado y cantidad disponible de los libros indicados en ?libros=1,2,3"""
+    try:
+        libro_ids = {int(libro_id) for libro_id in request.GET.get('libros', '').split(',') if libro_id}
+    except ValueError:
+        raise exceptions.ValidationError({'error': 'libros debe ser una lista de IDs separados por comas'})
+    if not libro_ids or len(libro_ids) > MAX_LIBROS_OBSERVADOS:
+        raise exceptions.ValidationError(
+            {'error': f'Indique entre 1 y {MAX_LIBROS_OBSERVADOS} libros'}
+        )
+    
+    # Suscribirse antes de leer el estado inicial para no perder cambios intermedios
+    cola = canal_disponibilidad.suscribir(libro_ids)
+    try:
+        iniciales = [
+            libro async for libro in Libro.objects.filter(id__in=libro_ids).values('id', *CAMPOS_DISPONIBILIDAD)
+        ]
+    except BaseException:
+        canal_disponibilidad.cancelar(cola, libro_ids)
+        raise
+    
+    async def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            for datos in iniciales:
+                yield _evento_sse(datos)
+            
+            fin = time.monotonic() + DURACION_MAXIMA_SSE
+            while time.monotonic() < fin:
+                try:
+                    datos = await asyncio.wait_for(cola.get(), INTERVALO_PING_SSE)
+                except asyncio.TimeoutError:
+                    yield ': ping\n\n'
+                    continue
+                yield _evento_sse(datos)
+        finally:
+            canal_disponibilidad.cancelar(cola, libro_ids)
+    
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+# ============ VISTAS DE PRÉSTAMOS ============
+
+@api_async()
+async def mis_prestamos(request):
+    """Préstamos del usuario autenticado (todos para administradores)"""
+    user = request.user
+    
+    if user.rol == 'Administrador':
+        queryset = Prestamo.objects.all()
+    else:
+        queryset = Prestamo.objects.filter(usuario=user)
+    
+    estado = request.GET.get('estado', None)
+    if estado:
+        queryset = queryset.filter(estado=estado)
+    
+    queryset = queryset.select_related('libro', 'usuario').order_by('-fecha_prestamo')
+    data = await paginar(request, queryset, PrestamoListSerializer)
+    return respuesta_json(data)
+
+# ============ VISTAS DE ESTADÍSTICAS ============
+
+@api_async(roles=['Administrador'])
+async def estadisticas_biblioteca(request):
+    """Estadísticas generales de la biblioteca con las consultas en paralelo"""
+    hoy = timezone.now().date()
+    
+    datos = await consultas_concurrentes(
+        total_libros=lambda: Libro.objects.count(),
+        libros_disponibles=lambda: Libro.objects.filter(cantidad_disponible__gt=0).count(),
+        prestamos_activos=lambda: Prestamo.objects.filter(estado='Activo').count(),
+        prestamos_vencidos=lambda: Prestamo.objects.filter(
+            estado='Activo',
+            fecha_devolucion_esperada__lt=hoy
+        ).count(),
+        reservas_activas=lambda: Reserva.objects.filter(estado='Activa').count(),
+        sanciones_activas=lambda: Sancion.objects.filter(estado='Activa').count(),
+        libros_populares=lambda: list(
+            Libro.objects.annotate(
+                total_prestamos=Count('prestamos')
+            ).order_by('-total_prestamos').values('titulo', 'autor', 'total_prestamos')[:5]
+        ),
+    )
+    return respuesta_json(datos)
+
+@api_async(roles=['Administrador'])
+async def dashboard_sanciones(request):
+    """Dashboard con estadísticas de sanciones con las consultas en paralelo"""
+    hoy = timezone.now().date()
+    
+    datos = await consultas_concurrentes(
+        total_sanciones=lambda: Sancion.objects.count(),
+        sanciones_activas=lambda: Sancion.objects.filter(estado='Activa').count(),
+        sanciones_pagadas=lambda: Sancion.objects.filter(estado='Pagada').count(),
+        monto_multas_activas=lambda: Sancion.objects.filter(
+            tipo='Multa',
+            estado='Activa'
+        ).aggregate(total=Sum('monto'))['total'] or 0,
+        prestamos_vencidos_sin_sancion=lambda: Prestamo.objects.filter(
+            estado='Activo',
+            fecha_devolucion_esperada__lt=hoy
+        ).exclude(
+            sanciones__isnull=False
+        ).count(),
+        usuarios_con_sanciones=lambda: list(
+            Sancion.objects.filter(
+                estado='Activa'
+            ).values(
+                'usuario__nombre', 'usuario__apellido', 'usuario__email'
+            ).annotate(
+                total_sanciones=Count('id'),
+                total_monto=Sum('monto')
+            ).order_by('-total_sanciones')[:5]
+        ),
+    )
+    
+    usuarios_con_sanciones = datos.pop('usuarios_con_sanciones')
+    datos['monto_multas_activas'] = float(datos['monto_multas_activas'])
+    return respuesta_json({
+        'estadisticas': datos,
+        'usuarios_con_sanciones': usuarios_con_sanciones
+    })
+
+# ============ VISTAS DE EVENTOS ============
+
+INTERVALO_SONDEO = 1
+
+@api_async()
+async def feed_eventos(request):
+    """Feed de eventos con long-poll: espera hasta `espera` segundos a que haya eventos nuevos"""
+    desde, limite, espera = eventos.parametros_feed(request.GET)
+    if desde is None:
+        cursor = await sync_to_async(eventos.ultimo_cursor)()
+        return respuesta_json({'eventos': [], 'cursor': cursor, 'hay_mas': False})
+    
+    queryset = eventos.visibles(request.user)
+    fin = time.monotonic() + espera
+    while True:
+        lista, cursor, hay_mas = await sync_to_async(eventos.leer)(queryset, desde, limite)
+        if lista or time.monotonic() >= fin:
+            break
+        await asyncio.sleep(INTERVALO_SONDEO)
+    
+    return respuesta_json(eventos.respuesta_feed(lista, cursor, hay_mas))
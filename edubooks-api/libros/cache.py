@@ -0,0 +1,176 @@
+# libros/cache.py
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from edubooks.renderers import renderizar_json
+from edubooks.replicas import en_principal
+
+
+class CacheLRULocal:
+    """Caché en memoria del proceso con política de reemplazo LRU"""
+
+    def __init__(self, max_entradas=1024):
+        self.max_entradas = max_entradas
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            try:
+                self._datos.move_to_end(clave)
+                return self._datos[clave]
+            except KeyError:
+                return None
+
+    def set(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = valor
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+
+class CacheRespuestas:
+    """
+    Caché de dos niveles para respuestas JSON ya codificadas.
+
+    Un LRU local del proceso va delante de la caché compartida de Django.
+    La invalidación se hace por ámbitos versionados: cada clave incluye la
+    versión actual de sus ámbitos, de modo que incrementar una versión deja
+    obsoletas todas las entradas que dependen de ella en todos los workers.
+    """
+
+    def __init__(self, prefijo, alias='default', max_entradas=1024, timeout=300):
+        self.prefijo = prefijo
+        self.alias = alias
+        self.timeout = timeout
+        self.local = CacheLRULocal(max_entradas)
+
+    @property
+    def compartida(self):
+        return caches[self.alias]
+
+    def _clave_version(self, ambito):
+        return f'{self.prefijo}:v:{ambito}'
+
+    def version(self, ambito):
+        clave = self._clave_version(ambito)
+        version = self.compartida.get(clave)
+        if version is None:
+            # Se parte de una marca de tiempo para que una versión expulsada
+            # de la caché compartida nunca reutilice un número anterior
+            self.compartida.add(clave, time.time_ns(), timeout=None)
+            version = self.compartida.get(clave)
+        return version
+
+    def invalidar(self, *ambitos):
+        for ambito in ambitos:
+            clave = self._clave_version(ambito)
+            try:
+                self.compartida.incr(clave)
+            except ValueError:
+                self.compartida.set(clave, time.time_ns(), timeout=None)
+
+    def clave(self, request, ambitos, parametros=()):
+        """Construye la clave a partir del rol, la ruta, los parámetros normalizados y las versiones"""
+        rol = getattr(request.user, 'rol', None) or 'anonimo'
+        valores = []
+        for nombre in sorted(parametros):
+            valor = request.query_params.get(nombre, '').strip().lower()
+            if valor:
+                valores.append(f'{nombre}={valor}')
+        versiones = ','.join(f'{ambito}@{self.version(ambito)}' for ambito in ambitos)
+        return f'{self.prefijo}:{rol}:{request.get_host()}{request.path}?{"&".join(valores)}:{versiones}'
+
+    def get(self, clave):
+        contenido = self.local.get(clave)
+        if contenido is None:
+            contenido = self.compartida.get(clave)
+            if contenido is not None:
+                self.local.set(clave, contenido)
+        return contenido
+
+    def set(self, clave, contenido):
+        self.local.set(clave, contenido)
+        self.compartida.set(clave, contenido, timeout=self.timeout)
+
+
+_config_catalogo = getattr(settings, 'CACHE_CATALOGO', {})
+
+cache_catalogo = CacheRespuestas(
+    'catalogo',
+    alias=_config_catalogo.get('ALIAS', 'default'),
+    max_entradas=_config_catalogo.get('MAX_ENTRADAS_LOCAL', 1024),
+    timeout=_config_catalogo.get('TIMEOUT', 300),
+)
+
+# Respuestas por usuario (panel de inicio): prefijo propio para no desplazar al catálogo
+cache_paneles = CacheRespuestas(
+    'panel',
+    alias=_config_catalogo.get('ALIAS', 'default'),
+    max_entradas=_config_catalogo.get('MAX_ENTRADAS_LOCAL', 1024),
+    timeout=_config_catalogo.get('TIMEOUT', 300),
+)
+
+
+def invalidar_libros(libro_ids=(), listados=True):
+    """Invalida el detalle de los libros indicados y, opcionalmente, los listados del catálogo"""
+    ambitos = [f'libro:{libro_id}' for libro_id in set(libro_ids)]
+    if listados:
+        ambitos.append('libros')
+    cache_catalogo.invalidar(*ambitos)
+
+
+def invalidar_paneles(usuario_ids=(), programas=()):
+    """Invalida el panel de los usuarios indicados y el de todos los usuarios de los programas indicados"""
+    ambitos = [f'usuario:{usuario_id}' for usuario_id in set(usuario_ids)]
+    ambitos += [f'programa:{programa}' for programa in set(programas) if programa]
+    cache_paneles.invalidar(*ambitos)
+
+
+class RespuestaCacheadaMixin:
+    """
+    Sirve las respuestas GET de una vista desde `cache_respuestas`.
+
+    Las vistas definen `get_ambitos_cache()` y `parametros_cache` (los
+    parámetros de consulta que afectan a la respuesta). Solo se almacenan
+    respuestas 200, construidas con lecturas de la base principal; la
+    autenticación y los permisos se evalúan siempre.
+    """
+    cache_respuestas = cache_catalogo
+    parametros_cache = ()
+
+    def get_ambitos_cache(self):
+        raise NotImplementedError
+
+    def get_clave_cache(self, request):
+        return self.cache_respuestas.clave(request, self.get_ambitos_cache(), self.parametros_cache)
+
+    def preparar_cache(self, datos):
+        """Lo que se guarda en la caché a partir de los datos de la respuesta"""
+        return renderizar_json(datos)
+
+    def contenido_cache(self, guardado):
+        """Cuerpo de la respuesta a partir de lo guardado en la caché"""
+        return guardado
+
+    def get(self, request, *args, **kwargs):
+        clave = self.get_clave_cache(request)
+        guardado = self.cache_respuestas.get(clave)
+        if guardado is None:
+            # La respuesta guardada se sirve a todos: se construye desde la principal, no desde una réplica atrasada
+            with en_principal():
+                response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            guardado = self.preparar_cache(response.data)
+            self.cache_respuestas.set(clave, guardado)
+        return HttpResponse(self.contenido_cache(guardado), content_type='application/json')
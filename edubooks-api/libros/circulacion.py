@@ -0,0 +1,330 @@
+# libros/circulacion.py
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import (
+    Case, Count, DateField, DurationField, ExpressionWrapper, F, OuterRef, Q, Subquery, Value, When
+)
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from . import ejemplares, estado_cuenta, eventos, lecturas, politicas
+from .cache import invalidar_libros, invalidar_paneles
+from .indice_disponibilidad import activo as indice_activo, indice_disponibilidad
+from .models import Ejemplar, Libro, Prestamo, Reserva, Sancion
+
+
+def sincronizar_libros(libro_ids, usuario_ids=()):
+    """Propaga una actualización masiva (sin señales) a la caché, las listas de lectura, los eventos y los estados de cuenta"""
+    libro_ids = set(libro_ids)
+    if libro_ids:
+        lecturas.sincronizar_libros(libro_ids)
+        eventos.registrar_lote(Libro, libro_ids)
+        transaction.on_commit(lambda: invalidar_libros(libro_ids, listados=not indice_activo()))
+        if indice_disponibilidad.cargado:
+            transaction.on_commit(lambda: indice_disponibilidad.actualizar(forzar=True))
+        invalidar_paneles_reservas(libro_ids)
+    if usuario_ids:
+        usuario_ids = set(usuario_ids)
+        estado_cuenta.conciliar(usuario_ids)
+        transaction.on_commit(lambda: invalidar_paneles(usuario_ids))
+
+
+def ajustar_disponibilidad(cambios):
+    """
+    Suma a `cantidad_disponible` de cada libro su cambio ({libro_id: n}) con
+    un UPDATE atómico, sin bajar de cero, y ajusta el estado con la misma
+    regla que Libro.save.
+
+    Solo para libros sin ejemplares, dentro de la transacción del préstamo:
+    su contador es el único registro de la disponibilidad. Los libros con
+    ejemplares la derivan de ellos (ejemplares.recontar).
+    """
+    cambios = {libro_id: n for libro_id, n in cambios.items() if n}
+    if not cambios:
+        return
+
+    with transaction.atomic():
+        libros = Libro.objects.filter(id__in=cambios)
+        libros.update(
+            cantidad_disponible=Greatest(F('cantidad_disponible') + Case(
+                *[When(id=libro_id, then=Value(n)) for libro_id, n in cambios.items()],
+                default=Value(0)
+            ), Value(0)),
+            fecha_actualizacion=timezone.now()
+        )
+        libros.filter(estado='Disponible', cantidad_disponible=0).update(estado='Prestado')
+        libros.filter(estado='Prestado', cantidad_disponible__gt=0).update(estado='Disponible')
+        sincronizar_libros(cambios)
+
+
+def contador_por_libro(queryset):
+    """Subconsulta con el número de filas de `queryset` del libro de la fila externa (0 si no hay)"""
+    return Coalesce(Subquery(
+        queryset.filter(libro_id=OuterRef('pk')).order_by().values('libro_id').annotate(
+            total=Count('id')
+        ).values('total')
+    ), Value(0))
+
+
+def invalidar_paneles_reservas(libro_ids):
+    """La disponibilidad decide qué reservas están listas para recoger: invalida el panel de quienes reservaron los libros"""
+    usuario_ids = set(
+        Reserva.objects.filter(libro_id__in=libro_ids, estado='Activa').values_list('usuario_id', flat=True)
+    )
+    if usuario_ids:
+        transaction.on_commit(lambda: invalidar_paneles(usuario_ids))
+
+
+def devolver_prestamos(prestamo_ids=(), isbns=(), codigos=()):
+    """
+    Procesa la devolución de varios préstamos en una sola transacción.
+
+    Acepta IDs de préstamo, ISBN o códigos de barras de ejemplares escaneados;
+    cada ISBN se asigna al préstamo abierto más antiguo de ese libro y cada
+    código al préstamo abierto de ese ejemplar. Los préstamos, los ejemplares,
+    la disponibilidad de los libros y las multas por retraso se actualizan con
+    sentencias masivas. Devuelve un resultado por cada entrada, en el mismo
+    orden.
+    """
+    ahora = timezone.now()
+    hoy = timezone.localdate(ahora)
+
+    with transaction.atomic():
+        abiertos = list(
+            Prestamo.objects.select_for_update(of=('self',)).filter(
+                estado__in=estado_cuenta.ESTADOS_PRESTAMO_ABIERTOS
+            ).filter(
+                Q(id__in=prestamo_ids) | Q(libro__isbn__in=isbns) | Q(ejemplar__codigo_barras__in=codigos)
+            ).order_by('fecha_devolucion_esperada', 'id').values(
+                'id', 'libro_id', 'usuario_id', 'ejemplar_id', 'fecha_devolucion_esperada',
+                'libro__isbn', 'ejemplar__codigo_barras', 'libro__categoria', 'usuario__rol'
+            )
+        )
+        por_id = {prestamo['id']: prestamo for prestamo in abiertos}
+        por_codigo = {prestamo['ejemplar__codigo_barras']: prestamo for prestamo in abiertos}
+        por_isbn = {}
+        for prestamo in abiertos:
+            por_isbn.setdefault(prestamo['libro__isbn'], []).append(prestamo)
+
+        # Resolver cada entrada a un préstamo abierto
+        resultados = []
+        devueltos = {}
+        for prestamo_id in prestamo_ids:
+            prestamo = por_id.get(prestamo_id)
+            if prestamo is None or prestamo['id'] in devueltos:
+                resultados.append({'prestamo_id': prestamo_id, 'resultado': 'no_activo'})
+                continue
+            devueltos[prestamo['id']] = prestamo
+            resultados.append({'prestamo_id': prestamo_id, 'resultado': 'devuelto'})
+        for isbn in isbns:
+            candidatos = [p for p in por_isbn.get(isbn, []) if p['id'] not in devueltos]
+            if not candidatos:
+                resultados.append({'isbn': isbn, 'resultado': 'sin_prestamo_activo'})
+                continue
+            devueltos[candidatos[0]['id']] = candidatos[0]
+            resultados.append({'isbn': isbn, 'prestamo_id': candidatos[0]['id'], 'resultado': 'devuelto'})
+        for codigo in codigos:
+            prestamo = por_codigo.get(codigo)
+            if prestamo is None or prestamo['id'] in devueltos:
+                resultados.append({'codigo_barras': codigo, 'resultado': 'sin_prestamo_activo'})
+                continue
+            devueltos[prestamo['id']] = prestamo
+            resultados.append({'codigo_barras': codigo, 'prestamo_id': prestamo['id'], 'resultado': 'devuelto'})
+
+        # Distinguir IDs inexistentes de préstamos ya cerrados
+        pendientes = {r['prestamo_id'] for r in resultados if r['resultado'] == 'no_activo'}
+        if pendientes:
+            existentes = set(Prestamo.objects.filter(id__in=pendientes).values_list('id', flat=True))
+            for resultado in resultados:
+                if resultado['resultado'] == 'no_activo' and resultado['prestamo_id'] not in existentes:
+                    resultado['resultado'] = 'no_encontrado'
+
+        if not devueltos:
+            return resultados
+
+        Prestamo.objects.filter(id__in=devueltos).update(
+            estado='Devuelto',
+            fecha_devolucion_real=ahora,
+            fecha_actualizacion=ahora
+        )
+        Ejemplar.objects.filter(
+            id__in=[prestamo['ejemplar_id'] for prestamo in devueltos.values() if prestamo['ejemplar_id']]
+        ).update(estado='Disponible', fecha_actualizacion=ahora)
+
+        # Disponibilidad: los libros con ejemplares la derivan de ellos al confirmar; el resto, un UPDATE
+        # con los incrementos agregados por libro (ver Prestamo._mover_ejemplar)
+        con_ejemplares = set(
+            Ejemplar.objects.filter(
+                libro_id__in={prestamo['libro_id'] for prestamo in devueltos.values()}
+            ).order_by().values_list('libro_id', flat=True).distinct()
+        )
+        ajustar_disponibilidad(Counter(
+            prestamo['libro_id'] for prestamo in devueltos.values() if prestamo['libro_id'] not in con_ejemplares
+        ))
+        ejemplares.recontar_al_confirmar(con_ejemplares)
+
+        # Multas por retraso, sin duplicar las ya generadas por procesar_prestamos_vencidos
+        con_sancion = set(
+            Sancion.objects.filter(prestamo_id__in=devueltos).values_list('prestamo_id', flat=True)
+        )
+        multas = {}
+        for prestamo in devueltos.values():
+            dias_retraso = (hoy - prestamo['fecha_devolucion_esperada']).days
+            if dias_retraso > 0 and prestamo['id'] not in con_sancion:
+                politica = politicas.obtener(prestamo['usuario__rol'], prestamo['libro__categoria'])
+                multas[prestamo['id']] = Sancion(
+                    usuario_id=prestamo['usuario_id'],
+                    prestamo_id=prestamo['id'],
+                    tipo='Multa',
+                    descripcion=f'Multa por devolución tardía ({dias_retraso} días)',
+                    monto=politica.multa(dias_retraso),
+                    estado='Activa'
+                )
+        Sancion.objects.bulk_create(multas.values())
+        eventos.registrar_lote(Prestamo, devueltos)
+        eventos.registrar_lote(Sancion, [multa.pk for multa in multas.values()], 'creado')
+
+        sincronizar_libros((), {prestamo['usuario_id'] for prestamo in devueltos.values()})
+
+    for resultado in resultados:
+        multa = multas.get(resultado.get('prestamo_id')) if resultado['resultado'] == 'devuelto' else None
+        if multa is not None:
+            resultado['multa'] = multa.monto
+    return resultados
+
+
+TAMANO_LOTE_RENOVACION = 5000
+
+
+def renovar_prestamos(prestamo_ids=None, usuario_id=None, dias=None):
+    """
+    Renueva varios préstamos activos en una sola transacción.
+
+    Sin `prestamo_ids` se renuevan todos los préstamos activos (del usuario,
+    si se indica). Las reservas de otros usuarios sobre los libros se buscan
+    con una sola consulta y las renovaciones válidas se aplican con un UPDATE
+    que suma a cada fecha la extensión de su política (o `dias`, si se fija).
+    Devuelve un resultado por préstamo.
+    """
+    ahora = timezone.now()
+
+    with transaction.atomic():
+        queryset = Prestamo.objects.select_for_update(of=('self',))
+        if usuario_id is not None:
+            queryset = queryset.filter(usuario_id=usuario_id)
+        if prestamo_ids is None:
+            queryset = queryset.filter(estado='Activo')
+        else:
+            queryset = queryset.filter(id__in=prestamo_ids)
+        prestamos = list(queryset.order_by('fecha_devolucion_esperada', 'id').values(
+            'id', 'libro_id', 'usuario_id', 'estado', 'renovaciones', 'libro__categoria', 'usuario__rol'
+        ))
+        por_id = {prestamo['id']: prestamo for prestamo in prestamos}
+
+        # Reservas activas de los libros, agrupadas por libro en una sola consulta
+        reservas = defaultdict(set)
+        for libro_id, reserva_usuario_id in Reserva.objects.filter(
+            libro_id__in={prestamo['libro_id'] for prestamo in prestamos if prestamo['estado'] == 'Activo'},
+            estado='Activa'
+        ).order_by().values_list('libro_id', 'usuario_id').distinct():
+            reservas[libro_id].add(reserva_usuario_id)
+        bloqueados = estado_cuenta.bloqueados(
+            {prestamo['usuario_id'] for prestamo in prestamos if prestamo['estado'] == 'Activo'}
+        )
+
+        resultados = []
+        extensiones = defaultdict(list)
+        for prestamo_id in (por_id if prestamo_ids is None else dict.fromkeys(prestamo_ids)):
+            prestamo = por_id.get(prestamo_id)
+            if prestamo is None:
+                resultados.append({'prestamo_id': prestamo_id, 'resultado': 'no_encontrado'})
+                continue
+            politica = politicas.obtener(prestamo['usuario__rol'], prestamo['libro__categoria'])
+            if prestamo['estado'] != 'Activo':
+                resultado = 'no_activo'
+            elif prestamo['usuario_id'] in bloqueados:
+                resultado = 'usuario_bloqueado'
+            elif prestamo['renovaciones'] >= politica.max_renovaciones:
+                resultado = 'maximo_renovaciones'
+            elif reservas[prestamo['libro_id']] - {prestamo['usuario_id']}:
+                resultado = 'reservas_pendientes'
+            else:
+                resultado = 'renovado'
+                extensiones[dias or politica.dias_renovacion].append(prestamo_id)
+            resultados.append({'prestamo_id': prestamo_id, 'resultado': resultado})
+
+        renovados = [prestamo_id for ids in extensiones.values() for prestamo_id in ids]
+        if not renovados:
+            return resultados
+
+        for inicio in range(0, len(renovados), TAMANO_LOTE_RENOVACION):
+            lote = renovados[inicio:inicio + TAMANO_LOTE_RENOVACION]
+            if len(extensiones) == 1:
+                extension = Value(timedelta(days=next(iter(extensiones))), output_field=DurationField())
+            else:
+                extension = Case(
+                    *[When(id__in=ids, then=Value(timedelta(days=n))) for n, ids in extensiones.items()],
+                    output_field=DurationField()
+                )
+            Prestamo.objects.filter(id__in=lote).update(
+                fecha_devolucion_esperada=ExpressionWrapper(
+                    F('fecha_devolucion_esperada') + extension, output_field=DateField()
+                ),
+                renovaciones=F('renovaciones') + 1,
+                fecha_actualizacion=ahora
+            )
+
+        nuevas = dict(Prestamo.objects.filter(id__in=renovados).values_list('id', 'fecha_devolucion_esperada'))
+        usuario_ids = {por_id[prestamo_id]['usuario_id'] for prestamo_id in renovados}
+        # Renovar no cambia el detalle de los libros (ni su fila): solo eventos y paneles
+        eventos.registrar_lote(Prestamo, renovados)
+        transaction.on_commit(lambda: invalidar_paneles(usuario_ids))
+
+    for resultado in resultados:
+        if resultado['resultado'] == 'renovado':
+            resultado['fecha_devolucion_esperada'] = nuevas[resultado['prestamo_id']]
+    return resultados
+
+
+def _contar_por_libro(queryset, libro_ids):
+    """{libro_id: total} agrupando `queryset` por libro en una sola consulta"""
+    return dict(
+        queryset.filter(libro_id__in=libro_ids).order_by().values('libro_id').annotate(
+            total=Count('id')
+        ).values_list('libro_id', 'total')
+    )
+
+
+def buscar_libros(libro_ids=(), isbns=()):
+    """
+    Resuelve varios libros por ID o ISBN con una sola consulta IN.
+
+    Los contadores de préstamos y reservas activos (los mismos del detalle
+    de un libro) se calculan con una agregación agrupada por libro. Devuelve
+    los libros en el orden pedido, sin repetir, y las claves no encontradas.
+    """
+    libros = list(Libro.objects.filter(Q(id__in=libro_ids) | Q(isbn__in=isbns)))
+    por_id = {libro.pk: libro for libro in libros}
+    por_isbn = {libro.isbn: libro for libro in libros if libro.isbn}
+
+    prestamos = _contar_por_libro(Prestamo.objects.filter(estado='Activo'), por_id)
+    reservas = _contar_por_libro(Reserva.objects.filter(estado='Activa'), por_id)
+    for libro in libros:
+        libro.prestamos_activos = prestamos.get(libro.pk, 0)
+        libro.reservas_activas = reservas.get(libro.pk, 0)
+
+    encontrados = {}
+    no_encontrados = {'ids': [], 'isbns': []}
+    for libro_id in libro_ids:
+        if libro_id in por_id:
+            encontrados.setdefault(libro_id, por_id[libro_id])
+        else:
+            no_encontrados['ids'].append(libro_id)
+    for isbn in isbns:
+        if isbn in por_isbn:
+            encontrados.setdefault(por_isbn[isbn].pk, por_isbn[isbn])
+        else:
+            no_encontrados['isbns'].append(isbn)
+    return list(encontrados.values()), no_encontrados
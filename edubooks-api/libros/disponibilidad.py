@@ -0,0 +1,82 @@
+# libros/disponibilidad.py
+"""
+Publicación en vivo de la disponibilidad de los libros (ASGI).
+
+Cada proceso mantiene un canal en memoria: los clientes se suscriben a los
+libros que observan y una única tarea por proceso lee los eventos de libros
+de la bandeja de salida (libros.eventos) y los reparte a todos los
+suscriptores. Así el coste en base de datos es una consulta por intervalo y
+proceso, independiente del número de clientes, y los cambios hechos en
+cualquier otro proceso también llegan.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+
+from . import eventos
+from .models import EventoCirculacion
+
+CAMPOS = ['estado', 'cantidad_disponible']
+
+
+class CanalDisponibilidad:
+    """Pub/sub en memoria de cambios de disponibilidad por libro"""
+
+    def __init__(self, intervalo=1, cola_maxima=100):
+        self.intervalo = intervalo
+        self.cola_maxima = cola_maxima
+        self._suscriptores = {}
+        self._tarea = None
+        self._cursor = None
+        # Hilo propio: la tarea sobrevive a la petición que la creó y conserva su conexión
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='disponibilidad')
+
+    def suscribir(self, libro_ids):
+        cola = asyncio.Queue(maxsize=self.cola_maxima)
+        for libro_id in libro_ids:
+            self._suscriptores.setdefault(libro_id, set()).add(cola)
+        if self._tarea is None or self._tarea.done():
+            self._tarea = asyncio.get_running_loop().create_task(self._repetir())
+        return cola
+
+    def cancelar(self, cola, libro_ids):
+        for libro_id in libro_ids:
+            colas = self._suscriptores.get(libro_id)
+            if colas is not None:
+                colas.discard(cola)
+                if not colas:
+                    del self._suscriptores[libro_id]
+
+    def publicar(self, libro_id, datos):
+        for cola in self._suscriptores.get(libro_id, ()):
+            if cola.full():
+                # Un cliente lento solo necesita el estado más reciente
+                cola.get_nowait()
+            cola.put_nowait(datos)
+
+    def _leer_eventos(self):
+        close_old_connections()
+        if self._cursor is None:
+            self._cursor = eventos.ultimo_cursor()
+        # Solo hasta el horizonte: un evento confirmado tarde con un ID menor no se pierde
+        filas, self._cursor, _ = eventos.leer(
+            EventoCirculacion.objects.filter(entidad='Libro').values('id', 'entidad_id', 'accion', 'datos'),
+            self._cursor
+        )
+        return filas
+
+    async def _repetir(self):
+        while self._suscriptores:
+            filas = await asyncio.get_running_loop().run_in_executor(self._executor, self._leer_eventos)
+            for fila in filas:
+                datos = {campo: fila['datos'].get(campo) for campo in CAMPOS}
+                if fila['accion'] == 'eliminado':
+                    datos = {'estado': 'Eliminado', 'cantidad_disponible': 0}
+                self.publicar(fila['entidad_id'], {'id': fila['entidad_id'], **datos})
+            await asyncio.sleep(self.intervalo)
+        # Sin suscriptores la tarea termina; la siguiente suscripción parte del cursor actual
+        self._cursor = None
+
+
+canal_disponibilidad = CanalDisponibilidad()
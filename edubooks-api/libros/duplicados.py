@@ -0,0 +1,279 @@
+# libros/duplicados.py
+"""
+Detección y fusión de libros duplicados en el catálogo.
+
+Los candidatos se agrupan por claves normalizadas (ISBN-13, palabras del
+título sin tildes ni orden, primera palabra del título más una palabra del
+autor) y solo se comparan los pares dentro de cada bloque, con la similitud
+de trigramas de título y autor. Los pares por encima del umbral se unen en
+grupos; en cada grupo se conserva el libro con ISBN, más préstamos o menor
+ID.
+
+La fusión re-apunta ejemplares, préstamos, préstamos archivados, reservas
+y bibliografías de los duplicados al libro conservado con UPDATE masivos
+(CASE por lotes) y elimina los duplicados. Si el libro conservado acaba con
+ejemplares, sus cantidades se vuelven a derivar de ellos (las de un libro sin
+ejemplares del grupo no cuentan: conviene ejecutar antes generar_ejemplares);
+si no, se suman las de los duplicados.
+"""
+import re
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, Count, F, Value, When
+from django.utils import timezone
+
+from . import circulacion, ejemplares, lecturas
+from .cache import invalidar_libros, invalidar_paneles
+from .models import Bibliografia, Ejemplar, Libro, Prestamo, PrestamoHistorico, Reserva
+from .sugerencias import palabras
+
+UMBRAL = 0.85
+# Bloques mayores (claves demasiado comunes) no se comparan par a par
+TAMANO_MAXIMO_BLOQUE = 200
+TAMANO_LOTE = 500
+PALABRAS_VACIAS = {
+    'el', 'la', 'los', 'las', 'lo', 'un', 'una', 'de', 'del', 'y', 'e', 'en', 'a', 'al',
+    'the', 'of', 'and', 'an', 'to', 'in'
+}
+
+
+def normalizar_isbn(isbn):
+    """ISBN-13 sin guiones (los ISBN-10 se convierten) o None si no es válido"""
+    digitos = re.sub(r'[^0-9Xx]', '', isbn or '').upper()
+    if len(digitos) == 10 and digitos[:9].isdigit():
+        base = '978' + digitos[:9]
+        suma = sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(base))
+        return base + str((10 - suma % 10) % 10)
+    if len(digitos) == 13 and digitos.isdigit():
+        return digitos
+    return None
+
+
+def _trigramas(texto):
+    relleno = f'  {texto} '
+    return frozenset(relleno[i:i + 3] for i in range(len(relleno) - 2))
+
+
+def _jaccard(a, b):
+    union = len(a | b)
+    return len(a & b) / union if union else 0.0
+
+
+class _Registro:
+    __slots__ = ('id', 'isbn', 'titulo', 'autor', 'palabras_titulo', 'palabras_autor')
+
+    def __init__(self, libro_id, titulo, autor, isbn):
+        self.id = libro_id
+        self.isbn = normalizar_isbn(isbn)
+        self.palabras_titulo = [p for p in palabras(titulo) if p not in PALABRAS_VACIAS] or palabras(titulo)
+        self.palabras_autor = palabras(autor)
+        self.titulo = _trigramas(' '.join(self.palabras_titulo))
+        self.autor = _trigramas(' '.join(sorted(self.palabras_autor)))
+
+    def claves(self):
+        if self.isbn:
+            yield ('isbn', self.isbn)
+        if self.palabras_titulo:
+            yield ('titulo', ' '.join(sorted(self.palabras_titulo)))
+            for palabra in self.palabras_autor:
+                if len(palabra) > 2:
+                    yield ('titulo_autor', self.palabras_titulo[0], palabra)
+
+
+def puntuar(a, b):
+    """Similitud entre dos registros (0 a 1)"""
+    if a.isbn and b.isbn:
+        # Mismo ISBN: mismo libro; ISBN distintos: ediciones distintas
+        return 1.0 if a.isbn == b.isbn else 0.0
+    return 0.7 * _jaccard(a.titulo, b.titulo) + 0.3 * _jaccard(a.autor, b.autor)
+
+
+def _raiz(padres, nodo):
+    while padres.setdefault(nodo, nodo) != nodo:
+        padres[nodo] = padres[padres[nodo]]
+        nodo = padres[nodo]
+    return nodo
+
+
+def detectar(umbral=UMBRAL, queryset=None):
+    """
+    Propuestas de fusión [{canonico, duplicado, puntuacion}] y estadísticas.
+
+    Recorre el catálogo una vez; la memoria crece con el número de libros
+    (registros compactos con los trigramas de título y autor).
+    """
+    queryset = Libro.objects.all() if queryset is None else queryset
+    bloques = defaultdict(list)
+    registros = {}
+    for libro_id, titulo, autor, isbn in queryset.order_by().values_list(
+        'id', 'titulo', 'autor', 'isbn'
+    ).iterator(chunk_size=5000):
+        registro = registros[libro_id] = _Registro(libro_id, titulo, autor, isbn)
+        for clave in registro.claves():
+            bloques[clave].append(libro_id)
+
+    padres = {}
+    puntuaciones = {}
+    comparados = 0
+    omitidos = 0
+    for ids in bloques.values():
+        if len(ids) < 2:
+            continue
+        if len(ids) > TAMANO_MAXIMO_BLOQUE:
+            omitidos += 1
+            continue
+        for i, id_a in enumerate(ids):
+            for id_b in ids[i + 1:]:
+                par = (min(id_a, id_b), max(id_a, id_b))
+                if par in puntuaciones:
+                    continue
+                puntuacion = puntuaciones[par] = puntuar(registros[id_a], registros[id_b])
+                comparados += 1
+                if puntuacion >= umbral:
+                    padres[_raiz(padres, par[0])] = _raiz(padres, par[1])
+
+    grupos = defaultdict(list)
+    for libro_id in padres:
+        grupos[_raiz(padres, libro_id)].append(libro_id)
+    grupos = [ids for ids in grupos.values() if len(ids) > 1]
+
+    en_grupos = [libro_id for ids in grupos for libro_id in ids]
+    prestamos = defaultdict(int)
+    for modelo in (Prestamo, PrestamoHistorico):
+        for libro_id, total in modelo.objects.filter(libro_id__in=en_grupos).order_by().values(
+            'libro_id'
+        ).annotate(total=Count('id')).values_list('libro_id', 'total'):
+            prestamos[libro_id] += total
+
+    propuestas = []
+    for ids in grupos:
+        canonico = min(ids, key=lambda libro_id: (registros[libro_id].isbn is None, -prestamos[libro_id], libro_id))
+        for libro_id in sorted(ids):
+            if libro_id != canonico:
+                par = (min(libro_id, canonico), max(libro_id, canonico))
+                propuestas.append({
+                    'canonico': canonico,
+                    'duplicado': libro_id,
+                    # Unidos de forma transitiva: puede no haberse comparado directamente con el canónico
+                    'puntuacion': round(puntuaciones.get(par, umbral), 3),
+                })
+
+    estadisticas = {
+        'libros': len(registros),
+        'bloques': len(bloques),
+        'bloques_omitidos': omitidos,
+        'comparaciones': comparados,
+        'grupos': len(grupos),
+    }
+    return propuestas, estadisticas
+
+
+def _resolver(mapeo):
+    """Sigue las cadenas duplicado -> canónico hasta un libro que no se fusiona"""
+    resuelto = {}
+    for duplicado in mapeo:
+        canonico = mapeo[duplicado]
+        vistos = {duplicado}
+        while canonico in mapeo and canonico not in vistos:
+            vistos.add(canonico)
+            canonico = mapeo[canonico]
+        if canonico != duplicado:
+            resuelto[duplicado] = canonico
+    return resuelto
+
+
+def fusionar(mapeo):
+    """Fusiona cada libro duplicado en su canónico ({duplicado: canonico}); devuelve totales movidos"""
+    mapeo = _resolver(mapeo)
+    totales = defaultdict(int)
+    pares = list(mapeo.items())
+    for inicio in range(0, len(pares), TAMANO_LOTE):
+        for tabla, total in _fusionar_lote(dict(pares[inicio:inicio + TAMANO_LOTE])).items():
+            totales[tabla] += total
+    return dict(totales)
+
+
+def _fusionar_lote(mapeo):
+    ahora = timezone.now()
+    duplicados = list(mapeo)
+    canonicos = set(mapeo.values())
+    nuevo_libro = Case(
+        *[When(libro_id=duplicado, then=Value(canonico)) for duplicado, canonico in mapeo.items()],
+        output_field=BigIntegerField()
+    )
+    totales = {}
+
+    with transaction.atomic():
+        usuario_ids = set(Prestamo.objects.filter(libro_id__in=duplicados).values_list('usuario_id', flat=True))
+        usuario_ids |= set(Reserva.objects.filter(libro_id__in=duplicados).values_list('usuario_id', flat=True))
+
+        totales['ejemplares'] = Ejemplar.objects.filter(libro_id__in=duplicados).update(
+            libro_id=nuevo_libro, fecha_actualizacion=ahora
+        )
+        totales['prestamos'] = Prestamo.objects.filter(libro_id__in=duplicados).update(
+            libro_id=nuevo_libro, fecha_actualizacion=ahora
+        )
+        totales['prestamos_historicos'] = PrestamoHistorico.objects.filter(
+            libro_id__in=duplicados
+        ).update(libro_id=nuevo_libro)
+        # Reservas: (libro, usuario, estado) es único; de las que coincidirían se conserva la más antigua
+        vistas = set()
+        sobrantes = []
+        for reserva_id, libro_id, usuario_id, estado in Reserva.objects.filter(
+            libro_id__in=[*duplicados, *canonicos]
+        ).order_by('fecha_reserva', 'id').values_list('id', 'libro_id', 'usuario_id', 'estado'):
+            clave = (mapeo.get(libro_id, libro_id), usuario_id, estado)
+            if clave in vistas:
+                sobrantes.append(reserva_id)
+            vistas.add(clave)
+        totales['reservas_descartadas'], _ = Reserva.objects.filter(id__in=sobrantes).delete()
+        totales['reservas'] = Reserva.objects.filter(libro_id__in=duplicados).update(libro_id=nuevo_libro)
+
+        # Bibliografías: la tabla intermedia no admite el mismo libro dos veces
+        Through = Bibliografia.libros.through
+        filas = list(Through.objects.filter(libro_id__in=duplicados).values_list('bibliografia_id', 'libro_id'))
+        existentes = set(Through.objects.filter(libro_id__in=canonicos).values_list('bibliografia_id', 'libro_id'))
+        nuevas = {(bibliografia_id, mapeo[libro_id]) for bibliografia_id, libro_id in filas} - existentes
+        Through.objects.bulk_create([
+            Through(bibliografia_id=bibliografia_id, libro_id=libro_id) for bibliografia_id, libro_id in nuevas
+        ])
+        bibliografia_ids = {bibliografia_id for bibliografia_id, _ in filas}
+        totales['bibliografias'] = len(bibliografia_ids)
+
+        # Con ejemplares (propios o de los duplicados) las cantidades se derivan de ellos;
+        # sin ellos se suman las de los duplicados
+        con_ejemplares = set(
+            Ejemplar.objects.filter(libro_id__in=canonicos).order_by().values_list('libro_id', flat=True).distinct()
+        )
+        ejemplares.recontar(con_ejemplares)
+        sumas = defaultdict(lambda: [0, 0])
+        for libro_id, total, disponible in Libro.objects.filter(id__in=duplicados).exclude(
+            id__in=[duplicado for duplicado, canonico in mapeo.items() if canonico in con_ejemplares]
+        ).values_list('id', 'cantidad_total', 'cantidad_disponible'):
+            sumas[mapeo[libro_id]][0] += total
+            sumas[mapeo[libro_id]][1] += disponible
+        if sumas:
+            Libro.objects.filter(id__in=sumas).update(
+                cantidad_total=F('cantidad_total') + Case(
+                    *[When(id=canonico, then=Value(suma[0])) for canonico, suma in sumas.items()]
+                ),
+                cantidad_disponible=F('cantidad_disponible') + Case(
+                    *[When(id=canonico, then=Value(suma[1])) for canonico, suma in sumas.items()]
+                ),
+                fecha_actualizacion=ahora
+            )
+            Libro.objects.filter(id__in=sumas, estado='Prestado', cantidad_disponible__gt=0).update(estado='Disponible')
+
+        totales['libros_eliminados'] = len(duplicados)
+        Libro.objects.filter(id__in=duplicados).delete()
+
+        Bibliografia.objects.filter(id__in=bibliografia_ids).update(fecha_actualizacion=ahora)
+        programas = set(Bibliografia.objects.filter(id__in=bibliografia_ids).values_list('programa', flat=True))
+        lecturas.refrescar_programas(programas)
+        circulacion.sincronizar_libros(canonicos, usuario_ids)
+        todos = set(duplicados) | canonicos
+        transaction.on_commit(lambda: invalidar_libros(todos))
+        transaction.on_commit(lambda: invalidar_paneles(usuario_ids, programas))
+
+    return totales
@@ -0,0 +1,177 @@
+# libros/ejemplares.py
+"""
+Ejemplares (copias físicas) de los libros.
+
+Cada copia tiene su código de barras (índice único: el mostrador la
+encuentra con una búsqueda por clave) y su estado. Prestar bloquea solo el
+ejemplar elegido, saltando los que otras transacciones están prestando en
+ese momento, así que los préstamos simultáneos de un mismo libro no se
+esperan entre sí. Los contadores del libro (`cantidad_total` y
+`cantidad_disponible`) se derivan de los ejemplares con un recuento que se
+hace al confirmar el préstamo o la devolución, en una transacción corta; el
+comando recontar_ejemplares los vuelve a derivar todos por si un proceso
+terminó antes de hacerlo.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import estado_cuenta
+from .models import Ejemplar, Libro, Prestamo
+
+TAMANO_LOTE = 5000
+
+
+def tomar_ejemplar(libro_id):
+    """Ejemplar disponible del libro, bloqueado para prestarlo (None si no queda ninguno libre)"""
+    return Ejemplar.objects.select_for_update(skip_locked=True).filter(
+        libro_id=libro_id, estado='Disponible'
+    ).order_by('id').first()
+
+
+def bloquear_por_codigo(codigo_barras):
+    """Ejemplar con ese código de barras, bloqueado (None si no existe)"""
+    return Ejemplar.objects.select_for_update().filter(codigo_barras=codigo_barras).first()
+
+
+def prefijo_codigo(libro_id):
+    return f'EB{libro_id:08d}'
+
+
+def generar_codigos(libro_id, cantidad):
+    """Códigos de barras consecutivos para nuevos ejemplares del libro"""
+    prefijo = prefijo_codigo(libro_id)
+    ultimo = Ejemplar.objects.filter(codigo_barras__startswith=prefijo).aggregate(
+        ultimo=Max('codigo_barras')
+    )['ultimo']
+    siguiente = int(ultimo[len(prefijo):]) + 1 if ultimo and ultimo[len(prefijo):].isdigit() else 1
+    return [f'{prefijo}{numero:04d}' for numero in range(siguiente, siguiente + cantidad)]
+
+
+def crear_ejemplares(libro, cantidad, ubicacion=None):
+    """Registra `cantidad` ejemplares disponibles del libro y recalcula sus contadores"""
+    nuevos = Ejemplar.objects.bulk_create([
+        Ejemplar(libro=libro, codigo_barras=codigo, ubicacion=ubicacion or libro.ubicacion)
+        for codigo in generar_codigos(libro.pk, cantidad)
+    ], batch_size=TAMANO_LOTE)
+    recontar([libro.pk])
+    return nuevos
+
+
+def tiene_ejemplares(libro_id):
+    return Ejemplar.objects.filter(libro_id=libro_id).exists()
+
+
+def recontar(libro_ids):
+    """
+    Deriva `cantidad_total` y `cantidad_disponible` de los ejemplares (solo
+    libros que los tienen). Es idempotente: repetirlo o hacerlo a la vez que
+    un préstamo no descuadra el contador.
+    """
+    from . import circulacion
+
+    libro_ids = set(
+        Ejemplar.objects.filter(libro_id__in=libro_ids).order_by().values_list('libro_id', flat=True).distinct()
+    )
+    if not libro_ids:
+        return
+
+    with transaction.atomic():
+        # Con las filas bloqueadas, los recuentos simultáneos se ordenan y cada uno cuenta con datos posteriores
+        # al anterior: el último en escribir no deja un recuento más antiguo
+        list(Libro.objects.select_for_update().filter(id__in=libro_ids).order_by('id').values_list('id', flat=True))
+        ahora = timezone.now()
+        libros = Libro.objects.filter(id__in=libro_ids)
+        libros.update(
+            cantidad_total=circulacion.contador_por_libro(Ejemplar.objects.exclude(estado='Baja')),
+            cantidad_disponible=circulacion.contador_por_libro(Ejemplar.objects.filter(estado='Disponible')),
+            fecha_actualizacion=ahora
+        )
+        # Misma regla que Libro.save
+        libros.filter(estado='Disponible', cantidad_disponible=0).update(estado='Prestado')
+        libros.filter(estado='Prestado', cantidad_disponible__gt=0).update(estado='Disponible')
+        circulacion.sincronizar_libros(libro_ids)
+
+
+def recontar_al_confirmar(libro_ids):
+    """
+    Recuenta los libros cuando la transacción actual se confirma, sin retener
+    sus filas durante ella. Un error en el recuento se registra sin afectar a
+    la operación ya confirmada; recontar_todos lo corrige después.
+    """
+    libro_ids = set(libro_ids)
+    if libro_ids:
+        transaction.on_commit(lambda: recontar(libro_ids), robust=True)
+
+
+def recontar_todos(lote=1000):
+    """Vuelve a derivar los contadores de todos los libros con ejemplares, por lotes; devuelve cuántos"""
+    total = 0
+    ultimo = 0
+    while True:
+        libro_ids = list(
+            Ejemplar.objects.filter(libro_id__gt=ultimo).order_by('libro_id').values_list(
+                'libro_id', flat=True
+            ).distinct()[:lote]
+        )
+        if not libro_ids:
+            return total
+        recontar(libro_ids)
+        total += len(libro_ids)
+        ultimo = libro_ids[-1]
+
+
+def generar_faltantes(lote=1000):
+    """
+    Crea los ejemplares de los libros que aún no tienen (registrados antes de
+    existir los ejemplares): uno por copia, prestados los que tienen un
+    préstamo abierto, que queda enlazado. Las cantidades del libro se
+    recalculan a partir de ellos. Devuelve (libros, ejemplares) creados.
+    """
+    total_libros = total_ejemplares = 0
+    ultimo = 0
+    while True:
+        with transaction.atomic():
+            libros = list(
+                Libro.objects.filter(id__gt=ultimo, ejemplares__isnull=True).order_by('id').values_list(
+                    'id', 'cantidad_total', 'ubicacion'
+                )[:lote]
+            )
+            if not libros:
+                break
+            ultimo = libros[-1][0]
+
+            abiertos = defaultdict(list)
+            for prestamo_id, libro_id in Prestamo.objects.filter(
+                libro_id__in=[libro[0] for libro in libros],
+                estado__in=estado_cuenta.ESTADOS_PRESTAMO_ABIERTOS,
+                ejemplar__isnull=True
+            ).order_by('fecha_prestamo', 'id').values_list('id', 'libro_id'):
+                abiertos[libro_id].append(prestamo_id)
+
+            nuevos = []
+            prestamos = []
+            for libro_id, cantidad_total, ubicacion in libros:
+                prefijo = prefijo_codigo(libro_id)
+                for numero in range(1, max(cantidad_total, len(abiertos[libro_id])) + 1):
+                    prestado = numero <= len(abiertos[libro_id])
+                    nuevos.append(Ejemplar(
+                        libro_id=libro_id,
+                        codigo_barras=f'{prefijo}{numero:04d}',
+                        ubicacion=ubicacion,
+                        estado='Prestado' if prestado else 'Disponible'
+                    ))
+                    if prestado:
+                        prestamos.append((abiertos[libro_id][numero - 1], nuevos[-1]))
+            Ejemplar.objects.bulk_create(nuevos, batch_size=TAMANO_LOTE)
+            Prestamo.objects.bulk_update(
+                [Prestamo(id=prestamo_id, ejemplar_id=ejemplar.pk) for prestamo_id, ejemplar in prestamos],
+                ['ejemplar'], batch_size=TAMANO_LOTE
+            )
+            recontar([libro[0] for libro in libros])
+
+        total_libros += len(libros)
+        total_ejemplares += len(nuevos)
+    return total_libros, total_ejemplares
@@ -0,0 +1,179 @@
+# libros/estado_cuenta.py
+import threading
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+
+from edubooks.replicas import en_principal
+from .models import EstadoCuenta, Prestamo, Sancion
+
+TIMEOUT_CACHE = 60 * 60 * 24
+
+ESTADOS_PRESTAMO_ABIERTOS = ['Activo', 'Vencido']
+
+# Usuarios pendientes de conciliar al confirmar la transacción del hilo (conciliar_al_confirmar)
+_pendientes = threading.local()
+
+
+def _clave(usuario_id):
+    return f'estado_cuenta:{usuario_id}'
+
+
+def _a_dict(estado):
+    return {
+        'bloqueado_hasta': estado.bloqueado_hasta,
+        'multas_pendientes': estado.multas_pendientes,
+        'prestamos_activos': estado.prestamos_activos,
+    }
+
+
+def _agregados_sanciones(filtro=Q()):
+    return Sancion.objects.filter(filtro, estado='Activa').values('usuario_id').annotate(
+        multas=Sum('monto', filter=Q(tipo='Multa')),
+        bloqueado_hasta=Max('fecha_fin', filter=Q(tipo='Suspensión')),
+    )
+
+
+def _agregados_prestamos(filtro=Q()):
+    return Prestamo.objects.filter(filtro, estado__in=ESTADOS_PRESTAMO_ABIERTOS).values('usuario_id').annotate(
+        total=Count('id')
+    )
+
+
+def recalcular(usuario_id):
+    """Recalcula y guarda el estado de cuenta de un usuario que aún no lo tiene"""
+    sanciones = next(iter(_agregados_sanciones(Q(usuario_id=usuario_id))), {})
+    prestamos = next(iter(_agregados_prestamos(Q(usuario_id=usuario_id))), {})
+
+    estado, _ = EstadoCuenta.objects.update_or_create(
+        usuario_id=usuario_id,
+        defaults={
+            'bloqueado_hasta': sanciones.get('bloqueado_hasta'),
+            'multas_pendientes': sanciones.get('multas') or Decimal('0'),
+            'prestamos_activos': prestamos.get('total', 0),
+        }
+    )
+    datos = _a_dict(estado)
+    # La caché solo refleja el nuevo estado cuando la transacción del evento se confirma
+    transaction.on_commit(lambda: cache.set(_clave(usuario_id), datos, TIMEOUT_CACHE))
+    return estado
+
+
+def obtener(usuario_id):
+    """Estado de cuenta del usuario desde la caché; recurre a la tabla y, si no existe, lo calcula"""
+    datos = cache.get(_clave(usuario_id))
+    if datos is None:
+        # Se guarda en la caché compartida: se lee de la principal
+        with en_principal():
+            estado = EstadoCuenta.objects.filter(usuario_id=usuario_id).first()
+            if estado is None:
+                estado = recalcular(usuario_id)
+        datos = _a_dict(estado)
+        cache.set(_clave(usuario_id), datos, TIMEOUT_CACHE)
+    return datos
+
+
+def motivo_bloqueo(usuario):
+    """Devuelve el motivo por el que el usuario no puede tomar ni renovar préstamos, o None si puede"""
+    datos = obtener(usuario.pk)
+
+    if _suspendido(datos):
+        fecha = timezone.localtime(datos['bloqueado_hasta']).strftime('%Y-%m-%d')
+        return f"Tienes una suspensión activa hasta el {fecha}."
+    if datos['multas_pendientes'] > 0:
+        return f"Tienes multas pendientes por ${datos['multas_pendientes']:,.0f}."
+    return None
+
+
+def _suspendido(datos):
+    return bool(datos['bloqueado_hasta'] and datos['bloqueado_hasta'] > timezone.now())
+
+
+def bloqueados(usuario_ids):
+    """IDs de los usuarios que no pueden renovar (suspensión o multas) con una lectura de la caché y una de la tabla"""
+    claves = {_clave(usuario_id): usuario_id for usuario_id in set(usuario_ids)}
+    datos = {claves[clave]: valor for clave, valor in cache.get_many(list(claves)).items()}
+    faltantes = set(claves.values()) - set(datos)
+    if faltantes:
+        for estado in EstadoCuenta.objects.filter(usuario_id__in=faltantes):
+            datos[estado.usuario_id] = _a_dict(estado)
+        for usuario_id in faltantes - set(datos):
+            datos[usuario_id] = _a_dict(recalcular(usuario_id))
+    return {
+        usuario_id for usuario_id, valor in datos.items()
+        if _suspendido(valor) or valor['multas_pendientes'] > 0
+    }
+
+
+def conciliar(usuario_ids=None):
+    """
+    Recalcula el estado de cuenta con consultas agrupadas y un upsert masivo.
+
+    Sin `usuario_ids` se concilian todos los usuarios con sanciones, préstamos
+    abiertos o un estado de cuenta previo.
+    """
+    from usuarios.models import Usuario
+
+    filtro = Q() if usuario_ids is None else Q(usuario_id__in=usuario_ids)
+    sanciones = {fila['usuario_id']: fila for fila in _agregados_sanciones(filtro)}
+    prestamos = {fila['usuario_id']: fila['total'] for fila in _agregados_prestamos(filtro)}
+    if usuario_ids is None:
+        usuarios = set(sanciones) | set(prestamos) | set(EstadoCuenta.objects.values_list('usuario_id', flat=True))
+    else:
+        usuarios = set(usuario_ids)
+    # Solo se conservan usuarios existentes
+    usuarios = set(Usuario.objects.filter(id__in=usuarios).values_list('id', flat=True))
+
+    ahora = timezone.now()
+    estados = [
+        EstadoCuenta(
+            usuario_id=usuario_id,
+            bloqueado_hasta=sanciones.get(usuario_id, {}).get('bloqueado_hasta'),
+            multas_pendientes=sanciones.get(usuario_id, {}).get('multas') or Decimal('0'),
+            prestamos_activos=prestamos.get(usuario_id, 0),
+            fecha_actualizacion=ahora,
+        )
+        for usuario_id in usuarios
+    ]
+    EstadoCuenta.objects.bulk_create(
+        estados,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['usuario'],
+        update_fields=['bloqueado_hasta', 'multas_pendientes', 'prestamos_activos', 'fecha_actualizacion'],
+    )
+    datos = {_clave(estado.usuario_id): _a_dict(estado) for estado in estados}
+    transaction.on_commit(lambda: cache.set_many(datos, TIMEOUT_CACHE))
+    return len(estados)
+
+
+def conciliar_al_confirmar(usuario_ids):
+    """
+    Concilia a los usuarios cuando se confirma la transacción actual, en una
+    sola pasada con los de todas las llamadas hechas durante ella. Un error se
+    registra sin afectar a la operación ya confirmada; el comando
+    conciliar_estados_cuenta lo corrige después.
+    """
+    pendientes = getattr(_pendientes, 'usuarios', None)
+    if pendientes is None:
+        pendientes = _pendientes.usuarios = set()
+    pendientes.update(usuario_ids)
+    # Solo la primera retrollamada que se ejecute encuentra usuarios pendientes
+    transaction.on_commit(_conciliar_pendientes, robust=True)
+
+
+def _conciliar_pendientes():
+    from usuarios.models import Usuario
+
+    usuario_ids = getattr(_pendientes, 'usuarios', None)
+    _pendientes.usuarios = None
+    if not usuario_ids:
+        return
+    with transaction.atomic():
+        # Con los usuarios bloqueados, las conciliaciones simultáneas se ordenan y
+        # la última en escribir lee los datos confirmados más recientes
+        list(Usuario.objects.select_for_update().filter(id__in=usuario_ids).order_by('id').values_list('id', flat=True))
+        conciliar(usuario_ids)
@@ -0,0 +1,250 @@
+# libros/eventos.py
+"""
+Bandeja de salida (outbox) de eventos de circulación.
+
+Cada cambio en libros, préstamos, reservas y sanciones deja una fila en
+EventoCirculacion dentro de la misma transacción que el cambio (las
+peticiones de escritura son atómicas, ver libros.middleware). El feed
+/api/eventos/ entrega los eventos posteriores a un cursor (el id del último
+evento recibido), de modo que los clientes aplican cambios incrementales en
+lugar de volver a pedir listados completos.
+
+Los IDs se asignan al insertar, no al confirmar: una transacción larga puede
+confirmar un evento con un ID menor que otros que ya se leyeron. Por eso los
+lectores no avanzan más allá de horizonte() (ver su docstring).
+
+Una transacción que confirma eventos más de VENTANA_VISIBILIDAD segundos
+después de insertarlos queda por detrás de cursores que ya avanzaron: el feed
+y el canal SSE no vuelven a entregar esos eventos. Los índices en memoria
+(indice_disponibilidad, sugerencias) se corrigen en su reconciliación
+periódica. Las escrituras con eventos deben confirmar muy por debajo de la
+ventana (las peticiones lo hacen; los comandos escriben por lotes cortos).
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import EventoCirculacion, Libro, Prestamo, Reserva, Sancion
+from .serializers import EventoCirculacionSerializer
+
+# Campos que viajan en el evento: lo justo para actualizar una vista sin volver a consultar
+CAMPOS = {
+    Libro: ['estado', 'cantidad_disponible', 'cantidad_total'],
+    Prestamo: ['estado', 'fecha_devolucion_esperada', 'fecha_devolucion_real', 'renovaciones'],
+    Reserva: ['estado', 'fecha_expiracion'],
+    Sancion: ['tipo', 'estado', 'monto', 'fecha_fin', 'prestamo_id'],
+}
+
+LIMITE_MAXIMO = 500
+# Segundos que el feed asíncrono mantiene abierta una petición sin eventos (long-poll)
+ESPERA_MAXIMA = 30
+_config = settings.EVENTOS_CIRCULACION
+# Segundos que se espera a que se confirme una fila con ID anterior a otras ya visibles
+VENTANA_VISIBILIDAD = _config['VENTANA_VISIBILIDAD']
+# Segundos que cada proceso reutiliza el horizonte calculado (el intervalo de sondeo de los lectores)
+INTERVALO_HORIZONTE = _config.get('INTERVALO_HORIZONTE', 1)
+# Filas recientes que se revisan como mucho al calcular el horizonte
+LIMITE_HORIZONTE = 10000
+# Huecos más grandes no se buscan en la caché de descartados: esperan a la ventana
+MAX_HUECO_DESCARTADO = 1000
+
+# IDs de eventos insertados en la transacción() en curso
+_asignados = ContextVar('eventos_asignados', default=None)
+# (tabla, alias) -> (instante, horizonte)
+_horizontes = {}
+
+
+def _valor(valor):
+    # JSONField no admite fechas ni decimales
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    if valor is not None and not isinstance(valor, (int, float, str, bool)):
+        return str(valor)
+    return valor
+
+
+def _evento(modelo, fila, accion):
+    es_libro = modelo is Libro
+    return EventoCirculacion(
+        entidad=modelo.__name__,
+        entidad_id=fila['id'],
+        accion=accion,
+        libro_id=fila['id'] if es_libro else fila.get('libro_id'),
+        usuario_id=None if es_libro else fila.get('usuario_id'),
+        datos={campo: _valor(fila.get(campo)) for campo in CAMPOS[modelo]},
+    )
+
+
+def _fila(instancia):
+    fila = {campo: getattr(instancia, campo) for campo in CAMPOS[type(instancia)]}
+    fila['id'] = instancia.pk
+    fila['libro_id'] = getattr(instancia, 'libro_id', None)
+    fila['usuario_id'] = getattr(instancia, 'usuario_id', None)
+    return fila
+
+
+def _anotar(creados):
+    asignados = _asignados.get()
+    if asignados is not None:
+        asignados.extend(evento.pk for evento in creados if evento.pk is not None)
+
+
+def registrar(instancia, accion):
+    """Registra el evento de una instancia guardada o eliminada"""
+    evento = _evento(type(instancia), _fila(instancia), accion)
+    evento.save()
+    _anotar([evento])
+
+
+def registrar_lote(modelo, ids, accion='actualizado'):
+    """Registra con un solo INSERT los eventos de una actualización masiva (update/bulk_create no emiten señales)"""
+    ids = list(ids)
+    if not ids:
+        return
+    campos = {'id', *CAMPOS[modelo]}
+    if modelo is not Libro:
+        campos |= {'usuario_id'}
+        if modelo is not Sancion:
+            campos |= {'libro_id'}
+    filas = modelo.objects.filter(id__in=ids).values(*campos)
+    _anotar(EventoCirculacion.objects.bulk_create([_evento(modelo, fila, accion) for fila in filas]))
+
+
+def _clave_descartado(modelo, fila_id):
+    return f'eventos:descartado:{modelo._meta.db_table}:{fila_id}'
+
+
+def descartar(modelo, ids):
+    """Anota IDs que no llegarán a confirmarse para que horizonte() los salte sin esperar la ventana"""
+    cache.set_many({_clave_descartado(modelo, fila_id): True for fila_id in ids}, VENTANA_VISIBILIDAD * 2)
+
+
+def _descartados(modelo, desde, hasta):
+    # ¿Están anotados como descartados todos los IDs del hueco [desde, hasta)?
+    if hasta - desde > MAX_HUECO_DESCARTADO:
+        return False
+    claves = [_clave_descartado(modelo, fila_id) for fila_id in range(desde, hasta)]
+    return len(cache.get_many(claves)) == len(claves)
+
+
+@contextmanager
+def transaccion():
+    """
+    transaction.atomic() que, si se deshace, anota como descartados los IDs de
+    los eventos que insertó: el hueco que dejan no detiene a los lectores
+    durante VENTANA_VISIBILIDAD.
+    """
+    exterior = _asignados.get()
+    asignados = []
+    token = _asignados.set(asignados)
+    confirmada = False
+    try:
+        with transaction.atomic():
+            yield
+            confirmada = not transaction.get_rollback()
+    finally:
+        _asignados.reset(token)
+        if not confirmada and asignados:
+            descartar(EventoCirculacion, asignados)
+        elif exterior is not None:
+            # Dentro de otra transacción: se descartan si se deshace la exterior
+            exterior.extend(asignados)
+
+
+def visibles(usuario):
+    """Eventos que puede leer el usuario: los de libros y los suyos (todos para administradores)"""
+    queryset = EventoCirculacion.objects.all()
+    if usuario.rol != 'Administrador':
+        queryset = queryset.filter(Q(entidad='Libro') | Q(usuario_id=usuario.pk))
+    return queryset
+
+
+def horizonte(modelo=EventoCirculacion):
+    """
+    Mayor ID hasta el que puede avanzar un cursor sin saltarse filas de `modelo`
+    (una tabla con id secuencial y `fecha` de inserción).
+
+    Un hueco en los IDs de los últimos VENTANA_VISIBILIDAD segundos puede ser
+    una transacción que aún no confirmó: el horizonte se detiene antes de él,
+    salvo que sus IDs estén anotados como descartados (transaccion()). Un hueco
+    más antiguo se da por una transacción deshecha (o un conflicto ignorado por
+    bulk_create) y se salta; si en realidad era una transacción que confirma
+    más tarde, sus filas quedan por detrás de los cursores (ver el docstring
+    del módulo).
+
+    Cada proceso reutiliza el resultado durante INTERVALO_HORIZONTE segundos
+    por tabla y base de datos: quedarse atrás es seguro, solo retrasa la entrega.
+    """
+    queryset = modelo.objects.all()
+    clave = (modelo._meta.db_table, queryset.db)
+    ahora = time.monotonic()
+    guardado = _horizontes.get(clave)
+    if guardado is not None and ahora - guardado[0] < INTERVALO_HORIZONTE:
+        return guardado[1]
+
+    limite_fecha = timezone.now() - timedelta(seconds=VENTANA_VISIBILIDAD)
+    # Por el índice de `fecha`: la fila más reciente fuera de la ventana (a lo sumo el mayor ID fuera de ella)
+    cursor = queryset.filter(
+        fecha__lte=limite_fecha
+    ).order_by('-fecha', '-id').values_list('id', flat=True).first() or 0
+    recientes = queryset.filter(id__gt=cursor).order_by('id').values_list('id', flat=True)
+    for fila_id in recientes[:LIMITE_HORIZONTE]:
+        if fila_id != cursor + 1 and not _descartados(modelo, cursor + 1, fila_id):
+            break
+        cursor = fila_id
+    _horizontes[clave] = (ahora, cursor)
+    return cursor
+
+
+def ultimo_cursor():
+    return horizonte()
+
+
+def _id(fila):
+    # Instancias, values() o values_list() con el id como primera columna
+    if isinstance(fila, dict):
+        return fila['id']
+    if isinstance(fila, tuple):
+        return fila[0]
+    return fila.pk
+
+
+def leer(queryset, desde, limite=LIMITE_MAXIMO):
+    """
+    Filas de `queryset` posteriores a `desde` y anteriores al horizonte.
+    Devuelve (lista, cursor, hay_mas); sin más filas el cursor avanza hasta el
+    horizonte aunque las intermedias no sean visibles para el queryset.
+    """
+    tope = horizonte(queryset.model)
+    lista = list(queryset.filter(id__gt=desde, id__lte=tope).order_by('id')[:limite])
+    if len(lista) < limite:
+        return lista, max(desde, tope), False
+    return lista, _id(lista[-1]), True
+
+
+def parametros_feed(params):
+    """Lee `desde`, `limite` y `espera` de la query string del feed"""
+    try:
+        desde = params.get('desde')
+        desde = int(desde) if desde not in (None, '') else None
+        limite = min(max(int(params.get('limite', 100)), 1), LIMITE_MAXIMO)
+        espera = min(max(int(params.get('espera', 25)), 0), ESPERA_MAXIMA)
+    except ValueError:
+        raise ValidationError({'error': 'desde, limite y espera deben ser números enteros'})
+    return desde, limite, espera
+
+
+def respuesta_feed(lista, cursor, hay_mas):
+    return {
+        'eventos': EventoCirculacionSerializer(lista, many=True).data,
+        'cursor': cursor,
+        'hay_mas': hay_mas,
+    }
@@ -0,0 +1,363 @@
+# libros/indice_disponibilidad.py
+"""
+Índice compacto de disponibilidad del catálogo en memoria.
+
+Cada proceso guarda `cantidad_disponible` y `estado` de todos los libros en
+dos arrays indexados por ID (5 bytes por libro), más el conjunto de libros
+agotados. Se carga al arrancar (de la instantánea compartida en la caché de
+Django si existe, o recorriendo la tabla de libros) y se mantiene al día
+leyendo los eventos de libros de la bandeja de salida (libros.eventos), así
+que ve los cambios hechos por cualquier worker. Un hilo de mantenimiento
+de cada proceso vuelve a recorrer la tabla cada INTERVALO_RECONCILIACION
+segundos, por si un evento se confirmó después de que el cursor lo diera
+por perdido, y publica la instantánea; ninguna de las dos tareas se hace
+dentro de una petición.
+
+Los listados del catálogo toman la disponibilidad de aquí en lugar de la
+respuesta cacheada: se guardan como plantilla con huecos para
+`cantidad_disponible` y `estado`, que se rellenan en cada respuesta sin
+decodificar el JSON. Prestar o devolver un libro ya no invalida los
+listados, y el filtro `disponible=true` se resuelve con los libros agotados
+que conoce el índice.
+"""
+import re
+import threading
+import time
+import zlib
+from array import array
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, close_old_connections
+from django.db.models import Max
+
+from edubooks.renderers import renderizar_json
+from . import eventos
+from .models import EventoCirculacion, Libro
+
+ESTADOS = [codigo for codigo, _ in Libro.ESTADOS_CHOICES]
+# Campos que mantiene el índice: un guardado que solo toca estos no cambia el resto del listado
+CAMPOS_DISPONIBILIDAD = {'cantidad_disponible', 'estado', 'fecha_actualizacion'}
+SIN_LIBRO = -2 ** 31
+TAMANO_LOTE = 5000
+CLAVE_INSTANTANEA = 'indice_disponibilidad'
+# Huecos de la plantilla de un listado: "\u0000<campo>:<libro_id>:<valor al cachear>\u0000"
+MARCAS_PLANTILLA = re.compile(rb'"\\u0000(cantidad_disponible|estado):(\d+):([^"\\]*)\\u0000"')
+
+_config = getattr(settings, 'INDICE_DISPONIBILIDAD', {})
+
+
+class IndiceDisponibilidad:
+    """Disponibilidad por ID de libro en arrays, al día con la bandeja de salida"""
+
+    def __init__(self, intervalo=1, alias='default', intervalo_publicacion=600, limite_filtro=1000,
+                 intervalo_reconciliacion=600):
+        self.intervalo = intervalo
+        self.alias = alias
+        self.intervalo_publicacion = intervalo_publicacion
+        self.limite_filtro = limite_filtro
+        self.intervalo_reconciliacion = intervalo_reconciliacion
+        self._cantidades = array('i')
+        self._estados = array('b')
+        self._agotados = set()
+        self._cursor = None
+        self._version = 0
+        self._ultima_lectura = 0.0
+        self._ultima_publicacion = 0.0
+        self._ultima_reconciliacion = 0.0
+        self._lock = threading.Lock()
+        self._hilo = None
+
+    @property
+    def cargado(self):
+        return self._cursor is not None
+
+    @property
+    def total_agotados(self):
+        return len(self._agotados)
+
+    @property
+    def version(self):
+        """Último evento que cambió el conjunto de libros disponibles (para claves de caché)"""
+        return self._version
+
+    # ---- Construcción ----
+
+    def _compilar(self, filas, maximo_id):
+        cantidades = array('i', [SIN_LIBRO]) * (maximo_id + 1)
+        estados = array('b', [0]) * (maximo_id + 1)
+        agotados = set()
+        for libro_id, cantidad, estado in filas:
+            cantidades[libro_id] = cantidad
+            estados[libro_id] = ESTADOS.index(estado) if estado in ESTADOS else 0
+            if cantidad <= 0:
+                agotados.add(libro_id)
+        return cantidades, estados, agotados
+
+    def construir(self, filas, maximo_id, cursor=0):
+        """Reemplaza el contenido con `filas` (id, cantidad_disponible, estado)"""
+        self._cantidades, self._estados, self._agotados = self._compilar(filas, maximo_id)
+        self._cursor = self._version = cursor
+
+    def _recorrer_tabla(self):
+        """(cursor, cantidades, estados, agotados) leídos de la tabla de libros"""
+        # El cursor se lee antes del recorrido: los cambios concurrentes se vuelven a aplicar después
+        cursor = eventos.ultimo_cursor()
+        maximo_id = Libro.objects.aggregate(maximo=Max('id'))['maximo'] or 0
+        filas = Libro.objects.order_by().values_list(
+            'id', 'cantidad_disponible', 'estado'
+        ).iterator(chunk_size=TAMANO_LOTE)
+        return (cursor, *self._compilar(filas, maximo_id))
+
+    def _cargar_de_base(self):
+        cursor, self._cantidades, self._estados, self._agotados = self._recorrer_tabla()
+        self._cursor = self._version = cursor
+        self._ultima_reconciliacion = time.monotonic()
+
+    def reconciliar(self):
+        """
+        Vuelve a recorrer la tabla y publica la instantánea. El recorrido se
+        hace sin el lock, así que las peticiones siguen usando el índice; solo
+        el intercambio y los eventos posteriores al cursor leído lo toman. La
+        versión solo cambia si cambian los libros agotados.
+        """
+        cursor, cantidades, estados, agotados = self._recorrer_tabla()
+        with self._lock:
+            anteriores, version = self._agotados, self._version
+            self._cantidades, self._estados, self._agotados = cantidades, estados, agotados
+            self._cursor = cursor
+            self._aplicar_eventos()
+            self._version = version if self._agotados == anteriores else max(version, self._cursor)
+            self._ultima_reconciliacion = time.monotonic()
+        self.publicar()
+
+    def _cargar_instantanea(self):
+        instantanea = caches[self.alias].get(CLAVE_INSTANTANEA)
+        if instantanea is None:
+            return False
+        cursor, version, cantidades, estados = instantanea
+        self._cantidades = array('i', zlib.decompress(cantidades))
+        self._estados = array('b', zlib.decompress(estados))
+        self._agotados = {
+            libro_id for libro_id, cantidad in enumerate(self._cantidades)
+            if SIN_LIBRO < cantidad <= 0
+        }
+        self._cursor, self._version = cursor, version
+        self._ultima_publicacion = self._ultima_reconciliacion = time.monotonic()
+        return True
+
+    def publicar(self):
+        """Guarda el índice comprimido en la caché compartida para los demás workers"""
+        with self._lock:
+            if not self.cargado:
+                return
+            cursor, version = self._cursor, self._version
+            cantidades, estados = self._cantidades.tobytes(), self._estados.tobytes()
+        caches[self.alias].set(CLAVE_INSTANTANEA, (
+            cursor, version, zlib.compress(cantidades, 1), zlib.compress(estados, 1)
+        ), timeout=self.intervalo_publicacion * 3)
+        self._ultima_publicacion = time.monotonic()
+
+    # ---- Actualización ----
+
+    def _fijar(self, libro_id, cantidad, estado):
+        """Aplica un cambio; devuelve True si el libro entra o sale del conjunto de disponibles"""
+        if libro_id >= len(self._cantidades):
+            faltan = libro_id + 1 - len(self._cantidades)
+            self._cantidades.extend(array('i', [SIN_LIBRO]) * faltan)
+            self._estados.extend(array('b', [0]) * faltan)
+        disponible_antes = self._cantidades[libro_id] > 0
+        self._cantidades[libro_id] = cantidad
+        if cantidad == SIN_LIBRO:
+            self._agotados.discard(libro_id)
+        else:
+            self._estados[libro_id] = ESTADOS.index(estado) if estado in ESTADOS else 0
+            if cantidad <= 0:
+                self._agotados.add(libro_id)
+            else:
+                self._agotados.discard(libro_id)
+        return disponible_antes != (cantidad > 0)
+
+    def _aplicar_eventos(self):
+        queryset = EventoCirculacion.objects.filter(entidad='Libro').values_list('id', 'entidad_id', 'accion', 'datos')
+        while True:
+            # Solo hasta el horizonte: un evento confirmado tarde con un ID menor no se pierde
+            lote, cursor, hay_mas = eventos.leer(queryset, self._cursor, TAMANO_LOTE)
+            for evento_id, libro_id, accion, datos in lote:
+                if accion == 'eliminado':
+                    cambio = self._fijar(libro_id, SIN_LIBRO, None)
+                else:
+                    cambio = self._fijar(libro_id, datos['cantidad_disponible'], datos['estado'])
+                if cambio:
+                    self._version = evento_id
+            self._cursor = cursor
+            if not hay_mas:
+                return
+
+    def actualizar(self, forzar=False):
+        """Carga el índice si hace falta y aplica los eventos nuevos (como mucho una vez por intervalo)"""
+        if self.cargado and not forzar and time.monotonic() - self._ultima_lectura < self.intervalo:
+            return
+        publicar = False
+        with self._lock:
+            if not self.cargado and not self._cargar_instantanea():
+                self._cargar_de_base()
+                publicar = True
+            self._aplicar_eventos()
+            self._ultima_lectura = time.monotonic()
+        if publicar:
+            self.publicar()
+
+    # ---- Mantenimiento (hilo propio) ----
+
+    def iniciar_mantenimiento(self):
+        """Arranca el hilo que reconcilia y publica el índice fuera de las peticiones"""
+        with self._lock:
+            if self._hilo is not None:
+                return
+            self._hilo = threading.Thread(target=self._mantener, name='indice-disponibilidad', daemon=True)
+        self._hilo.start()
+
+    def _mantener(self):
+        while True:
+            time.sleep(min(self.intervalo_reconciliacion, self.intervalo_publicacion))
+            close_old_connections()
+            try:
+                if not self.cargado:
+                    continue
+                if time.monotonic() - self._ultima_reconciliacion >= self.intervalo_reconciliacion:
+                    self.reconciliar()
+                elif time.monotonic() - self._ultima_publicacion >= self.intervalo_publicacion:
+                    self.publicar()
+            except DatabaseError:
+                # Se reintenta en la siguiente vuelta
+                pass
+
+    # ---- Consultas (solo memoria) ----
+
+    def obtener(self, libro_id):
+        """(cantidad_disponible, estado) del libro o None si el índice no lo conoce"""
+        if 0 <= libro_id < len(self._cantidades):
+            cantidad = self._cantidades[libro_id]
+            if cantidad != SIN_LIBRO:
+                return cantidad, ESTADOS[self._estados[libro_id]]
+        return None
+
+    def agotados(self):
+        """IDs de los libros sin ejemplares disponibles, o None si no conviene filtrar con ellos"""
+        if not self.cargado or len(self._agotados) > self.limite_filtro:
+            return None
+        return list(self._agotados)
+
+    def superponer(self, filas):
+        """Sustituye `cantidad_disponible` y `estado` de las filas serializadas por los del índice"""
+        for fila in filas:
+            actual = self.obtener(fila.get('id', -1))
+            if actual is None:
+                continue
+            if 'cantidad_disponible' in fila:
+                fila['cantidad_disponible'] = actual[0]
+            if 'estado' in fila:
+                fila['estado'] = actual[1]
+
+    def rellenar(self, plantilla):
+        """Cuerpo JSON de un listado a partir de su plantilla, con la disponibilidad actual del índice"""
+        partes = [plantilla[0]]
+        for posicion in range(1, len(plantilla), 4):
+            campo, libro_id, valor = plantilla[posicion:posicion + 3]
+            actual = self.obtener(int(libro_id))
+            if campo == b'cantidad_disponible':
+                partes.append(str(actual[0]).encode() if actual else valor)
+            else:
+                partes.append(b'"%s"' % (actual[1].encode() if actual else valor))
+            partes.append(plantilla[posicion + 3])
+        return b''.join(partes)
+
+    def memoria(self):
+        """Bytes ocupados por los arrays y el conjunto de agotados"""
+        return (
+            self._cantidades.buffer_info()[1] * self._cantidades.itemsize
+            + self._estados.buffer_info()[1] * self._estados.itemsize
+            + self._agotados.__sizeof__()
+        )
+
+
+indice_disponibilidad = IndiceDisponibilidad(
+    intervalo=_config.get('INTERVALO', 1),
+    alias=_config.get('ALIAS', 'default'),
+    intervalo_publicacion=_config.get('INTERVALO_PUBLICACION', 600),
+    limite_filtro=_config.get('LIMITE_FILTRO', 1000),
+    intervalo_reconciliacion=_config.get('INTERVALO_RECONCILIACION', 600),
+)
+
+
+def activo():
+    return _config.get('ACTIVO', True)
+
+
+def precalentar():
+    """Carga el índice al arrancar el servidor (wsgi/asgi)"""
+    if not activo() or not _config.get('PRECALENTAR', True):
+        return
+    try:
+        indice_disponibilidad.actualizar(forzar=True)
+    except DatabaseError:
+        # Sin base de datos disponible todavía: el índice se carga en la primera petición
+        pass
+    indice_disponibilidad.iniciar_mantenimiento()
+
+
+def filtrar_disponibles(queryset):
+    """Libros con ejemplares disponibles, usando los agotados del índice cuando son pocos"""
+    agotados = indice_disponibilidad.agotados() if activo() else None
+    if agotados is None:
+        return queryset.filter(cantidad_disponible__gt=0)
+    return queryset.exclude(id__in=agotados)
+
+
+def plantilla_listado(datos):
+    """
+    Codifica un listado dejando huecos en `cantidad_disponible` y `estado`
+    de cada fila: [texto, campo, libro_id, valor, texto, ...] (ver rellenar)
+    """
+    filas = datos.get('results', []) if isinstance(datos, dict) else datos
+    for fila in filas:
+        libro_id = fila.get('id')
+        if libro_id is None:
+            continue
+        for campo in ('cantidad_disponible', 'estado'):
+            if campo in fila:
+                fila[campo] = f'\x00{campo}:{libro_id}:{fila[campo]}\x00'
+    return MARCAS_PLANTILLA.split(renderizar_json(datos))
+
+
+class DisponibilidadEnMemoriaMixin:
+    """
+    Listado de libros cacheado cuya disponibilidad se toma del índice.
+
+    La caché guarda una plantilla del listado con huecos para
+    `cantidad_disponible` y `estado`, que se rellenan en cada respuesta con
+    los valores del índice; con `disponible=true` la clave de caché incluye
+    la versión del índice, porque cambia qué libros aparecen.
+    """
+
+    def get(self, request, *args, **kwargs):
+        if activo():
+            indice_disponibilidad.actualizar()
+        return super().get(request, *args, **kwargs)
+
+    def preparar_cache(self, datos):
+        if not activo():
+            return super().preparar_cache(datos)
+        return plantilla_listado(datos)
+
+    def contenido_cache(self, guardado):
+        if isinstance(guardado, bytes):
+            return super().contenido_cache(guardado)
+        return indice_disponibilidad.rellenar(guardado)
+
+    def get_clave_cache(self, request):
+        clave = super().get_clave_cache(request)
+        if activo() and request.query_params.get('disponible') == 'true':
+            clave = f'{clave}:disponibles@{indice_disponibilidad.version}'
+        return clave
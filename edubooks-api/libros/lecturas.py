@@ -0,0 +1,79 @@
+# libros/lecturas.py
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from .models import Bibliografia, LecturaPrograma, Libro
+
+CAMPOS_LIBRO = ['titulo', 'autor', 'categoria', 'imagen_portada', 'estado', 'cantidad_disponible']
+
+
+def refrescar_programas(programas):
+    """
+    Actualiza la lista de lectura de cada programa a partir de sus bibliografías públicas y activas.
+
+    Solo se escriben las diferencias: los libros nuevos o con otros cursos se
+    insertan con un upsert sobre (programa, libro), que no falla si otra
+    actualización del mismo programa los inserta a la vez, y se eliminan
+    únicamente los libros que salieron del programa.
+    """
+    Through = Bibliografia.libros.through
+    
+    for programa in {p for p in programas if p}:
+        cursos_por_libro = defaultdict(list)
+        filas = Through.objects.filter(
+            bibliografia__programa=programa,
+            bibliografia__es_publica=True,
+            bibliografia__activa=True
+        ).values_list('libro_id', 'bibliografia__curso').order_by('bibliografia__curso')
+        for libro_id, curso in filas:
+            if curso not in cursos_por_libro[libro_id]:
+                cursos_por_libro[libro_id].append(curso)
+        
+        actuales = dict(LecturaPrograma.objects.filter(programa=programa).values_list('libro_id', 'cursos'))
+        cambiados = [libro_id for libro_id, cursos in cursos_por_libro.items() if actuales.get(libro_id) != cursos]
+        quitados = set(actuales) - set(cursos_por_libro)
+        
+        libros = Libro.objects.filter(id__in=cambiados).only('id', *CAMPOS_LIBRO)
+        with transaction.atomic():
+            LecturaPrograma.objects.bulk_create(
+                [
+                    LecturaPrograma(
+                        programa=programa,
+                        libro_id=libro.id,
+                        cursos=cursos_por_libro[libro.id],
+                        **{campo: getattr(libro, campo) for campo in CAMPOS_LIBRO}
+                    )
+                    for libro in libros
+                ],
+                batch_size=1000,
+                update_conflicts=True,
+                unique_fields=['programa', 'libro'],
+                update_fields=['cursos', *CAMPOS_LIBRO],
+            )
+            if quitados:
+                LecturaPrograma.objects.filter(programa=programa, libro_id__in=quitados).delete()
+
+
+def actualizar_libro(libro):
+    """Propaga los datos del libro (título, disponibilidad, estado...) a todas las listas que lo incluyen"""
+    LecturaPrograma.objects.filter(libro_id=libro.pk).update(
+        **{campo: getattr(libro, campo) for campo in CAMPOS_LIBRO}
+    )
+
+
+def sincronizar_libros(libro_ids):
+    """Como actualizar_libro, pero para actualizaciones masivas que no emiten señales (un solo UPDATE)"""
+    libro = Libro.objects.filter(pk=OuterRef('libro_id'))
+    LecturaPrograma.objects.filter(libro_id__in=libro_ids).update(
+        **{campo: Subquery(libro.values(campo)[:1]) for campo in CAMPOS_LIBRO}
+    )
+
+
+def reconstruir_todo():
+    """Reconstruye las listas de lectura de todos los programas con bibliografías"""
+    programas = set(Bibliografia.objects.values_list('programa', flat=True).distinct())
+    programas |= set(LecturaPrograma.objects.values_list('programa', flat=True).distinct())
+    refrescar_programas(programas)
+    return programas
@@ -0,0 +1,75 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+from django.utils import timezone
+from libros.models import Prestamo, PrestamoHistorico
+
+CAMPOS = [
+    'id', 'libro_id', 'ejemplar_id', 'usuario_id', 'fecha_prestamo', 'fecha_devolucion_esperada',
+    'fecha_devolucion_real', 'estado', 'observaciones', 'renovaciones',
+]
+
+
+class Command(BaseCommand):
+    help = 'Mueve a la tabla de historial los préstamos devueltos hace más de N meses (ejecución nocturna)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--meses',
+            type=int,
+            default=12,
+            help='Antigüedad mínima de la devolución en meses (default: 12)',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=5000,
+            help='Préstamos movidos por transacción (default: 5000)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo cuenta los préstamos que se archivarían',
+        )
+
+    def handle(self, *args, **options):
+        fecha_limite = timezone.now() - timedelta(days=30 * options['meses'])
+        # Los préstamos con sanciones se conservan para no perder la referencia de la sanción
+        candidatos = Prestamo.objects.filter(
+            estado='Devuelto',
+            fecha_devolucion_real__lt=fecha_limite,
+            sanciones__isnull=True
+        )
+
+        if options['dry_run']:
+            self.stdout.write(
+                self.style.WARNING(f'Préstamos a archivar: {candidatos.count()} (simulación)')
+            )
+            return
+
+        total = 0
+        while True:
+            movidos = self.mover_lote(candidatos, options['lote'])
+            total += movidos
+            if movidos < options['lote']:
+                break
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Préstamos archivados: {total}')
+        )
+
+    def mover_lote(self, candidatos, lote):
+        with transaction.atomic():
+            filas = list(
+                candidatos.select_for_update(skip_locked=True, of=('self',)).order_by('id').values(*CAMPOS)[:lote]
+            )
+            if not filas:
+                return 0
+
+            PrestamoHistorico.objects.bulk_create([PrestamoHistorico(**fila) for fila in filas])
+
+            # DELETE directo: los préstamos cerrados no afectan a la caché ni a los estados de cuenta,
+            # y así se evita cargar cada fila para emitir señales
+            Prestamo.objects.filter(id__in=[fila['id'] for fila in filas])._raw_delete(router.db_for_write(Prestamo))
+        return len(filas)
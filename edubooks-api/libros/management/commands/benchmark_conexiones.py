@@ -0,0 +1,58 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara la latencia de una consulta abriendo una conexión nueva por petición '
+        'frente a reutilizar la conexión según la configuración actual (DB_MODO)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iteraciones', type=int, default=200, help='Consultas por escenario (default: 200)')
+        parser.add_argument('--database', default='default', help='Alias de la base de datos (default: default)')
+
+    def handle(self, *args, **options):
+        conexion = connections[options['database']]
+        iteraciones = options['iteraciones']
+
+        def consulta():
+            with conexion.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+
+        # Escenario sin persistencia: abrir, consultar y cerrar en cada petición
+        nuevas = []
+        for _ in range(iteraciones):
+            conexion.close()
+            inicio = time.perf_counter()
+            consulta()
+            nuevas.append((time.perf_counter() - inicio) * 1000)
+        conexion.close()
+
+        # Escenario persistente: la conexión (o el pool) se reutiliza entre peticiones
+        conexion.ensure_connection()
+        reutilizadas = []
+        for _ in range(iteraciones):
+            inicio = time.perf_counter()
+            conexion.close_if_unusable_or_obsolete()
+            consulta()
+            reutilizadas.append((time.perf_counter() - inicio) * 1000)
+
+        self.stdout.write(f"Modo de conexión: {getattr(settings, 'DB_MODO', 'persistente')}")
+        self.stdout.write(f"{'Escenario':<25} {'media ms':>10} {'p50 ms':>10} {'p99 ms':>10}")
+        for nombre, tiempos in (('Conexión nueva', nuevas), ('Conexión reutilizada', reutilizadas)):
+            tiempos.sort()
+            self.stdout.write(
+                f'{nombre:<25} {statistics.mean(tiempos):>10.3f} {statistics.median(tiempos):>10.3f} '
+                f'{tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.99))]:>10.3f}'
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Latencia ahorrada por petición: {statistics.mean(nuevas) - statistics.mean(reutilizadas):.3f} ms'
+            )
+        )
@@ -0,0 +1,98 @@
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide peticiones por segundo y latencias (p50/p99) de rutas de la API contra un servidor en marcha. '
+        'Para comparar WSGI y ASGI con la misma memoria, levante ambos con el mismo número de workers '
+        '(p. ej. gunicorn -w 4 edubooks.wsgi y uvicorn --workers 4 edubooks.asgi:application) '
+        'y ejecute el comando contra cada uno, o compare /api/... con /api/async/... en el servidor ASGI.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('rutas', nargs='+', help='Rutas a medir, p. ej. /api/libros/ /api/async/libros/')
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='URL base del servidor')
+        parser.add_argument('--token', help='Token JWT de acceso')
+        parser.add_argument('--email', help='Email para obtener un token con /api/auth/login/')
+        parser.add_argument('--password', help='Contraseña para obtener un token con /api/auth/login/')
+        parser.add_argument('--peticiones', type=int, default=1000, help='Peticiones por ruta (default: 1000)')
+        parser.add_argument('--concurrencia', type=int, default=32, help='Peticiones simultáneas (default: 32)')
+        parser.add_argument(
+            '--cabecera',
+            action='append',
+            default=[],
+            help='Cabecera adicional "Nombre: valor" (puede repetirse)',
+        )
+
+    def handle(self, *args, **options):
+        self.url = options['url'].rstrip('/')
+        self.cabeceras = {}
+        for cabecera in options['cabecera']:
+            nombre, _, valor = cabecera.partition(':')
+            self.cabeceras[nombre.strip()] = valor.strip()
+
+        token = options['token']
+        if not token and options['email']:
+            token = self.obtener_token(options['email'], options['password'])
+        if token:
+            self.cabeceras['Authorization'] = f'Bearer {token}'
+
+        self.stdout.write(
+            f"{'Ruta':<45} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'bytes':>9} {'errores':>8}"
+        )
+        for ruta in options['rutas']:
+            resultado = self.medir(ruta, options['peticiones'], options['concurrencia'])
+            self.stdout.write(
+                f"{ruta:<45} {resultado['rps']:>9.1f} {resultado['p50']:>9.1f} "
+                f"{resultado['p99']:>9.1f} {resultado['bytes']:>9} {resultado['errores']:>8}"
+            )
+
+    def obtener_token(self, email, password):
+        datos = json.dumps({'email': email, 'password': password}).encode()
+        peticion = urllib.request.Request(
+            f'{self.url}/api/auth/login/',
+            data=datos,
+            headers={'Content-Type': 'application/json'}
+        )
+        try:
+            with urllib.request.urlopen(peticion) as respuesta:
+                return json.loads(respuesta.read())['tokens']['access']
+        except (urllib.error.URLError, KeyError) as e:
+            raise CommandError(f'No se pudo iniciar sesión: {e}')
+
+    def peticion(self, ruta):
+        inicio = time.perf_counter()
+        peticion = urllib.request.Request(f'{self.url}{ruta}', headers=self.cabeceras)
+        try:
+            with urllib.request.urlopen(peticion) as respuesta:
+                tamano = len(respuesta.read())
+                ok = respuesta.status == 200
+        except urllib.error.URLError:
+            tamano, ok = 0, False
+        return time.perf_counter() - inicio, tamano, ok
+
+    def medir(self, ruta, peticiones, concurrencia):
+        # Calentamiento (conexiones, cachés, compilación de consultas)
+        for _ in range(min(10, peticiones)):
+            self.peticion(ruta)
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrencia) as executor:
+            resultados = list(executor.map(self.peticion, [ruta] * peticiones))
+        total = time.perf_counter() - inicio
+
+        latencias = sorted(duracion * 1000 for duracion, _, _ in resultados)
+        return {
+            'rps': peticiones / total,
+            'p50': statistics.median(latencias),
+            'p99': latencias[min(len(latencias) - 1, int(len(latencias) * 0.99))],
+            'bytes': resultados[-1][1],
+            'errores': sum(1 for _, _, ok in resultados if not ok),
+        }
@@ -0,0 +1,62 @@
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from libros.indice_disponibilidad import ESTADOS, IndiceDisponibilidad
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide memoria, tiempo de carga y velocidad de consulta del índice de disponibilidad '
+        'con un catálogo sintético (no usa la base de datos).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--libros', type=int, default=1_000_000, help='Libros del catálogo sintético (default: 1000000)')
+        parser.add_argument('--consultas', type=int, default=1_000_000, help='Consultas por ID a medir (default: 1000000)')
+        parser.add_argument('--agotados', type=float, default=0.0005, help='Fracción de libros agotados (default: 0.0005)')
+        parser.add_argument('--pagina', type=int, default=20, help='Libros por página superpuesta (default: 20)')
+
+    def handle(self, *args, **options):
+        total = options['libros']
+        generador = random.Random(0)
+        filas = (
+            (libro_id, 0 if generador.random() < options['agotados'] else generador.randint(1, 5), 'Disponible')
+            for libro_id in range(1, total + 1)
+        )
+
+        indice = IndiceDisponibilidad()
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        indice.construir(filas, total)
+        carga = time.perf_counter() - inicio
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        ids = [generador.randint(1, total) for _ in range(options['consultas'])]
+        inicio = time.perf_counter()
+        for libro_id in ids:
+            indice.obtener(libro_id)
+        consultas = time.perf_counter() - inicio
+
+        paginas = [
+            [{'id': libro_id, 'estado': ESTADOS[0], 'cantidad_disponible': 0} for libro_id in ids[i:i + options['pagina']]]
+            for i in range(0, min(len(ids), 100_000), options['pagina'])
+        ]
+        inicio = time.perf_counter()
+        for pagina in paginas:
+            indice.superponer(pagina)
+        superposicion = time.perf_counter() - inicio
+
+        self.stdout.write(f"Libros:                  {total:,}")
+        self.stdout.write(f"Memoria del índice:      {indice.memoria() / 1024 ** 2:,.1f} MiB")
+        self.stdout.write(f"Pico durante la carga:   {pico / 1024 ** 2:,.1f} MiB")
+        self.stdout.write(f"Carga:                   {carga:,.2f} s")
+        self.stdout.write(f"Consultas por ID:        {len(ids) / consultas:,.0f} /s")
+        self.stdout.write(f"Páginas superpuestas:    {len(paginas) / superposicion:,.0f} /s ({options['pagina']} libros)")
+        agotados = indice.agotados()
+        self.stdout.write(
+            f"Agotados:                {indice.total_agotados:,} "
+            f"({'filtro en memoria' if agotados is not None else 'filtro en SQL'})"
+        )
@@ -0,0 +1,82 @@
+import gzip
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import Resolver404, resolve
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+from edubooks import compresion
+from edubooks.renderers import JSONRapidoRenderer, orjson
+from usuarios.models import Usuario
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide, por endpoint, el tiempo de codificación JSON (DRF estándar frente a orjson) '
+        'y los bytes enviados sin comprimir, con gzip y con brotli. Ejecuta las vistas en '
+        'proceso, autenticado como el usuario indicado.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('rutas', nargs='+', help='Rutas a medir, p. ej. /api/libros/ /api/sanciones-pendientes/')
+        parser.add_argument('--email', required=True, help='Email del usuario con el que se llaman las vistas')
+        parser.add_argument('--repeticiones', type=int, default=200, help='Codificaciones por ruta (default: 200)')
+        parser.add_argument('--host', default='localhost', help='Host de las peticiones (debe estar en ALLOWED_HOSTS)')
+
+    def handle(self, *args, **options):
+        try:
+            usuario = Usuario.objects.get(email=options['email'])
+        except Usuario.DoesNotExist:
+            raise CommandError(f"No existe el usuario {options['email']}")
+
+        if orjson is None:
+            self.stdout.write(self.style.WARNING('orjson no está instalado: ambos renderers usan json estándar'))
+        if compresion.brotli is None:
+            self.stdout.write(self.style.WARNING('brotli no está instalado: se omite la columna br'))
+
+        factory = APIRequestFactory(SERVER_NAME=options['host'])
+        self.stdout.write(
+            f"{'Ruta':<40} {'drf ms':>8} {'orjson ms':>10} {'bytes':>9} {'gzip':>8} {'br':>8}"
+        )
+        for ruta in options['rutas']:
+            data = self.obtener_datos(factory, usuario, ruta)
+            estandar = self.medir(JSONRenderer(), data, options['repeticiones'])
+            rapido = self.medir(JSONRapidoRenderer(), data, options['repeticiones'])
+
+            contenido = JSONRapidoRenderer().render(data)
+            comprimido_br = '-'
+            if compresion.brotli is not None:
+                calidad = getattr(settings, 'COMPRESION_CALIDAD_BROTLI', 4)
+                comprimido_br = len(compresion.brotli.compress(contenido, quality=calidad))
+            self.stdout.write(
+                f"{ruta:<40} {estandar:>8.3f} {rapido:>10.3f} {len(contenido):>9} "
+                f"{len(gzip.compress(contenido)):>8} {comprimido_br:>8}"
+            )
+
+    def obtener_datos(self, factory, usuario, ruta):
+        ruta_base, _, _ = ruta.partition('?')
+        try:
+            coincidencia = resolve(ruta_base)
+        except Resolver404:
+            raise CommandError(f'Ruta no encontrada: {ruta}')
+
+        peticion = factory.get(ruta)
+        force_authenticate(peticion, user=usuario)
+        response = coincidencia.func(peticion, *coincidencia.args, **coincidencia.kwargs)
+        if response.status_code != 200:
+            raise CommandError(f'{ruta} respondió {response.status_code}')
+        if hasattr(response, 'data'):
+            return response.data
+        # Respuesta servida desde la caché de respuestas: ya viene codificada
+        return json.loads(response.content)
+
+    def medir(self, renderer, data, repeticiones):
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            renderer.render(data)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        return statistics.median(tiempos)
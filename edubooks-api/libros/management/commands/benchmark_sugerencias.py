@@ -0,0 +1,68 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from libros.sugerencias import IndiceSugerencias
+
+PALABRAS = (
+    'historia introduccion programacion calculo fisica quimica biologia algebra lineal '
+    'estructuras datos algoritmos redes sistemas operativos bases teoria practica manual '
+    'fundamentos avanzado moderna clasica literatura española latinoamericana economia '
+    'derecho civil penal filosofia etica psicologia sociologia arte diseño ingenieria '
+    'electronica mecanica termodinamica estadistica probabilidad geometria analisis numerico'
+).split()
+NOMBRES = 'garcia martinez lopez gonzalez rodriguez fernandez perez sanchez ramirez torres'.split()
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide memoria, tiempo de carga y latencia del índice de autocompletado '
+        'con un catálogo sintético (no usa la base de datos).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--libros', type=int, default=1_000_000, help='Libros del catálogo sintético (default: 1000000)')
+        parser.add_argument('--consultas', type=int, default=2000, help='Consultas a medir (default: 2000)')
+        parser.add_argument('--limite', type=int, default=10, help='Sugerencias por consulta (default: 10)')
+
+    def handle(self, *args, **options):
+        total = options['libros']
+        generador = random.Random(0)
+        # Sufijos numéricos para que el vocabulario crezca con el catálogo
+        filas = (
+            (
+                libro_id,
+                ' '.join(generador.sample(PALABRAS, 4)) + f' {generador.randint(1, total // 10 or 1)}',
+                f'{generador.choice(NOMBRES)} {generador.choice(NOMBRES)}',
+            )
+            for libro_id in range(1, total + 1)
+        )
+        popularidad = {generador.randint(1, total): generador.randint(1, 500) for _ in range(total // 5)}
+
+        indice = IndiceSugerencias()
+        inicio = time.perf_counter()
+        indice.construir(filas, total, popularidad)
+        carga = time.perf_counter() - inicio
+
+        consultas = []
+        for _ in range(options['consultas']):
+            palabra = generador.choice(PALABRAS)
+            if generador.random() < 0.3:
+                consultas.append(f'{palabra} {generador.choice(PALABRAS)[:generador.randint(1, 4)]}')
+            else:
+                consultas.append(palabra[:generador.randint(1, len(palabra))])
+
+        tiempos = []
+        for consulta in consultas:
+            inicio = time.perf_counter()
+            indice.buscar(consulta, options['limite'])
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        tiempos.sort()
+
+        self.stdout.write(f"Libros:             {total:,}")
+        self.stdout.write(f"Memoria del índice: {indice.memoria() / 1024 ** 2:,.1f} MiB")
+        self.stdout.write(f"Carga:              {carga:,.1f} s")
+        self.stdout.write(f"Latencia p50:       {statistics.median(tiempos):.3f} ms")
+        self.stdout.write(f"Latencia p99:       {tiempos[int(len(tiempos) * 0.99) - 1]:.3f} ms")
+        self.stdout.write(f"Latencia máxima:    {tiempos[-1]:.3f} ms")
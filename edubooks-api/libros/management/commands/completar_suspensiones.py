@@ -0,0 +1,81 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from libros import estado_cuenta, eventos
+from libros.cache import invalidar_paneles
+from libros.models import Sancion, TransicionSancion
+
+
+class Command(BaseCommand):
+    help = 'Completa las suspensiones cuya fecha de fin ya pasó y registra las transiciones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=1000,
+            help='Número de sanciones procesadas por transacción (default: 1000)',
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=int,
+            default=0,
+            help='Segundos entre barridos; con 0 se ejecuta una sola vez (default: 0)',
+        )
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        intervalo = options['intervalo']
+
+        while True:
+            total = self.completar_vencidas(lote)
+            if total or options['verbosity'] > 1:
+                self.stdout.write(
+                    self.style.SUCCESS(f'Suspensiones completadas: {total}')
+                )
+            if not intervalo:
+                break
+            time.sleep(intervalo)
+
+    def completar_vencidas(self, lote):
+        """Completa por lotes las suspensiones activas vencidas; es idempotente"""
+        ahora = timezone.now()
+        total = 0
+
+        while True:
+            with transaction.atomic():
+                # Recorre el índice parcial (estado, fecha_fin) de sanciones activas
+                filas = list(
+                    Sancion.objects.select_for_update(skip_locked=True).filter(
+                        estado='Activa',
+                        tipo='Suspensión',
+                        fecha_fin__lte=ahora
+                    ).order_by('fecha_fin').values_list('id', 'usuario_id')[:lote]
+                )
+                if not filas:
+                    break
+
+                ids = [sancion_id for sancion_id, _ in filas]
+                Sancion.objects.filter(id__in=ids).update(estado='Completada')
+                TransicionSancion.objects.bulk_create([
+                    TransicionSancion(
+                        sancion_id=sancion_id,
+                        estado_anterior='Activa',
+                        estado_nuevo='Completada',
+                        motivo='Suspensión cumplida'
+                    )
+                    for sancion_id in ids
+                ])
+                eventos.registrar_lote(Sancion, ids)
+                # update() no emite señales: se concilia el estado de cuenta de los afectados
+                usuario_ids = {usuario_id for _, usuario_id in filas}
+                estado_cuenta.conciliar(usuario_ids)
+                transaction.on_commit(lambda ids=usuario_ids: invalidar_paneles(ids))
+
+            total += len(filas)
+            if len(filas) < lote:
+                break
+
+        return total
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from libros import estado_cuenta
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el estado de cuenta (bloqueos, multas y préstamos) de todos los usuarios'
+
+    def handle(self, *args, **options):
+        total = estado_cuenta.conciliar()
+        self.stdout.write(
+            self.style.SUCCESS(f'Estados de cuenta conciliados: {total}')
+        )
@@ -0,0 +1,97 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from libros import duplicados
+from libros.models import Libro
+
+COLUMNAS = ['canonico', 'duplicado', 'puntuacion', 'titulo_canonico', 'autor_canonico', 'titulo_duplicado', 'autor_duplicado']
+
+
+class Command(BaseCommand):
+    help = (
+        'Detecta libros duplicados (mismo título y autor con variantes de escritura o sin ISBN) '
+        'y propone o aplica su fusión'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--umbral',
+            type=float,
+            default=duplicados.UMBRAL,
+            help=f'Similitud mínima para proponer una fusión (default: {duplicados.UMBRAL})',
+        )
+        parser.add_argument(
+            '--salida',
+            help='Archivo CSV donde escribir las propuestas para revisarlas',
+        )
+        parser.add_argument(
+            '--desde',
+            help='Aplica las fusiones de un CSV de propuestas ya revisado (no vuelve a detectar)',
+        )
+        parser.add_argument(
+            '--fusionar',
+            action='store_true',
+            help='Aplica directamente las propuestas detectadas',
+        )
+
+    def handle(self, *args, **options):
+        if options['desde']:
+            self.fusionar(self.leer_propuestas(options['desde']))
+            return
+
+        inicio = time.monotonic()
+        propuestas, estadisticas = duplicados.detectar(options['umbral'])
+        self.stdout.write(
+            f"Libros: {estadisticas['libros']} | bloques: {estadisticas['bloques']} "
+            f"(omitidos por tamaño: {estadisticas['bloques_omitidos']}) | "
+            f"comparaciones: {estadisticas['comparaciones']} | grupos: {estadisticas['grupos']} | "
+            f"{time.monotonic() - inicio:.1f} s"
+        )
+
+        if options['salida']:
+            self.escribir_propuestas(options['salida'], propuestas)
+        elif not options['fusionar']:
+            for propuesta in propuestas[:50]:
+                self.stdout.write(
+                    f"  {propuesta['duplicado']} -> {propuesta['canonico']} ({propuesta['puntuacion']})"
+                )
+
+        self.stdout.write(self.style.WARNING(f'Propuestas de fusión: {len(propuestas)}'))
+        if options['fusionar']:
+            self.fusionar(propuestas)
+
+    def escribir_propuestas(self, ruta, propuestas):
+        ids = {p['canonico'] for p in propuestas} | {p['duplicado'] for p in propuestas}
+        libros = Libro.objects.in_bulk(ids)
+        with open(ruta, 'w', newline='', encoding='utf-8') as archivo:
+            escritor = csv.DictWriter(archivo, fieldnames=COLUMNAS)
+            escritor.writeheader()
+            for propuesta in propuestas:
+                canonico, duplicado = libros[propuesta['canonico']], libros[propuesta['duplicado']]
+                escritor.writerow({
+                    **propuesta,
+                    'titulo_canonico': canonico.titulo,
+                    'autor_canonico': canonico.autor,
+                    'titulo_duplicado': duplicado.titulo,
+                    'autor_duplicado': duplicado.autor,
+                })
+        self.stdout.write(f'Propuestas escritas en {ruta}')
+
+    def leer_propuestas(self, ruta):
+        try:
+            with open(ruta, newline='', encoding='utf-8') as archivo:
+                return [
+                    {'canonico': int(fila['canonico']), 'duplicado': int(fila['duplicado'])}
+                    for fila in csv.DictReader(archivo)
+                ]
+        except (OSError, KeyError, ValueError) as exc:
+            raise CommandError(f'No se pudo leer {ruta}: {exc}')
+
+    def fusionar(self, propuestas):
+        inicio = time.monotonic()
+        totales = duplicados.fusionar({p['duplicado']: p['canonico'] for p in propuestas})
+        resumen = ', '.join(f'{tabla}: {total}' for tabla, total in totales.items()) or 'nada que fusionar'
+        self.stdout.write(
+            self.style.SUCCESS(f'Fusión completada en {time.monotonic() - inicio:.1f} s ({resumen})')
+        )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from libros import ejemplares
+
+
+class Command(BaseCommand):
+    help = (
+        'Crea los ejemplares (con código de barras) de los libros que aún no tienen y '
+        'recalcula sus cantidades a partir de ellos'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=1000,
+            help='Libros procesados por transacción (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        libros, creados = ejemplares.generar_faltantes(options['lote'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Ejemplares creados: {creados} en {libros} libro(s)')
+        )
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from libros import notificaciones
+
+
+class Command(BaseCommand):
+    help = 'Genera por lotes las notificaciones de vencimientos, préstamos vencidos, reservas disponibles y sanciones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=3,
+            help='Días de antelación para avisar de un vencimiento (default: 3)',
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=int,
+            default=0,
+            help='Segundos entre pasadas; con 0 se ejecuta una sola vez (default: 0)',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            evaluados = notificaciones.generar_todas(options['dias'])
+            resumen = ', '.join(f'{tipo}: {total}' for tipo, total in evaluados.items())
+            self.stdout.write(
+                self.style.SUCCESS(f'Hechos evaluados ({resumen})')
+            )
+            if not options['intervalo']:
+                break
+            time.sleep(options['intervalo'])
@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import date, timedelta
+from libros import notificaciones, politicas
 from libros.models import Prestamo, Sancion
 from django.db import transaction
 
@@ -23,8 +24,8 @@ class Command(BaseCommand):
         parser.add_argument(
             '--monto-multa-diaria',
             type=float,
-            default=5000.0,
-            help='Monto de multa por día de retraso (default: 5000)',
+            default=None,
+            help='Monto de multa por día de retraso (default: el de la política de circulación)',
         )
 
     def handle(self, *args, **options):
@@ -57,6 +58,7 @@ class Command(BaseCommand):
             self.stdout.write(
                 self.style.SUCCESS('No hay préstamos vencidos para procesar')
             )
+            self.mostrar_proximos_vencimientos(dry_run)
             return
         
         sanciones_creadas = 0
@@ -79,7 +81,10 @@ class Command(BaseCommand):
                     
                     # Calcular días de retraso
                     dias_retraso = (date.today() - prestamo.fecha_devolucion_esperada).days
-                    monto_total = dias_retraso * monto_multa_diaria
+                    multa_diaria = monto_multa_diaria
+                    if multa_diaria is None:
+                        multa_diaria = politicas.obtener(prestamo.usuario.rol, prestamo.libro.categoria).multa_diaria
+                    monto_total = dias_retraso * multa_diaria
                     
                     # Actualizar estado del préstamo
                     if not dry_run:
@@ -96,7 +101,7 @@ class Command(BaseCommand):
                             monto=monto_total,
                             descripcion=f'Multa por devolución tardía de "{prestamo.libro.titulo}". '
                                        f'Días de retraso: {dias_retraso}. '
-                                       f'Monto por día: ${monto_multa_diaria:,.0f}',
+                                       f'Monto por día: ${multa_diaria:,.0f}',
                             estado='Activa'
                         )
                         sanciones_creadas += 1
@@ -135,24 +140,21 @@ class Command(BaseCommand):
                 )
             )
         
-        # Mostrar próximos préstamos a vencer
-        self.mostrar_proximos_vencimientos()
+        # Avisar de los próximos préstamos a vencer
+        self.mostrar_proximos_vencimientos(dry_run)
     
-    def mostrar_proximos_vencimientos(self):
-        """Muestra préstamos que vencerán en los próximos días"""
+    def mostrar_proximos_vencimientos(self, dry_run=False):
+        """Genera las notificaciones de préstamos que vencerán en los próximos días"""
         fecha_limite = date.today() + timedelta(days=3)
-        proximos_vencimientos = Prestamo.objects.filter(
+        total = Prestamo.objects.filter(
             estado='Activo',
             fecha_devolucion_esperada__lte=fecha_limite,
             fecha_devolucion_esperada__gte=date.today()
-        ).select_related('usuario', 'libro')
+        ).count()
         
-        if proximos_vencimientos.exists():
+        if total:
             self.stdout.write('\n' + '='*50)
-            self.stdout.write('PRÓXIMOS VENCIMIENTOS (3 días):')
-            for prestamo in proximos_vencimientos:
-                dias_restantes = (prestamo.fecha_devolucion_esperada - date.today()).days
-                self.stdout.write(
-                    f'- {prestamo.libro.titulo} ({prestamo.usuario.nombre} {prestamo.usuario.apellido}) '
-                    f'- Vence en {dias_restantes} día(s)'
-                )
\ No newline at end of file
+            self.stdout.write(f'PRÓXIMOS VENCIMIENTOS (3 días): {total}')
+            if not dry_run:
+                notificaciones.generar_vencimientos_proximos(dias=3)
+                self.stdout.write('Notificaciones de vencimiento generadas')
@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from libros.models import EventoCirculacion
+
+
+class Command(BaseCommand):
+    help = 'Elimina los eventos de circulación más antiguos que la retención indicada'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=7,
+            help='Días de eventos que se conservan (default: 7)',
+        )
+
+    def handle(self, *args, **options):
+        fecha_limite = timezone.now() - timedelta(days=options['dias'])
+        # Se borra por id: la tabla se recorre por su clave primaria, que crece con la fecha
+        ultimo = EventoCirculacion.objects.filter(
+            fecha__lt=fecha_limite
+        ).order_by('-id').values_list('id', flat=True).first()
+        eliminados = 0
+        if ultimo:
+            eliminados, _ = EventoCirculacion.objects.filter(id__lte=ultimo).delete()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Eventos eliminados: {eliminados}')
+        )
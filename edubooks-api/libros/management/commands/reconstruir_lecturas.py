@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from libros import lecturas
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye las listas de lectura desnormalizadas de los programas académicos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--programa',
+            action='append',
+            help='Programa a reconstruir (puede repetirse). Por defecto, todos',
+        )
+
+    def handle(self, *args, **options):
+        if options['programa']:
+            programas = set(options['programa'])
+            lecturas.refrescar_programas(programas)
+        else:
+            programas = lecturas.reconstruir_todo()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Listas de lectura reconstruidas: {len(programas)} programa(s)')
+        )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from libros import ejemplares
+
+
+class Command(BaseCommand):
+    help = (
+        'Vuelve a derivar de los ejemplares las cantidades de todos los libros que los tienen '
+        '(programarlo periódicamente: corrige los recuentos que un proceso no llegó a hacer al confirmar)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=1000,
+            help='Libros recontados por transacción (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        total = ejemplares.recontar_todos(options['lote'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Libros recontados: {total}')
+        )
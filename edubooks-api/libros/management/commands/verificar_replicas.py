@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections, transaction
+from edubooks import replicas
+from libros.models import Libro
+
+
+class Command(BaseCommand):
+    help = (
+        'Verifica la configuración de réplicas: estado y retraso de cada una y las decisiones del router '
+        '(lecturas anónimas, lectura de las propias escrituras y lecturas dentro de transacciones)'
+    )
+
+    def handle(self, *args, **options):
+        alias_replicas = replicas.replicas_configuradas()
+        if not alias_replicas:
+            raise CommandError('No hay réplicas configuradas (defina DB_REPLICAS="host:puerto,...").')
+
+        self.stdout.write('ESTADO DE LAS RÉPLICAS:')
+        for alias in alias_replicas:
+            try:
+                with connections[alias].cursor() as cursor:
+                    cursor.execute('SELECT pg_is_in_recovery()')
+                    en_recuperacion = cursor.fetchone()[0]
+            except DatabaseError as e:
+                self.stdout.write(self.style.ERROR(f'- {alias}: inaccesible ({e})'))
+                continue
+            retraso = replicas.estado_replicas.retraso(alias)
+            estilo = self.style.SUCCESS if en_recuperacion else self.style.WARNING
+            self.stdout.write(estilo(
+                f'- {alias}: {"réplica" if en_recuperacion else "NO está en recuperación"}, retraso {retraso:.2f} s'
+            ))
+
+        usuario = SimpleNamespace(pk=0, is_authenticated=True)
+        casos = [
+            ('GET anónimo', SimpleNamespace(user=AnonymousUser()), False),
+            ('GET autenticado', SimpleNamespace(user=usuario), False),
+            ('GET tras escritura propia', SimpleNamespace(user=usuario), True),
+        ]
+
+        self.stdout.write('\nDECISIONES DEL ROUTER:')
+        token = replicas._peticion_actual.set(None)
+        try:
+            self.stdout.write(f'- Petición de escritura: {Libro.objects.all().db}')
+            for nombre, peticion, pegado in casos:
+                if pegado:
+                    cache.set(replicas.clave_pegado(usuario.pk), True, 5)
+                replicas._peticion_actual.set(peticion)
+                self.stdout.write(f'- {nombre}: {Libro.objects.all().db}')
+                cache.delete(replicas.clave_pegado(usuario.pk))
+
+            replicas._peticion_actual.set(SimpleNamespace(user=AnonymousUser()))
+            with transaction.atomic():
+                self.stdout.write(f'- GET dentro de una transacción: {Libro.objects.all().db}')
+
+            # Lectura real desde la base elegida
+            total = Libro.objects.count()
+            self.stdout.write(f'- Libros leídos desde {Libro.objects.all().db}: {total}')
+        finally:
+            replicas._peticion_actual.reset(token)
@@ -0,0 +1,44 @@
+# libros/middleware.py
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from edubooks.replicas import METODOS_LECTURA
+from . import eventos
+
+
+class TransaccionEscrituraMiddleware:
+    """
+    Ejecuta cada petición de escritura en una transacción.
+
+    Así el cambio, sus efectos (disponibilidad del libro, sanciones) y los
+    eventos de la bandeja de salida se confirman o se descartan juntos (los IDs
+    de los eventos descartados se anotan, ver eventos.transaccion). Las
+    lecturas quedan fuera para no fijarlas a la base de datos principal.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        if request.method in METODOS_LECTURA:
+            return self.get_response(request)
+        with eventos.transaccion():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if request.method in METODOS_LECTURA:
+            return await self.get_response(request)
+        # La transacción se abre en el hilo de sync_to_async que comparten las
+        # consultas de la petición (thread_sensitive), y el resto de la cadena
+        # se ejecuta desde ese hilo para que sus consultas entren en ella
+        return await sync_to_async(self._en_transaccion)(request)
+
+    def _en_transaccion(self, request):
+        with eventos.transaccion():
+            return async_to_sync(self.get_response)(request)
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0002_alter_bibliografia_unique_together_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LecturaPrograma',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('programa', models.CharField(max_length=100)),
+                ('titulo', models.CharField(max_length=200)),
+                ('autor', models.CharField(max_length=200)),
+                ('categoria', models.CharField(max_length=100)),
+                ('imagen_portada', models.URLField(blank=True, null=True)),
+                ('estado', models.CharField(choices=[('Disponible', 'Disponible'), ('Prestado', 'Prestado'), ('Reservado', 'Reservado'), ('Mantenimiento', 'Mantenimiento')], max_length=15)),
+                ('cantidad_disponible', models.PositiveIntegerField(default=0)),
+                ('cursos', models.JSONField(default=list, help_text='Cursos del programa que incluyen el libro')),
+                ('libro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lecturas_programa', to='libros.libro')),
+            ],
+            options={
+                'db_table': 'lecturas_programa',
+                'ordering': ['titulo', 'id'],
+                'indexes': [models.Index(fields=['programa', 'titulo', 'id'], name='lecturas_programa_orden_idx')],
+                'unique_together': {('programa', 'libro')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0001_initial'),
+        ('libros', '0003_lecturaprograma'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadoCuenta',
+            fields=[
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='estado_cuenta', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('bloqueado_hasta', models.DateTimeField(blank=True, null=True)),
+                ('multas_pendientes', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('prestamos_activos', models.PositiveIntegerField(default=0)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'estados_cuenta',
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0004_estadocuenta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransicionSancion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado_anterior', models.CharField(choices=[('Activa', 'Activa'), ('Pagada', 'Pagada'), ('Completada', 'Completada')], max_length=12)),
+                ('estado_nuevo', models.CharField(choices=[('Activa', 'Activa'), ('Pagada', 'Pagada'), ('Completada', 'Completada')], max_length=12)),
+                ('motivo', models.CharField(max_length=200)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'transiciones_sancion',
+                'ordering': ['-fecha'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='sancion',
+            index=models.Index(condition=models.Q(('estado', 'Activa')), fields=['estado', 'fecha_fin'], name='sanciones_activas_fin_idx'),
+        ),
+        migrations.AddField(
+            model_name='transicionsancion',
+            name='sancion',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transiciones', to='libros.sancion'),
+        ),
+    ]
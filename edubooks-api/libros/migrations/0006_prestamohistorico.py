@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('libros', '0005_transicionsancion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrestamoHistorico',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('fecha_prestamo', models.DateTimeField()),
+                ('fecha_devolucion_esperada', models.DateField()),
+                ('fecha_devolucion_real', models.DateTimeField(blank=True, null=True)),
+                ('estado', models.CharField(choices=[('Activo', 'Activo'), ('Devuelto', 'Devuelto'), ('Vencido', 'Vencido')], max_length=10)),
+                ('observaciones', models.TextField(blank=True, null=True)),
+                ('renovaciones', models.PositiveIntegerField(default=0)),
+                ('fecha_archivado', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'prestamos_historico',
+                'ordering': ['-fecha_prestamo'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(condition=models.Q(('estado__in', ['Activo', 'Vencido'])), fields=['usuario', 'fecha_devolucion_esperada'], name='prestamos_abiertos_usuario_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(condition=models.Q(('estado__in', ['Activo', 'Vencido'])), fields=['fecha_devolucion_esperada'], name='prestamos_abiertos_fecha_idx'),
+        ),
+        migrations.AddField(
+            model_name='prestamohistorico',
+            name='libro',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prestamos_historicos', to='libros.libro'),
+        ),
+        migrations.AddField(
+            model_name='prestamohistorico',
+            name='usuario',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prestamos_historicos', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='prestamohistorico',
+            index=models.Index(fields=['usuario', '-fecha_prestamo'], name='prestamos_hist_usuario_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0006_prestamohistorico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoCirculacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entidad', models.CharField(choices=[('Libro', 'Libro'), ('Prestamo', 'Préstamo'), ('Reserva', 'Reserva'), ('Sancion', 'Sanción')], max_length=10)),
+                ('entidad_id', models.BigIntegerField()),
+                ('accion', models.CharField(choices=[('creado', 'Creado'), ('actualizado', 'Actualizado'), ('eliminado', 'Eliminado')], max_length=12)),
+                ('libro_id', models.BigIntegerField(blank=True, null=True)),
+                ('usuario_id', models.BigIntegerField(blank=True, null=True)),
+                ('datos', models.JSONField(default=dict)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'eventos_circulacion',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['usuario_id', 'id'], name='eventos_usuario_idx'), models.Index(fields=['entidad', 'id'], name='eventos_entidad_idx')],
+            },
+        ),
+    ]
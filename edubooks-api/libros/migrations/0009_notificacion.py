@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('libros', '0008_fecha_actualizacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notificacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('vencimiento_proximo', 'Vencimiento próximo'), ('prestamo_vencido', 'Préstamo vencido'), ('reserva_disponible', 'Reserva disponible'), ('sancion', 'Sanción')], max_length=20)),
+                ('nivel', models.CharField(choices=[('info', 'Información'), ('success', 'Éxito'), ('warning', 'Advertencia'), ('error', 'Error')], default='info', max_length=10)),
+                ('titulo', models.CharField(max_length=200)),
+                ('mensaje', models.TextField()),
+                ('clave', models.CharField(max_length=100)),
+                ('leida', models.BooleanField(default=False)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notificaciones', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'notificaciones',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['usuario', '-id'], name='notificaciones_usuario_idx'), models.Index(condition=models.Q(('leida', False)), fields=['usuario'], name='notificaciones_no_leidas_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='notificacion',
+            constraint=models.UniqueConstraint(fields=('usuario', 'clave'), name='notificaciones_usuario_clave_uniq'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0009_notificacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Ejemplar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo_barras', models.CharField(max_length=32, unique=True)),
+                ('ubicacion', models.CharField(blank=True, max_length=100, null=True)),
+                ('estado', models.CharField(choices=[('Disponible', 'Disponible'), ('Prestado', 'Prestado'), ('Mantenimiento', 'Mantenimiento'), ('Baja', 'Baja')], default='Disponible', max_length=15)),
+                ('fecha_registro', models.DateTimeField(auto_now_add=True)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('libro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ejemplares', to='libros.libro')),
+            ],
+            options={
+                'db_table': 'ejemplares',
+                'ordering': ['libro', 'codigo_barras'],
+            },
+        ),
+        migrations.AddField(
+            model_name='prestamo',
+            name='ejemplar',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='prestamos', to='libros.ejemplar'),
+        ),
+        migrations.AddField(
+            model_name='prestamohistorico',
+            name='ejemplar',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='prestamos_historicos', to='libros.ejemplar'),
+        ),
+        migrations.AddIndex(
+            model_name='ejemplar',
+            index=models.Index(condition=models.Q(('estado', 'Disponible')), fields=['libro', 'id'], name='ejemplares_disponibles_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0010_ejemplar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PoliticaCirculacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rol', models.CharField(blank=True, choices=[('Estudiante', 'Estudiante'), ('Docente', 'Docente'), ('Administrador', 'Administrador')], default='', max_length=15)),
+                ('categoria', models.CharField(blank=True, default='', max_length=100)),
+                ('dias_prestamo', models.PositiveIntegerField(blank=True, null=True)),
+                ('max_renovaciones', models.PositiveIntegerField(blank=True, null=True)),
+                ('dias_renovacion', models.PositiveIntegerField(blank=True, null=True)),
+                ('dias_reserva', models.PositiveIntegerField(blank=True, null=True)),
+                ('multa_diaria', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('activa', models.BooleanField(default=True)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'politicas_circulacion',
+                'ordering': ['rol', 'categoria'],
+                'unique_together': {('rol', 'categoria')},
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0011_politicacirculacion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='eventocirculacion',
+            index=models.Index(fields=['fecha', 'id'], name='eventos_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(fields=['fecha', 'id'], name='notificaciones_fecha_idx'),
+        ),
+    ]
@@ -31,6 +31,7 @@ class Libro(models.Model):
     descripcion = models.TextField(null=True, blank=True)
     imagen_portada = models.URLField(null=True, blank=True)
     fecha_registro = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
     
     class Meta:
         db_table = 'libros'
@@ -47,6 +48,37 @@ class Libro(models.Model):
             self.estado = 'Disponible'
         super().save(*args, **kwargs)
 
+class Ejemplar(models.Model):
+    """Copia física de un libro, identificada por su código de barras"""
+    ESTADOS_CHOICES = [
+        ('Disponible', 'Disponible'),
+        ('Prestado', 'Prestado'),
+        ('Mantenimiento', 'Mantenimiento'),
+        ('Baja', 'Baja'),
+    ]
+    
+    libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='ejemplares')
+    codigo_barras = models.CharField(max_length=32, unique=True)
+    ubicacion = models.CharField(max_length=100, null=True, blank=True)
+    estado = models.CharField(max_length=15, choices=ESTADOS_CHOICES, default='Disponible')
+    fecha_registro = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'ejemplares'
+        ordering = ['libro', 'codigo_barras']
+        indexes = [
+            # Índice parcial: prestar busca solo entre los ejemplares libres del libro
+            models.Index(
+                fields=['libro', 'id'],
+                name='ejemplares_disponibles_idx',
+                condition=models.Q(estado='Disponible')
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.codigo_barras} - {self.libro.titulo}"
+
 class Prestamo(models.Model):
     ESTADOS_CHOICES = [
         ('Activo', 'Activo'),
@@ -55,6 +87,9 @@ class Prestamo(models.Model):
     ]
     
     libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='prestamos')
+    ejemplar = models.ForeignKey(
+        Ejemplar, on_delete=models.SET_NULL, null=True, blank=True, related_name='prestamos'
+    )
     usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='prestamos')
     fecha_prestamo = models.DateTimeField(auto_now_add=True)
     fecha_devolucion_esperada = models.DateField()
@@ -62,32 +97,96 @@ class Prestamo(models.Model):
     estado = models.CharField(max_length=10, choices=ESTADOS_CHOICES, default='Activo')
     observaciones = models.TextField(null=True, blank=True)
     renovaciones = models.PositiveIntegerField(default=0)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
     
     class Meta:
         db_table = 'prestamos'
         ordering = ['-fecha_prestamo']
+        indexes = [
+            # Índices parciales: las consultas de préstamos abiertos no recorren el historial
+            models.Index(
+                fields=['usuario', 'fecha_devolucion_esperada'],
+                name='prestamos_abiertos_usuario_idx',
+                condition=models.Q(estado__in=['Activo', 'Vencido'])
+            ),
+            models.Index(
+                fields=['fecha_devolucion_esperada'],
+                name='prestamos_abiertos_fecha_idx',
+                condition=models.Q(estado__in=['Activo', 'Vencido'])
+            ),
+        ]
     
     def __str__(self):
         return f"{self.libro.titulo} - {self.usuario.nombre} {self.usuario.apellido}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Estado leído de la base: la devolución solo repone el ejemplar al pasar a Devuelto
+        instancia._estado_guardado = instancia.__dict__.get('estado')
+        return instancia
+    
     def save(self, *args, **kwargs):
-        # Establecer fecha de devolución esperada (15 días por defecto)
+        # Establecer fecha de devolución esperada según la política del rol y la categoría
         if not self.fecha_devolucion_esperada:
-            self.fecha_devolucion_esperada = date.today() + timedelta(days=15)
+            from .politicas import obtener as obtener_politica
+            politica = obtener_politica(self.usuario.rol, self.libro.categoria)
+            self.fecha_devolucion_esperada = date.today() + timedelta(days=politica.dias_prestamo)
         
         # Actualizar estado si está vencido
         if self.estado == 'Activo' and date.today() > self.fecha_devolucion_esperada:
             self.estado = 'Vencido'
         
+        creando = self._state.adding
+        estado_anterior = getattr(self, '_estado_guardado', None)
         super().save(*args, **kwargs)
+        self._estado_guardado = self.estado
         
-        # Actualizar disponibilidad del libro
-        if self.estado == 'Activo' and not self.pk:
-            self.libro.cantidad_disponible -= 1
-            self.libro.save()
-        elif self.estado == 'Devuelto' and self.fecha_devolucion_real:
-            self.libro.cantidad_disponible += 1
-            self.libro.save()
+        # Actualizar disponibilidad del ejemplar y del libro
+        if creando and self.estado == 'Activo':
+            self._mover_ejemplar('Prestado', -1)
+        elif self.estado == 'Devuelto' and estado_anterior in ('Activo', 'Vencido'):
+            self._mover_ejemplar('Disponible', 1)
+    
+    def _mover_ejemplar(self, estado, cambio):
+        from . import circulacion, ejemplares
+        if self.ejemplar_id:
+            # Solo se escribe la fila del ejemplar; los contadores del libro se derivan al confirmar,
+            # así los préstamos de otros ejemplares del mismo título no esperan su bloqueo
+            Ejemplar.objects.filter(pk=self.ejemplar_id).update(estado=estado, fecha_actualizacion=timezone.now())
+            ejemplares.recontar_al_confirmar([self.libro_id])
+        elif ejemplares.tiene_ejemplares(self.libro_id):
+            # Préstamo anterior a los ejemplares de su libro: los contadores también salen de ellos
+            ejemplares.recontar_al_confirmar([self.libro_id])
+        else:
+            # Libro sin ejemplares: el contador es el único registro de la disponibilidad
+            circulacion.ajustar_disponibilidad({self.libro_id: cambio})
+
+class PrestamoHistorico(models.Model):
+    """Préstamo cerrado movido fuera de la tabla de préstamos por archivar_prestamos (conserva el ID original)"""
+    id = models.BigIntegerField(primary_key=True)
+    libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='prestamos_historicos')
+    ejemplar = models.ForeignKey(
+        Ejemplar, on_delete=models.SET_NULL, null=True, blank=True, related_name='prestamos_historicos'
+    )
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='prestamos_historicos')
+    fecha_prestamo = models.DateTimeField()
+    fecha_devolucion_esperada = models.DateField()
+    fecha_devolucion_real = models.DateTimeField(null=True, blank=True)
+    estado = models.CharField(max_length=10, choices=Prestamo.ESTADOS_CHOICES)
+    observaciones = models.TextField(null=True, blank=True)
+    renovaciones = models.PositiveIntegerField(default=0)
+    fecha_archivado = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'prestamos_historico'
+        ordering = ['-fecha_prestamo']
+        indexes = [
+            models.Index(fields=['usuario', '-fecha_prestamo'], name='prestamos_hist_usuario_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.libro.titulo} - {self.usuario.nombre} {self.usuario.apellido} (archivado)"
 
 class Reserva(models.Model):
     ESTADOS_CHOICES = [
@@ -111,9 +210,11 @@ class Reserva(models.Model):
         return f"Reserva: {self.libro.titulo} - {self.usuario.nombre} {self.usuario.apellido}"
     
     def save(self, *args, **kwargs):
-        # Establecer fecha de expiración (3 días por defecto)
+        # Establecer fecha de expiración según la política del rol y la categoría
         if not self.fecha_expiracion:
-            self.fecha_expiracion = timezone.now() + timedelta(days=3)
+            from .politicas import obtener as obtener_politica
+            politica = obtener_politica(self.usuario.rol, self.libro.categoria)
+            self.fecha_expiracion = timezone.now() + timedelta(days=politica.dias_reserva)
         super().save(*args, **kwargs)
 
 class Bibliografia(models.Model):
@@ -130,6 +231,7 @@ class Bibliografia(models.Model):
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     activa = models.BooleanField(default=True)
     es_publica = models.BooleanField(default=True, help_text="Si es visible para estudiantes del programa")
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
     
     class Meta:
         db_table = 'bibliografias'
@@ -139,6 +241,29 @@ class Bibliografia(models.Model):
     def __str__(self):
         return f"{self.curso} - {self.programa} - {self.docente.nombre} {self.docente.apellido}"
 
+class LecturaPrograma(models.Model):
+    """Lista de lectura desnormalizada: un libro de las bibliografías públicas y activas de un programa"""
+    programa = models.CharField(max_length=100)
+    libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='lecturas_programa')
+    titulo = models.CharField(max_length=200)
+    autor = models.CharField(max_length=200)
+    categoria = models.CharField(max_length=100)
+    imagen_portada = models.URLField(null=True, blank=True)
+    estado = models.CharField(max_length=15, choices=Libro.ESTADOS_CHOICES)
+    cantidad_disponible = models.PositiveIntegerField(default=0)
+    cursos = models.JSONField(default=list, help_text="Cursos del programa que incluyen el libro")
+    
+    class Meta:
+        db_table = 'lecturas_programa'
+        ordering = ['titulo', 'id']
+        unique_together = ['programa', 'libro']
+        indexes = [
+            models.Index(fields=['programa', 'titulo', 'id'], name='lecturas_programa_orden_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.programa} - {self.titulo}"
+
 class Sancion(models.Model):
     TIPOS_CHOICES = [
         ('Multa', 'Multa'),
@@ -170,6 +295,13 @@ class Sancion(models.Model):
     class Meta:
         db_table = 'sanciones'
         ordering = ['-fecha_inicio']
+        indexes = [
+            models.Index(
+                fields=['estado', 'fecha_fin'],
+                name='sanciones_activas_fin_idx',
+                condition=models.Q(estado='Activa')
+            ),
+        ]
     
     def __str__(self):
         return f"{self.tipo} - {self.usuario.nombre} {self.usuario.apellido}"
@@ -179,3 +311,142 @@ class Sancion(models.Model):
         if self.tipo == 'Suspensión' and self.dias_suspension and not self.fecha_fin:
             self.fecha_fin = timezone.now() + timedelta(days=self.dias_suspension)
         super().save(*args, **kwargs)
+
+class TransicionSancion(models.Model):
+    """Registro de auditoría de los cambios de estado de las sanciones"""
+    sancion = models.ForeignKey(Sancion, on_delete=models.CASCADE, related_name='transiciones')
+    estado_anterior = models.CharField(max_length=12, choices=Sancion.ESTADOS_CHOICES)
+    estado_nuevo = models.CharField(max_length=12, choices=Sancion.ESTADOS_CHOICES)
+    motivo = models.CharField(max_length=200)
+    fecha = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'transiciones_sancion'
+        ordering = ['-fecha']
+    
+    def __str__(self):
+        return f"Sanción {self.sancion_id}: {self.estado_anterior} → {self.estado_nuevo}"
+
+class EstadoCuenta(models.Model):
+    """Situación de circulación del usuario, mantenida por los eventos de sanciones, pagos y préstamos"""
+    usuario = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='estado_cuenta'
+    )
+    bloqueado_hasta = models.DateTimeField(null=True, blank=True)
+    multas_pendientes = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    prestamos_activos = models.PositiveIntegerField(default=0)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'estados_cuenta'
+    
+    def __str__(self):
+        return f"Estado de cuenta - {self.usuario.nombre} {self.usuario.apellido}"
+
+class EventoCirculacion(models.Model):
+    """Bandeja de salida (outbox) de cambios de circulación, escrita en la misma transacción que el cambio"""
+    ENTIDADES_CHOICES = [
+        ('Libro', 'Libro'),
+        ('Prestamo', 'Préstamo'),
+        ('Reserva', 'Reserva'),
+        ('Sancion', 'Sanción'),
+    ]
+    
+    ACCIONES_CHOICES = [
+        ('creado', 'Creado'),
+        ('actualizado', 'Actualizado'),
+        ('eliminado', 'Eliminado'),
+    ]
+    
+    entidad = models.CharField(max_length=10, choices=ENTIDADES_CHOICES)
+    entidad_id = models.BigIntegerField()
+    accion = models.CharField(max_length=12, choices=ACCIONES_CHOICES)
+    # Sin claves foráneas: el evento debe sobrevivir a la eliminación del libro o del usuario
+    libro_id = models.BigIntegerField(null=True, blank=True)
+    usuario_id = models.BigIntegerField(null=True, blank=True)
+    datos = models.JSONField(default=dict)
+    fecha = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'eventos_circulacion'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['usuario_id', 'id'], name='eventos_usuario_idx'),
+            models.Index(fields=['entidad', 'id'], name='eventos_entidad_idx'),
+            # Horizonte de lectura (libros.eventos.horizonte)
+            models.Index(fields=['fecha', 'id'], name='eventos_fecha_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.entidad} {self.entidad_id} {self.accion}"
+
+class Notificacion(models.Model):
+    """Aviso para un usuario generado en el servidor (vencimientos, reservas disponibles, sanciones)"""
+    TIPOS_CHOICES = [
+        ('vencimiento_proximo', 'Vencimiento próximo'),
+        ('prestamo_vencido', 'Préstamo vencido'),
+        ('reserva_disponible', 'Reserva disponible'),
+        ('sancion', 'Sanción'),
+    ]
+    
+    # Mismos niveles que usa la app para mostrar las notificaciones
+    NIVELES_CHOICES = [
+        ('info', 'Información'),
+        ('success', 'Éxito'),
+        ('warning', 'Advertencia'),
+        ('error', 'Error'),
+    ]
+    
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notificaciones')
+    tipo = models.CharField(max_length=20, choices=TIPOS_CHOICES)
+    nivel = models.CharField(max_length=10, choices=NIVELES_CHOICES, default='info')
+    titulo = models.CharField(max_length=200)
+    mensaje = models.TextField()
+    # Identifica el hecho notificado para que la generación por lotes sea idempotente
+    clave = models.CharField(max_length=100)
+    leida = models.BooleanField(default=False)
+    fecha = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'notificaciones'
+        ordering = ['-id']
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'clave'], name='notificaciones_usuario_clave_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['usuario', '-id'], name='notificaciones_usuario_idx'),
+            # El contador de no leídas solo recorre las pendientes de cada usuario
+            models.Index(
+                fields=['usuario'],
+                name='notificaciones_no_leidas_idx',
+                condition=models.Q(leida=False)
+            ),
+            # Horizonte de lectura (libros.eventos.horizonte)
+            models.Index(fields=['fecha', 'id'], name='notificaciones_fecha_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.usuario.nombre} - {self.titulo}"
+
+class PoliticaCirculacion(models.Model):
+    """Regla de circulación por rol y categoría (vacíos: cualquiera); los campos vacíos heredan de reglas más generales"""
+    rol = models.CharField(max_length=15, choices=User.ROLES_CHOICES, blank=True, default='')
+    categoria = models.CharField(max_length=100, blank=True, default='')
+    dias_prestamo = models.PositiveIntegerField(null=True, blank=True)
+    max_renovaciones = models.PositiveIntegerField(null=True, blank=True)
+    dias_renovacion = models.PositiveIntegerField(null=True, blank=True)
+    dias_reserva = models.PositiveIntegerField(null=True, blank=True)
+    multa_diaria = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    activa = models.BooleanField(default=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'politicas_circulacion'
+        ordering = ['rol', 'categoria']
+        unique_together = ['rol', 'categoria']
+    
+    def __str__(self):
+        return f"Política {self.rol or 'todos los roles'} / {self.categoria or 'todas las categorías'}"
@@ -0,0 +1,155 @@
+# libros/notificaciones.py
+"""
+Generación por lotes de notificaciones.
+
+Cada pasada lee con una sola consulta todos los hechos a notificar
+(préstamos por vencer o vencidos, reservas con ejemplar disponible y
+sanciones activas) y los inserta por bloques con bulk_create. La clave
+única (usuario, clave) hace que repetir una pasada no duplique avisos; los
+ya existentes se descartan antes de insertar para no dejar huecos en los IDs.
+"""
+from datetime import timedelta
+
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from . import estado_cuenta
+from .models import Notificacion, Prestamo, Reserva, Sancion
+
+TAMANO_LOTE = 1000
+
+
+def _crear_nuevas(bloque):
+    """
+    Inserta solo los avisos que aún no existen: los conflictos que ignora
+    bulk_create también consumen IDs de la secuencia, y cada hueco detiene el
+    horizonte de las notificaciones (eventos.horizonte) durante la ventana.
+    """
+    existentes = set(Notificacion.objects.filter(
+        usuario_id__in={n.usuario_id for n in bloque}, clave__in={n.clave for n in bloque}
+    ).values_list('usuario_id', 'clave'))
+    # ignore_conflicts sigue cubriendo una pasada simultánea
+    Notificacion.objects.bulk_create(
+        [n for n in bloque if (n.usuario_id, n.clave) not in existentes], ignore_conflicts=True
+    )
+
+
+def _insertar(filas, construir):
+    """Inserta por bloques las notificaciones de `filas`; devuelve cuántos hechos se evaluaron"""
+    total = 0
+    bloque = []
+    for fila in filas.iterator(chunk_size=TAMANO_LOTE):
+        bloque.append(construir(fila))
+        if len(bloque) >= TAMANO_LOTE:
+            _crear_nuevas(bloque)
+            total += len(bloque)
+            bloque = []
+    if bloque:
+        _crear_nuevas(bloque)
+        total += len(bloque)
+    return total
+
+
+def generar_vencimientos_proximos(dias=3):
+    """Préstamos activos que vencen en los próximos `dias` días (uno por fecha de vencimiento)"""
+    hoy = timezone.localdate()
+    filas = Prestamo.objects.filter(
+        estado='Activo',
+        fecha_devolucion_esperada__gte=hoy,
+        fecha_devolucion_esperada__lte=hoy + timedelta(days=dias)
+    ).order_by().values('id', 'usuario_id', 'fecha_devolucion_esperada', 'libro__titulo')
+
+    def construir(fila):
+        dias_restantes = (fila['fecha_devolucion_esperada'] - hoy).days
+        cuando = 'hoy' if dias_restantes == 0 else f'en {dias_restantes} día(s)'
+        return Notificacion(
+            usuario_id=fila['usuario_id'],
+            tipo='vencimiento_proximo',
+            nivel='warning',
+            titulo='Préstamo próximo a vencer',
+            mensaje=f'"{fila["libro__titulo"]}" debe devolverse {cuando} ({fila["fecha_devolucion_esperada"]:%d/%m/%Y}).',
+            # Una renovación cambia la fecha y genera un aviso nuevo
+            clave=f'vencimiento:{fila["id"]}:{fila["fecha_devolucion_esperada"]:%Y%m%d}'
+        )
+    return _insertar(filas, construir)
+
+
+def generar_vencidos():
+    """Préstamos abiertos cuya fecha de devolución ya pasó (un aviso por préstamo)"""
+    hoy = timezone.localdate()
+    filas = Prestamo.objects.filter(
+        estado__in=estado_cuenta.ESTADOS_PRESTAMO_ABIERTOS,
+        fecha_devolucion_esperada__lt=hoy
+    ).order_by().values('id', 'usuario_id', 'fecha_devolucion_esperada', 'libro__titulo')
+
+    def construir(fila):
+        return Notificacion(
+            usuario_id=fila['usuario_id'],
+            tipo='prestamo_vencido',
+            nivel='error',
+            titulo='Préstamo vencido',
+            mensaje=f'"{fila["libro__titulo"]}" venció el {fila["fecha_devolucion_esperada"]:%d/%m/%Y}. '
+                    f'Devuélvelo cuanto antes para evitar multas.',
+            clave=f'vencido:{fila["id"]}'
+        )
+    return _insertar(filas, construir)
+
+
+def generar_reservas_disponibles():
+    """Reservas activas cuyo turno en la cola ya tiene un ejemplar disponible"""
+    # Posición en la cola de cada libro; las primeras `cantidad_disponible` reservas pueden recogerlo
+    filas = Reserva.objects.filter(
+        estado='Activa',
+        libro__cantidad_disponible__gt=0
+    ).annotate(
+        posicion=Window(RowNumber(), partition_by=[F('libro_id')], order_by=[F('fecha_reserva').asc(), F('id').asc()])
+    ).filter(
+        posicion__lte=F('libro__cantidad_disponible')
+    ).order_by().values('id', 'usuario_id', 'fecha_expiracion', 'libro__titulo')
+
+    def construir(fila):
+        return Notificacion(
+            usuario_id=fila['usuario_id'],
+            tipo='reserva_disponible',
+            nivel='success',
+            titulo='Tu reserva está disponible',
+            mensaje=f'"{fila["libro__titulo"]}" ya puede recogerse. '
+                    f'La reserva expira el {timezone.localtime(fila["fecha_expiracion"]):%d/%m/%Y %H:%M}.',
+            clave=f'reserva:{fila["id"]}'
+        )
+    return _insertar(filas, construir)
+
+
+def generar_sanciones():
+    """Sanciones activas (un aviso por sanción)"""
+    filas = Sancion.objects.filter(estado='Activa').order_by().values(
+        'id', 'usuario_id', 'tipo', 'monto', 'dias_suspension', 'fecha_fin', 'descripcion'
+    )
+
+    def construir(fila):
+        if fila['tipo'] == 'Multa':
+            detalle = f'Tienes una multa pendiente de ${fila["monto"] or 0:,.0f}.'
+        elif fila['fecha_fin']:
+            detalle = f'Tu cuenta está suspendida hasta el {timezone.localtime(fila["fecha_fin"]):%d/%m/%Y}.'
+        else:
+            detalle = f'Tu cuenta está suspendida {fila["dias_suspension"] or 0} día(s).'
+        return Notificacion(
+            usuario_id=fila['usuario_id'],
+            tipo='sancion',
+            nivel='error',
+            titulo=f'{fila["tipo"]} registrada',
+            mensaje=f'{detalle} {fila["descripcion"]}',
+            clave=f'sancion:{fila["id"]}'
+        )
+    return _insertar(filas, construir)
+
+
+def generar_todas(dias=3):
+    """Ejecuta todas las pasadas y devuelve los hechos evaluados por tipo"""
+    return {
+        'vencimiento_proximo': generar_vencimientos_proximos(dias),
+        'prestamo_vencido': generar_vencidos(),
+        'reserva_disponible': generar_reservas_disponibles(),
+        'sancion': generar_sanciones(),
+    }
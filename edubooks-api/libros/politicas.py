@@ -0,0 +1,138 @@
+# libros/politicas.py
+"""
+Políticas de circulación por rol del usuario y categoría del libro.
+
+Cada regla (PoliticaCirculacion) fija la duración del préstamo, las
+renovaciones, el plazo para recoger una reserva y la multa diaria; los
+campos vacíos heredan de la regla más general (rol y categoría, solo rol,
+solo categoría, general y, por último, settings.POLITICAS_CIRCULACION).
+
+Las reglas se compilan al arrancar en una tabla en memoria con la política
+ya resuelta para cada combinación de rol y categoría configurados, así que
+consultarla no hace consultas a la base de datos. Al guardar una regla se
+incrementa una versión en la caché compartida y cada worker recompila su
+tabla cuando la ve cambiar.
+"""
+import threading
+import time
+from collections import namedtuple
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError
+
+from .models import PoliticaCirculacion
+
+CAMPOS = ['dias_prestamo', 'max_renovaciones', 'dias_renovacion', 'dias_reserva', 'multa_diaria']
+CLAVE_VERSION = 'politicas_circulacion:version'
+
+_config = getattr(settings, 'POLITICAS_CIRCULACION', {})
+
+
+class Politica(namedtuple('Politica', CAMPOS)):
+    """Política resuelta: todos los campos tienen valor"""
+    __slots__ = ()
+
+    def multa(self, dias_retraso):
+        return self.multa_diaria * max(dias_retraso, 0)
+
+
+def politica_base():
+    """Valores de settings.POLITICAS_CIRCULACION['POR_DEFECTO'] (los de la biblioteca si faltan)"""
+    valores = {
+        'dias_prestamo': 15,
+        'max_renovaciones': 2,
+        'dias_renovacion': 15,
+        'dias_reserva': 3,
+        'multa_diaria': 5000,
+        **_config.get('POR_DEFECTO', {}),
+    }
+    valores['multa_diaria'] = Decimal(str(valores['multa_diaria']))
+    return Politica(**{campo: valores[campo] for campo in CAMPOS})
+
+
+class TablaPoliticas:
+    """Políticas resueltas por (rol, categoría), al día con la versión de la caché compartida"""
+
+    def __init__(self, intervalo=5, alias='default'):
+        self.intervalo = intervalo
+        self.alias = alias
+        self._tabla = {('', ''): politica_base()}
+        self._roles = frozenset()
+        self._categorias = frozenset()
+        self._version = None
+        self._cargada = False
+        self._ultima_lectura = 0.0
+        self._lock = threading.Lock()
+
+    def compilar(self, reglas, base):
+        """Resuelve la herencia de `reglas` (diccionarios con rol, categoria y CAMPOS) para cada combinación"""
+        por_clave = {(regla['rol'] or '', regla['categoria'] or ''): regla for regla in reglas}
+        roles = {rol for rol, _ in por_clave} | {''}
+        categorias = {categoria for _, categoria in por_clave} | {''}
+
+        tabla = {}
+        for rol in roles:
+            for categoria in categorias:
+                valores = base._asdict()
+                # De la regla más general a la más específica: la última que fija un campo gana
+                for clave in (('', ''), ('', categoria), (rol, ''), (rol, categoria)):
+                    regla = por_clave.get(clave)
+                    if regla is not None:
+                        valores.update({campo: regla[campo] for campo in CAMPOS if regla[campo] is not None})
+                tabla[(rol, categoria)] = Politica(**valores)
+
+        self._tabla = tabla
+        self._roles = frozenset(roles - {''})
+        self._categorias = frozenset(categorias - {''})
+        self._cargada = True
+
+    def _cargar(self):
+        reglas = PoliticaCirculacion.objects.filter(activa=True).values('rol', 'categoria', *CAMPOS)
+        self.compilar(list(reglas), politica_base())
+
+    def actualizar(self, forzar=False):
+        """Recompila si la versión compartida cambió (se comprueba como mucho una vez por intervalo)"""
+        if self._cargada and not forzar and time.monotonic() - self._ultima_lectura < self.intervalo:
+            return
+        with self._lock:
+            version = caches[self.alias].get(CLAVE_VERSION)
+            if forzar or not self._cargada or version != self._version:
+                self._cargar()
+                self._version = version
+            self._ultima_lectura = time.monotonic()
+
+    def obtener(self, rol, categoria):
+        rol = rol if rol in self._roles else ''
+        categoria = categoria if categoria in self._categorias else ''
+        return self._tabla[(rol, categoria)]
+
+    def publicar_cambio(self):
+        cache = caches[self.alias]
+        try:
+            cache.incr(CLAVE_VERSION)
+        except ValueError:
+            cache.set(CLAVE_VERSION, time.time_ns(), timeout=None)
+        self.actualizar(forzar=True)
+
+
+tabla_politicas = TablaPoliticas(
+    intervalo=_config.get('INTERVALO', 5),
+    alias=_config.get('ALIAS', 'default'),
+)
+
+
+def obtener(rol, categoria):
+    """Política vigente para un usuario de ese rol y un libro de esa categoría"""
+    tabla_politicas.actualizar()
+    return tabla_politicas.obtener(rol or '', categoria or '')
+
+
+def precalentar():
+    """Compila las políticas al arrancar el servidor (wsgi/asgi)"""
+    try:
+        tabla_politicas.actualizar(forzar=True)
+    except DatabaseError:
+        # Sin base de datos disponible todavía: se compilan en la primera consulta
+        pass
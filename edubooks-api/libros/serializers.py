@@ -1,15 +1,39 @@
 # libros/serializers.py
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Libro, Prestamo, Reserva, Bibliografia, Sancion
+from . import ejemplares, estado_cuenta, politicas
+from .models import (
+    Libro, Ejemplar, Prestamo, Reserva, Bibliografia, Sancion, LecturaPrograma, EventoCirculacion, Notificacion,
+    PoliticaCirculacion
+)
+from usuarios.campos import CamposParcialesMixin
 from usuarios.serializers import UsuarioPerfilSerializer
 
-class LibroSerializer(serializers.ModelSerializer):
+class LibroSerializer(CamposParcialesMixin, serializers.ModelSerializer):
     class Meta:
         model = Libro
         fields = '__all__'
         read_only_fields = ['fecha_registro']
+    
+    def validate(self, data):
+        # Con ejemplares registrados las cantidades se calculan a partir de ellos
+        if self.instance is not None:
+            cambios = [
+                campo for campo in ('cantidad_total', 'cantidad_disponible')
+                if campo in data and data[campo] != getattr(self.instance, campo)
+            ]
+            if cambios and ejemplares.tiene_ejemplares(self.instance.pk):
+                raise serializers.ValidationError(
+                    "Las cantidades de este libro se calculan a partir de sus ejemplares; registra o da de baja ejemplares."
+                )
+        return data
 
-class LibroDetalleSerializer(serializers.ModelSerializer):
+class LibroDetalleSerializer(CamposParcialesMixin, serializers.ModelSerializer):
     prestamos_activos = serializers.SerializerMethodField()
     reservas_activas = serializers.SerializerMethodField()
     
@@ -17,6 +41,8 @@ class LibroDetalleSerializer(serializers.ModelSerializer):
         model = Libro
         fields = '__all__'
         read_only_fields = ['fecha_registro']
+        # Los contadores solo necesitan la PK del libro
+        columnas_metodos = {'prestamos_activos': (), 'reservas_activas': ()}
     
     def get_prestamos_activos(self, obj):
         return obj.prestamos.filter(estado='Activo').count()
@@ -24,33 +50,176 @@ class LibroDetalleSerializer(serializers.ModelSerializer):
     def get_reservas_activas(self, obj):
         return obj.reservas.filter(estado='Activa').count()
 
-class PrestamoSerializer(serializers.ModelSerializer):
+class LibroCirculacionSerializer(CamposParcialesMixin, serializers.ModelSerializer):
+    """Detalle de libro con los contadores de circulación ya calculados (consulta por lotes)"""
+    prestamos_activos = serializers.IntegerField(read_only=True)
+    reservas_activas = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = Libro
+        fields = '__all__'
+
+class LibrosLoteSerializer(serializers.Serializer):
+    """Entrada para consultar varios libros por ID o por ISBN escaneado"""
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    isbns = serializers.ListField(child=serializers.CharField(max_length=20), required=False, default=list)
+    
+    def validate(self, data):
+        total = len(data['ids']) + len(data['isbns'])
+        if total == 0:
+            raise serializers.ValidationError("Debe indicar IDs o ISBN de libros.")
+        if total > 500:
+            raise serializers.ValidationError("No se pueden consultar más de 500 libros por petición.")
+        return data
+
+class EjemplarSerializer(serializers.ModelSerializer):
+    libro_titulo = serializers.CharField(source='libro.titulo', read_only=True)
+    codigo_barras = serializers.CharField(max_length=32, required=False)
+    
+    class Meta:
+        model = Ejemplar
+        fields = '__all__'
+        read_only_fields = ['fecha_registro']
+    
+    def validate_codigo_barras(self, value):
+        if Ejemplar.objects.filter(codigo_barras=value).exclude(pk=getattr(self.instance, 'pk', None)).exists():
+            raise serializers.ValidationError("Ya existe un ejemplar con este código de barras.")
+        return value
+    
+    def validate_libro(self, value):
+        if self.instance is not None and value.pk != self.instance.libro_id:
+            raise serializers.ValidationError("No se puede cambiar el libro de un ejemplar.")
+        return value
+    
+    def validate_estado(self, value):
+        anterior = getattr(self.instance, 'estado', None)
+        if value == 'Prestado' and anterior != 'Prestado':
+            raise serializers.ValidationError("Los ejemplares se marcan como prestados al registrar el préstamo.")
+        if anterior == 'Prestado' and value != 'Prestado':
+            raise serializers.ValidationError("El ejemplar está prestado; registra primero su devolución.")
+        return value
+    
+    def create(self, validated_data):
+        if not validated_data.get('codigo_barras'):
+            validated_data['codigo_barras'] = ejemplares.generar_codigos(validated_data['libro'].pk, 1)[0]
+        return super().create(validated_data)
+
+class PrestamoSerializer(CamposParcialesMixin, serializers.ModelSerializer):
     libro = LibroSerializer(read_only=True)
     usuario = UsuarioPerfilSerializer(read_only=True)
-    libro_id = serializers.IntegerField(write_only=True)
+    libro_id = serializers.IntegerField(write_only=True, required=False)
+    codigo_barras = serializers.CharField(write_only=True, required=False, max_length=32)
     
     class Meta:
         model = Prestamo
         fields = '__all__'
-        read_only_fields = ['fecha_prestamo', 'usuario']
+        read_only_fields = ['fecha_prestamo', 'usuario', 'ejemplar']
+        # Sin fecha, la política de circulación fija el plazo
+        extra_kwargs = {'fecha_devolucion_esperada': {'required': False}}
     
     def validate_libro_id(self, value):
         try:
             libro = Libro.objects.get(id=value)
             if libro.cantidad_disponible <= 0:
                 raise serializers.ValidationError("El libro no está disponible para préstamo.")
+            self.libro = libro
             return value
         except Libro.DoesNotExist:
             raise serializers.ValidationError("El libro no existe.")
     
+    def validate(self, data):
+        if self.instance is not None:
+            return data
+        codigo = data.get('codigo_barras')
+        if codigo:
+            # Préstamo en mostrador: el ejemplar escaneado determina el libro
+            ejemplar = Ejemplar.objects.select_related('libro').filter(codigo_barras=codigo).first()
+            if ejemplar is None:
+                raise serializers.ValidationError({'codigo_barras': "El ejemplar no existe."})
+            if ejemplar.estado != 'Disponible':
+                raise serializers.ValidationError({'codigo_barras': "El ejemplar no está disponible para préstamo."})
+            if data.get('libro_id', ejemplar.libro_id) != ejemplar.libro_id:
+                raise serializers.ValidationError({'codigo_barras': "El ejemplar no corresponde al libro indicado."})
+            data['libro_id'] = ejemplar.libro_id
+            self.libro = ejemplar.libro
+        elif 'libro_id' not in data:
+            raise serializers.ValidationError({'libro_id': "Debe indicar el libro o el código de barras del ejemplar."})
+        
+        politica = politicas.obtener(self.context['request'].user.rol, self.libro.categoria)
+        fecha = data.get('fecha_devolucion_esperada')
+        if fecha and fecha > date.today() + timedelta(days=politica.dias_prestamo):
+            raise serializers.ValidationError({
+                'fecha_devolucion_esperada': f"El plazo máximo de préstamo es de {politica.dias_prestamo} días."
+            })
+        return data
+    
     def create(self, validated_data):
         libro_id = validated_data.pop('libro_id')
-        libro = Libro.objects.get(id=libro_id)
-        validated_data['libro'] = libro
-        validated_data['usuario'] = self.context['request'].user
-        return super().create(validated_data)
+        codigo = validated_data.pop('codigo_barras', None)
+        with transaction.atomic():
+            # Solo se bloquea el ejemplar elegido: los préstamos de otras copias no esperan
+            if codigo:
+                ejemplar = ejemplares.bloquear_por_codigo(codigo)
+                if ejemplar is None or ejemplar.estado != 'Disponible':
+                    raise serializers.ValidationError({'codigo_barras': "El ejemplar no está disponible para préstamo."})
+            else:
+                ejemplar = ejemplares.tomar_ejemplar(libro_id)
+                if ejemplar is None and ejemplares.tiene_ejemplares(libro_id):
+                    raise serializers.ValidationError({'libro_id': "El libro no está disponible para préstamo."})
+            
+            validated_data['libro'] = self.libro
+            validated_data['ejemplar'] = ejemplar
+            validated_data['usuario'] = self.context['request'].user
+            return super().create(validated_data)
 
-class ReservaSerializer(serializers.ModelSerializer):
+class PoliticaCirculacionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PoliticaCirculacion
+        fields = '__all__'
+        read_only_fields = ['fecha_actualizacion']
+    
+    def validate_categoria(self, value):
+        return value.strip()
+
+class DevolucionLoteSerializer(serializers.Serializer):
+    """Entrada para devolver varios préstamos por ID, ISBN o código de barras del ejemplar escaneado"""
+    prestamos = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    isbns = serializers.ListField(child=serializers.CharField(max_length=20), required=False, default=list)
+    codigos = serializers.ListField(child=serializers.CharField(max_length=32), required=False, default=list)
+    
+    def validate(self, data):
+        total = len(data['prestamos']) + len(data['isbns']) + len(data['codigos'])
+        if total == 0:
+            raise serializers.ValidationError("Debe indicar préstamos, ISBN o códigos de barras para devolver.")
+        if total > 500:
+            raise serializers.ValidationError("No se pueden procesar más de 500 devoluciones por petición.")
+        return data
+
+class RenovacionLoteSerializer(serializers.Serializer):
+    """Entrada para renovar varios préstamos (sin IDs: todos los activos)"""
+    prestamos = serializers.ListField(
+        child=serializers.IntegerField(), required=False, max_length=500
+    )
+
+class RenovacionLoteAdminSerializer(RenovacionLoteSerializer):
+    """Renovación masiva de administración: de un usuario o de todos, con una extensión fija opcional"""
+    usuario_id = serializers.IntegerField(required=False)
+    dias = serializers.IntegerField(required=False, min_value=1, max_value=365)
+
+class HistorialPrestamoSerializer(serializers.Serializer):
+    """Préstamo del historial (tabla de préstamos o archivo) leído como diccionario de valores"""
+    id = serializers.IntegerField()
+    libro_id = serializers.IntegerField()
+    libro_titulo = serializers.CharField(source='libro__titulo')
+    libro_autor = serializers.CharField(source='libro__autor')
+    fecha_prestamo = serializers.DateTimeField()
+    fecha_devolucion_esperada = serializers.DateField()
+    fecha_devolucion_real = serializers.DateTimeField()
+    estado = serializers.CharField()
+    renovaciones = serializers.IntegerField()
+    archivado = serializers.BooleanField()
+
+class ReservaSerializer(CamposParcialesMixin, serializers.ModelSerializer):
     libro = LibroSerializer(read_only=True)
     usuario = UsuarioPerfilSerializer(read_only=True)
     libro_id = serializers.IntegerField(write_only=True)
@@ -80,7 +249,7 @@ class ReservaSerializer(serializers.ModelSerializer):
         validated_data['usuario'] = self.context['request'].user
         return super().create(validated_data)
 
-class BibliografiaSerializer(serializers.ModelSerializer):
+class BibliografiaSerializer(CamposParcialesMixin, serializers.ModelSerializer):
     docente = UsuarioPerfilSerializer(read_only=True)
     libros = LibroSerializer(many=True, read_only=True)
     libros_ids = serializers.ListField(
@@ -94,6 +263,7 @@ class BibliografiaSerializer(serializers.ModelSerializer):
         model = Bibliografia
         fields = '__all__'
         read_only_fields = ['fecha_creacion', 'docente']
+        columnas_metodos = {'total_libros': ()}
     
     def get_total_libros(self, obj):
         return obj.libros.count()
@@ -161,7 +331,52 @@ class BibliografiaSerializer(serializers.ModelSerializer):
         
         return bibliografia
 
-class SancionSerializer(serializers.ModelSerializer):
+class BibliografiaCompactaSerializer(CamposParcialesMixin, serializers.ModelSerializer):
+    """Bibliografía con IDs de libros; los datos de los libros se envían aparte, deduplicados"""
+    docente_nombre = serializers.CharField(source='docente.nombre', read_only=True)
+    docente_apellido = serializers.CharField(source='docente.apellido', read_only=True)
+    libros = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    total_libros = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Bibliografia
+        fields = [
+            'id', 'docente', 'docente_nombre', 'docente_apellido', 'curso', 'programa',
+            'descripcion', 'libros', 'total_libros', 'fecha_creacion', 'activa', 'es_publica'
+        ]
+        columnas_metodos = {'total_libros': ()}
+    
+    def get_total_libros(self, obj):
+        # Usa los libros precargados con prefetch_related
+        return len(obj.libros.all())
+
+class BibliografiaLibrosLoteSerializer(serializers.Serializer):
+    """Entrada para agregar y remover varios libros de una bibliografía en una sola petición"""
+    agregar = serializers.ListField(child=serializers.IntegerField(), required=False, default=list, max_length=500)
+    remover = serializers.ListField(child=serializers.IntegerField(), required=False, default=list, max_length=500)
+    
+    def validate(self, data):
+        if not data['agregar'] and not data['remover']:
+            raise serializers.ValidationError("Debe indicar libros para agregar o remover.")
+        
+        repetidos = set(data['agregar']) & set(data['remover'])
+        if repetidos:
+            raise serializers.ValidationError(
+                f"Los siguientes IDs aparecen para agregar y remover: {sorted(repetidos)}"
+            )
+        return data
+
+class LecturaProgramaSerializer(serializers.ModelSerializer):
+    libro_id = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = LecturaPrograma
+        fields = [
+            'libro_id', 'titulo', 'autor', 'categoria', 'imagen_portada',
+            'estado', 'cantidad_disponible', 'cursos'
+        ]
+
+class SancionSerializer(CamposParcialesMixin, serializers.ModelSerializer):
     usuario = UsuarioPerfilSerializer(read_only=True)
     prestamo = PrestamoSerializer(read_only=True)
     usuario_id = serializers.IntegerField(write_only=True, required=False)
@@ -197,12 +412,12 @@ class SancionSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 # Serializers para respuestas paginadas
-class LibroListSerializer(serializers.ModelSerializer):
+class LibroListSerializer(CamposParcialesMixin, serializers.ModelSerializer):
     class Meta:
         model = Libro
         fields = ['id', 'titulo', 'autor', 'categoria', 'estado', 'cantidad_disponible', 'imagen_portada']
 
-class PrestamoListSerializer(serializers.ModelSerializer):
+class PrestamoListSerializer(CamposParcialesMixin, serializers.ModelSerializer):
     libro = LibroListSerializer(read_only=True)
     usuario_nombre = serializers.CharField(source='usuario.nombre', read_only=True)
     usuario_apellido = serializers.CharField(source='usuario.apellido', read_only=True)
@@ -211,11 +426,106 @@ class PrestamoListSerializer(serializers.ModelSerializer):
         model = Prestamo
         fields = ['id', 'libro', 'usuario_nombre', 'usuario_apellido', 'fecha_prestamo', 'fecha_devolucion_esperada', 'estado']
 
-class ReservaListSerializer(serializers.ModelSerializer):
+class ReservaListSerializer(CamposParcialesMixin, serializers.ModelSerializer):
     libro = LibroListSerializer(read_only=True)
     usuario_nombre = serializers.CharField(source='usuario.nombre', read_only=True)
     usuario_apellido = serializers.CharField(source='usuario.apellido', read_only=True)
     
     class Meta:
         model = Reserva
-        fields = ['id', 'libro', 'usuario_nombre', 'usuario_apellido', 'fecha_reserva', 'estado', 'fecha_expiracion']
\ No newline at end of file
+        fields = ['id', 'libro', 'usuario_nombre', 'usuario_apellido', 'fecha_reserva', 'estado', 'fecha_expiracion']
+
+class EventoCirculacionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = EventoCirculacion
+        fields = ['id', 'entidad', 'entidad_id', 'accion', 'libro_id', 'usuario_id', 'datos', 'fecha']
+
+class NotificacionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Notificacion
+        fields = ['id', 'tipo', 'nivel', 'titulo', 'mensaje', 'leida', 'fecha']
+
+class PanelUsuarioSerializer(serializers.Serializer):
+    """Resumen del usuario para la pantalla de inicio, con un número fijo de consultas"""
+    usuario = serializers.SerializerMethodField()
+    prestamos = serializers.SerializerMethodField()
+    reservas = serializers.SerializerMethodField()
+    cuenta = serializers.SerializerMethodField()
+    bibliografias_programa = serializers.SerializerMethodField()
+    
+    CAMPOS_LIBRO = ['libro_id', 'libro__titulo', 'libro__autor', 'libro__imagen_portada']
+    
+    def _libro(self, fila):
+        return {
+            'id': fila['libro_id'],
+            'titulo': fila['libro__titulo'],
+            'autor': fila['libro__autor'],
+            'imagen_portada': fila['libro__imagen_portada'],
+        }
+    
+    def get_usuario(self, obj):
+        return UsuarioPerfilSerializer(obj).data
+    
+    def get_prestamos(self, obj):
+        hoy = timezone.localdate()
+        filas = Prestamo.objects.filter(
+            usuario=obj,
+            estado__in=estado_cuenta.ESTADOS_PRESTAMO_ABIERTOS
+        ).order_by('fecha_devolucion_esperada').values(
+            'id', 'fecha_prestamo', 'fecha_devolucion_esperada', 'estado', 'renovaciones', *self.CAMPOS_LIBRO
+        )
+        return [
+            {
+                'id': fila['id'],
+                'libro': self._libro(fila),
+                'fecha_prestamo': serializers.DateTimeField().to_representation(fila['fecha_prestamo']),
+                'fecha_devolucion_esperada': fila['fecha_devolucion_esperada'].isoformat(),
+                'dias_restantes': (fila['fecha_devolucion_esperada'] - hoy).days,
+                'estado': fila['estado'],
+                'renovaciones': fila['renovaciones'],
+            }
+            for fila in filas
+        ]
+    
+    def get_reservas(self, obj):
+        # Reservas activas del mismo libro hechas antes: la posición en la cola sale en la misma consulta
+        anteriores = Reserva.objects.filter(
+            libro_id=OuterRef('libro_id'),
+            estado='Activa',
+            fecha_reserva__lt=OuterRef('fecha_reserva')
+        ).order_by().values('libro_id').annotate(total=Count('id')).values('total')
+        
+        filas = Reserva.objects.filter(usuario=obj, estado='Activa').annotate(
+            anteriores=Coalesce(Subquery(anteriores), Value(0))
+        ).order_by('fecha_reserva').values(
+            'id', 'fecha_reserva', 'fecha_expiracion', 'anteriores', 'libro__cantidad_disponible', *self.CAMPOS_LIBRO
+        )
+        fecha = serializers.DateTimeField()
+        return [
+            {
+                'id': fila['id'],
+                'libro': self._libro(fila),
+                'fecha_reserva': fecha.to_representation(fila['fecha_reserva']),
+                'fecha_expiracion': fecha.to_representation(fila['fecha_expiracion']),
+                'posicion': fila['anteriores'] + 1,
+                'lista_para_recoger': fila['anteriores'] < fila['libro__cantidad_disponible'],
+            }
+            for fila in filas
+        ]
+    
+    def get_cuenta(self, obj):
+        datos = estado_cuenta.obtener(obj.pk)
+        bloqueado_hasta = datos['bloqueado_hasta']
+        if bloqueado_hasta and bloqueado_hasta <= timezone.now():
+            bloqueado_hasta = None
+        return {
+            'multas_pendientes': str(datos['multas_pendientes']),
+            'bloqueado_hasta': serializers.DateTimeField().to_representation(bloqueado_hasta) if bloqueado_hasta else None,
+        }
+    
+    def get_bibliografias_programa(self, obj):
+        if obj.rol == 'Docente':
+            return Bibliografia.objects.filter(docente=obj, activa=True).count()
+        if obj.carrera:
+            return Bibliografia.objects.filter(programa=obj.carrera, activa=True, es_publica=True).count()
+        return 0
@@ -0,0 +1,185 @@
+# libros/signals.py
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import circulacion, ejemplares, estado_cuenta, eventos, lecturas, politicas
+from .cache import invalidar_libros, invalidar_paneles
+from .indice_disponibilidad import CAMPOS_DISPONIBILIDAD, activo as indice_activo, indice_disponibilidad
+from .models import Bibliografia, Ejemplar, LecturaPrograma, Libro, PoliticaCirculacion, Prestamo, Reserva, Sancion
+from usuarios.models import Usuario
+
+
+@receiver([post_save, post_delete], sender=Libro)
+def invalidar_cache_libro(sender, instance, update_fields=None, **kwargs):
+    """Un cambio en el libro afecta a su detalle y a los listados del catálogo"""
+    # Los listados toman la disponibilidad del índice en memoria: prestar o devolver no los invalida
+    solo_disponibilidad = update_fields is not None and set(update_fields) <= CAMPOS_DISPONIBILIDAD
+    listados = not (solo_disponibilidad and indice_activo())
+    # Al confirmar: antes, una lectura concurrente guardaría la fila vieja bajo la versión nueva
+    libro_id = instance.pk
+    transaction.on_commit(lambda: invalidar_libros([libro_id], listados=listados))
+
+
+@receiver([post_save, post_delete], sender=Prestamo)
+@receiver([post_save, post_delete], sender=Reserva)
+def invalidar_cache_circulacion(sender, instance, **kwargs):
+    """Préstamos y reservas solo alteran los contadores del detalle del libro"""
+    libro_id = instance.libro_id
+    transaction.on_commit(lambda: invalidar_libros([libro_id], listados=False))
+
+
+@receiver(m2m_changed, sender=Bibliografia.libros.through)
+def versionar_bibliografias(sender, instance, action, reverse, pk_set, **kwargs):
+    """Agregar o quitar libros cambia la versión de las bibliografías afectadas"""
+    if reverse and action == 'pre_clear':
+        instance._bibliografias_version = list(instance.bibliografias.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    
+    if reverse:
+        ids = set(pk_set or ()) | set(getattr(instance, '_bibliografias_version', ()))
+    else:
+        ids = {instance.pk}
+    Bibliografia.objects.filter(pk__in=ids).update(fecha_actualizacion=timezone.now())
+
+
+# ============ EJEMPLARES ============
+
+@receiver([post_save, post_delete], sender=Ejemplar)
+def recontar_ejemplares_libro(sender, instance, origin=None, **kwargs):
+    """Registrar, editar o eliminar un ejemplar cambia las cantidades del libro"""
+    if isinstance(origin, Libro):
+        # El libro completo se está eliminando
+        return
+    ejemplares.recontar([instance.libro_id])
+
+
+# ============ POLÍTICAS DE CIRCULACIÓN ============
+
+@receiver([post_save, post_delete], sender=PoliticaCirculacion)
+def recompilar_politicas(sender, instance, **kwargs):
+    """Los workers recompilan su tabla de políticas al ver la nueva versión"""
+    transaction.on_commit(politicas.tabla_politicas.publicar_cambio)
+
+
+# ============ LISTAS DE LECTURA POR PROGRAMA ============
+
+@receiver(post_save, sender=Libro)
+def actualizar_lecturas_libro(sender, instance, created, **kwargs):
+    if not created:
+        lecturas.actualizar_libro(instance)
+
+
+@receiver(pre_save, sender=Bibliografia)
+def recordar_programa_anterior(sender, instance, **kwargs):
+    """Guarda el programa previo para refrescar también la lista de origen si cambia"""
+    if instance.pk:
+        instance._programa_anterior = (
+            Bibliografia.objects.filter(pk=instance.pk).values_list('programa', flat=True).first()
+        )
+
+
+@receiver([post_save, post_delete], sender=Bibliografia)
+def refrescar_lecturas_bibliografia(sender, instance, **kwargs):
+    lecturas.refrescar_programas([instance.programa, getattr(instance, '_programa_anterior', None)])
+
+
+@receiver(m2m_changed, sender=Bibliografia.libros.through)
+def refrescar_lecturas_libros_bibliografia(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+    
+    if not reverse:
+        if action != 'pre_clear':
+            lecturas.refrescar_programas([instance.programa])
+        return
+    
+    # Cambios desde el lado del libro: afectan a los programas de las bibliografías indicadas
+    # y a los programas en los que el libro ya figuraba
+    if action == 'pre_clear':
+        instance._programas_lecturas = set(
+            LecturaPrograma.objects.filter(libro=instance).values_list('programa', flat=True)
+        )
+        return
+    programas = set(getattr(instance, '_programas_lecturas', ()))
+    programas |= set(LecturaPrograma.objects.filter(libro=instance).values_list('programa', flat=True))
+    if pk_set:
+        programas |= set(Bibliografia.objects.filter(pk__in=pk_set).values_list('programa', flat=True))
+    lecturas.refrescar_programas(programas)
+
+
+# ============ ESTADO DE CUENTA ============
+
+@receiver([post_save, post_delete], sender=Sancion)
+@receiver([post_save, post_delete], sender=Prestamo)
+def recalcular_estado_cuenta(sender, instance, **kwargs):
+    """Sanciones, pagos y préstamos alteran la situación de circulación del usuario (se concilia al confirmar)"""
+    estado_cuenta.conciliar_al_confirmar([instance.usuario_id])
+
+
+# ============ EVENTOS DE CIRCULACIÓN (OUTBOX) ============
+
+@receiver(post_save, sender=Libro)
+@receiver(post_save, sender=Prestamo)
+@receiver(post_save, sender=Reserva)
+@receiver(post_save, sender=Sancion)
+def registrar_evento_guardado(sender, instance, created, **kwargs):
+    eventos.registrar(instance, 'creado' if created else 'actualizado')
+
+
+@receiver(post_delete, sender=Libro)
+@receiver(post_delete, sender=Prestamo)
+@receiver(post_delete, sender=Reserva)
+@receiver(post_delete, sender=Sancion)
+def registrar_evento_eliminado(sender, instance, **kwargs):
+    eventos.registrar(instance, 'eliminado')
+
+
+@receiver([post_save, post_delete], sender=Libro)
+def actualizar_indice_disponibilidad(sender, instance, **kwargs):
+    """El proceso que modifica un libro ve el cambio en su índice sin esperar al siguiente intervalo"""
+    if indice_disponibilidad.cargado:
+        transaction.on_commit(lambda: indice_disponibilidad.actualizar(forzar=True))
+
+
+# ============ PANEL DEL USUARIO ============
+
+@receiver([post_save, post_delete], sender=Prestamo)
+@receiver([post_save, post_delete], sender=Sancion)
+def invalidar_panel_usuario(sender, instance, **kwargs):
+    usuario_id = instance.usuario_id
+    transaction.on_commit(lambda: invalidar_paneles([usuario_id]))
+
+
+@receiver([post_save, post_delete], sender=Reserva)
+def invalidar_paneles_reserva(sender, instance, **kwargs):
+    """Una reserva cambia la posición en la cola de las demás reservas activas del libro"""
+    usuario_ids = set(
+        Reserva.objects.filter(libro_id=instance.libro_id, estado='Activa').values_list('usuario_id', flat=True)
+    )
+    usuario_ids.add(instance.usuario_id)
+    transaction.on_commit(lambda: invalidar_paneles(usuario_ids))
+
+
+@receiver(post_save, sender=Libro)
+def invalidar_paneles_disponibilidad(sender, instance, created, update_fields=None, **kwargs):
+    """Prestar, devolver o editar el libro cambia las reservas listas para recoger en el panel de otros usuarios"""
+    if created or (update_fields is not None and not set(update_fields) & CAMPOS_DISPONIBILIDAD):
+        return
+    circulacion.invalidar_paneles_reservas([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Bibliografia)
+def invalidar_paneles_bibliografia(sender, instance, **kwargs):
+    usuario_ids = [instance.docente_id]
+    programas = [instance.programa, getattr(instance, '_programa_anterior', None)]
+    transaction.on_commit(lambda: invalidar_paneles(usuario_ids, programas))
+
+
+@receiver(post_save, sender=Usuario)
+def invalidar_panel_perfil(sender, instance, **kwargs):
+    usuario_id = instance.pk
+    transaction.on_commit(lambda: invalidar_paneles([usuario_id]))
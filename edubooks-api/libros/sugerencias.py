@@ -0,0 +1,313 @@
+# libros/sugerencias.py
+"""
+Autocompletado de títulos y autores en memoria.
+
+El índice guarda el vocabulario normalizado (sin tildes ni mayúsculas) de
+títulos y autores en una lista ordenada: las palabras que empiezan por un
+prefijo forman un rango contiguo que se encuentra con bisect. Cada palabra
+tiene su lista de libros ordenada por popularidad (número de préstamos),
+así que los k más populares de un prefijo salen de mezclar esas listas y
+detenerse en cuanto hay k resultados. Los prefijos de una o dos letras,
+que abarcan miles de palabras, se memorizan.
+
+Se carga al arrancar y se mantiene al día con la bandeja de salida
+(libros.eventos): los préstamos nuevos suman popularidad y los libros
+creados, editados o eliminados se vuelven a indexar. Cada
+INTERVALO_RECONCILIACION segundos se reconstruye desde la base, por si un
+evento se confirmó después de que el cursor lo diera por perdido.
+"""
+import functools
+import heapq
+import itertools
+import re
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Count, Max
+
+from . import eventos
+from .models import EventoCirculacion, Libro, Prestamo, PrestamoHistorico
+
+TAMANO_LOTE = 5000
+LONGITUD_MEMO = 2
+LIMITE_MEMO = 50
+# Libros recorridos como máximo en consultas de varias palabras muy poco selectivas
+LIMITE_CANDIDATOS = 50000
+MAXIMO_PALABRAS = 5
+
+_config = getattr(settings, 'SUGERENCIAS', {})
+
+
+def normalizar(texto):
+    """Minúsculas sin tildes ni diacríticos ('Márquez' -> 'marquez')"""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).casefold()
+
+
+@functools.lru_cache(maxsize=65536)
+def _normalizar_palabra(palabra):
+    return normalizar(palabra)
+
+
+def palabras(texto):
+    """Palabras normalizadas, sin repetir y en orden"""
+    # Se normaliza palabra a palabra: el vocabulario se repite mucho y la caché evita el NFKD
+    return list(dict.fromkeys(map(_normalizar_palabra, re.findall(r'\w+', (texto or '').casefold()))))
+
+
+class IndiceSugerencias:
+    """Vocabulario ordenado con listas de libros por popularidad"""
+
+    def __init__(self, intervalo=1, intervalo_reconciliacion=600):
+        self.intervalo = intervalo
+        self.intervalo_reconciliacion = intervalo_reconciliacion
+        self._palabras = []
+        self._id_palabra = {}
+        self._ordenadas = []
+        self._ordenadas_ids = []
+        self._libros = []
+        # Palabras de cada libro en formato compacto (inicio por ID), más los libros reindexados
+        self._inicio = array('i')
+        self._tokens = array('i')
+        self._modificados = {}
+        self._popularidad = array('i')
+        self._memo = {}
+        self._cursor = None
+        self._ultima_lectura = 0.0
+        self._ultima_reconciliacion = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def cargado(self):
+        return self._cursor is not None
+
+    # ---- Construcción ----
+
+    def _id(self, palabra):
+        token = self._id_palabra.get(palabra)
+        if token is None:
+            token = len(self._palabras)
+            self._palabras.append(palabra)
+            self._id_palabra[palabra] = token
+            self._libros.append(array('i'))
+            posicion = bisect_left(self._ordenadas, palabra)
+            self._ordenadas.insert(posicion, palabra)
+            self._ordenadas_ids.insert(posicion, token)
+        return token
+
+    def construir(self, filas, maximo_id, popularidad, cursor=0):
+        """Reemplaza el contenido con `filas` (id, titulo, autor; ordenadas por ID) y `popularidad` {id: préstamos}"""
+        populares = array('i', [0]) * (maximo_id + 1)
+        for libro_id, total in popularidad.items():
+            if libro_id <= maximo_id:
+                populares[libro_id] = total
+
+        vocabulario = {}
+        libros = []
+        inicio = array('i', [0]) * (maximo_id + 2)
+        tokens = array('i')
+        anterior = 0
+        for libro_id, titulo, autor in filas:
+            for hueco in range(anterior + 1, libro_id + 1):
+                inicio[hueco] = len(tokens)
+            for palabra in palabras(f'{titulo} {autor}'):
+                token = vocabulario.get(palabra)
+                if token is None:
+                    token = vocabulario[palabra] = len(libros)
+                    libros.append([])
+                libros[token].append(libro_id)
+                tokens.append(token)
+            anterior = libro_id
+        for hueco in range(anterior + 1, maximo_id + 2):
+            inicio[hueco] = len(tokens)
+
+        lista_palabras = list(vocabulario)
+        orden = sorted(range(len(lista_palabras)), key=lista_palabras.__getitem__)
+        self._palabras, self._id_palabra = lista_palabras, vocabulario
+        self._ordenadas = [lista_palabras[token] for token in orden]
+        self._ordenadas_ids = orden
+        self._libros = [array('i', sorted(ids, key=populares.__getitem__, reverse=True)) for ids in libros]
+        self._inicio, self._tokens, self._popularidad = inicio, tokens, populares
+        self._modificados = {}
+        self._memo = {}
+        self._cursor = cursor
+
+    def _cargar_de_base(self):
+        cursor = eventos.ultimo_cursor()
+        maximo_id = Libro.objects.aggregate(maximo=Max('id'))['maximo'] or 0
+        popularidad = {}
+        for modelo in (Prestamo, PrestamoHistorico):
+            for libro_id, total in modelo.objects.order_by().values('libro_id').annotate(
+                total=Count('id')
+            ).values_list('libro_id', 'total'):
+                popularidad[libro_id] = popularidad.get(libro_id, 0) + total
+        filas = Libro.objects.order_by('id').values_list('id', 'titulo', 'autor').iterator(chunk_size=TAMANO_LOTE)
+        self.construir(filas, maximo_id, popularidad, cursor)
+        self._ultima_reconciliacion = time.monotonic()
+
+    # ---- Actualización ----
+
+    def _tokens_de(self, libro_id):
+        if libro_id in self._modificados:
+            return self._modificados[libro_id]
+        if libro_id + 1 < len(self._inicio):
+            return tuple(self._tokens[self._inicio[libro_id]:self._inicio[libro_id + 1]])
+        return ()
+
+    def _olvidar_memo(self, tokens):
+        for token in tokens:
+            palabra = self._palabras[token]
+            for longitud in range(1, LONGITUD_MEMO + 1):
+                self._memo.pop(palabra[:longitud], None)
+
+    def _popularidad_de(self, libro_id):
+        return self._popularidad[libro_id] if libro_id < len(self._popularidad) else 0
+
+    def _subir(self, lista, posicion):
+        """Mueve hacia delante el libro de `posicion` hasta respetar el orden por popularidad"""
+        libro_id = lista[posicion]
+        popularidad = self._popularidad_de(libro_id)
+        while posicion > 0 and self._popularidad_de(lista[posicion - 1]) < popularidad:
+            lista[posicion] = lista[posicion - 1]
+            posicion -= 1
+        lista[posicion] = libro_id
+
+    def _sumar_prestamo(self, libro_id):
+        if libro_id >= len(self._popularidad):
+            self._popularidad.extend(array('i', [0]) * (libro_id + 1 - len(self._popularidad)))
+        self._popularidad[libro_id] += 1
+        tokens = self._tokens_de(libro_id)
+        for token in tokens:
+            lista = self._libros[token]
+            self._subir(lista, lista.index(libro_id))
+        self._olvidar_memo(tokens)
+
+    def _reindexar(self, libro_id, titulo=None, autor=None):
+        """Actualiza las palabras de un libro (sin título: el libro se eliminó)"""
+        nuevos = () if titulo is None else tuple(self._id(p) for p in palabras(f'{titulo} {autor}'))
+        viejos = self._tokens_de(libro_id)
+        if set(nuevos) == set(viejos):
+            return
+        for token in set(viejos) - set(nuevos):
+            self._libros[token].remove(libro_id)
+        for token in set(nuevos) - set(viejos):
+            lista = self._libros[token]
+            lista.append(libro_id)
+            self._subir(lista, len(lista) - 1)
+        self._modificados[libro_id] = nuevos
+        self._olvidar_memo(set(viejos) | set(nuevos))
+
+    def _aplicar_eventos(self):
+        queryset = EventoCirculacion.objects.filter(
+            entidad__in=['Libro', 'Prestamo']
+        ).values_list('id', 'entidad', 'entidad_id', 'accion', 'libro_id')
+        while True:
+            # Solo hasta el horizonte: un evento confirmado tarde con un ID menor no se pierde
+            lote, self._cursor, hay_mas = eventos.leer(queryset, self._cursor, TAMANO_LOTE)
+            libros = set()
+            for _, entidad, entidad_id, accion, libro_id in lote:
+                if entidad == 'Prestamo' and accion == 'creado' and libro_id:
+                    self._sumar_prestamo(libro_id)
+                elif entidad == 'Libro':
+                    libros.add(entidad_id)
+            if libros:
+                actuales = {
+                    libro_id: (titulo, autor)
+                    for libro_id, titulo, autor in Libro.objects.filter(id__in=libros).values_list('id', 'titulo', 'autor')
+                }
+                for libro_id in libros:
+                    self._reindexar(libro_id, *actuales.get(libro_id, (None, None)))
+            if not hay_mas:
+                return
+
+    def actualizar(self, forzar=False):
+        """Carga el índice si hace falta y aplica los eventos nuevos (como mucho una vez por intervalo)"""
+        if self.cargado and not forzar and time.monotonic() - self._ultima_lectura < self.intervalo:
+            return
+        with self._lock:
+            if not self.cargado or time.monotonic() - self._ultima_reconciliacion >= self.intervalo_reconciliacion:
+                self._cargar_de_base()
+            self._aplicar_eventos()
+            self._ultima_lectura = time.monotonic()
+
+    # ---- Consultas (solo memoria) ----
+
+    def _rango(self, prefijo):
+        inicio = bisect_left(self._ordenadas, prefijo)
+        fin = bisect_left(self._ordenadas, prefijo + '\U0010ffff', inicio)
+        return self._ordenadas_ids[inicio:fin]
+
+    def _por_popularidad(self, tokens):
+        """Libros de las palabras dadas, de más a menos popular y sin repetir"""
+        vistos = set()
+        listas = [self._libros[token] for token in tokens]
+        for libro_id in heapq.merge(*listas, key=self._popularidad_de, reverse=True):
+            if libro_id not in vistos:
+                vistos.add(libro_id)
+                yield libro_id
+
+    def buscar(self, consulta, limite=10):
+        """IDs de los `limite` libros más populares cuyo título o autor contiene palabras con esos prefijos"""
+        prefijos = palabras(consulta)[:MAXIMO_PALABRAS]
+        if not prefijos:
+            return []
+
+        if len(prefijos) == 1 and len(prefijos[0]) <= LONGITUD_MEMO:
+            memo = self._memo.get(prefijos[0])
+            if memo is None:
+                memo = self._memo[prefijos[0]] = list(
+                    itertools.islice(self._por_popularidad(self._rango(prefijos[0])), LIMITE_MEMO)
+                )
+            return memo[:limite]
+
+        rangos = [self._rango(prefijo) for prefijo in prefijos]
+        # Se recorre la palabra más selectiva y se comprueban las demás en las palabras de cada libro
+        tamanos = [sum(len(self._libros[token]) for token in rango) for rango in rangos]
+        guia = tamanos.index(min(tamanos))
+        restantes = [prefijo for posicion, prefijo in enumerate(prefijos) if posicion != guia]
+
+        resultado = []
+        for recorridos, libro_id in enumerate(self._por_popularidad(rangos[guia])):
+            if recorridos >= LIMITE_CANDIDATOS or len(resultado) >= limite:
+                break
+            propias = [self._palabras[token] for token in self._tokens_de(libro_id)]
+            if all(any(palabra.startswith(prefijo) for palabra in propias) for prefijo in restantes):
+                resultado.append(libro_id)
+        return resultado
+
+    def popularidad(self, libro_id):
+        return self._popularidad_de(libro_id)
+
+    def memoria(self):
+        """Bytes aproximados del vocabulario, las listas de libros y los arrays"""
+        arrays = [self._inicio, self._tokens, self._popularidad, *self._libros]
+        return (
+            sum(a.buffer_info()[1] * a.itemsize + 64 for a in arrays)
+            + sum(sys.getsizeof(palabra) for palabra in self._palabras)
+            + sys.getsizeof(self._palabras) + sys.getsizeof(self._ordenadas)
+            + sys.getsizeof(self._ordenadas_ids) + sys.getsizeof(self._id_palabra)
+            + sys.getsizeof(self._libros)
+        )
+
+
+indice_sugerencias = IndiceSugerencias(
+    intervalo=_config.get('INTERVALO', 1),
+    intervalo_reconciliacion=_config.get('INTERVALO_RECONCILIACION', 600),
+)
+
+
+def precalentar():
+    """Carga el índice al arrancar el servidor (wsgi/asgi)"""
+    if not _config.get('PRECALENTAR', True):
+        return
+    try:
+        indice_sugerencias.actualizar(forzar=True)
+    except DatabaseError:
+        # Sin base de datos disponible todavía: el índice se carga en la primera petición
+        pass
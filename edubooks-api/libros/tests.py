@@ -1,3 +1,1822 @@
-from django.test import TestCase
+import gzip
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from edubooks import compresion, renderers, replicas
+from usuarios.models import Usuario
+from .cache import cache_catalogo, cache_paneles
+from .middleware import TransaccionEscrituraMiddleware
+from .indice_disponibilidad import IndiceDisponibilidad
+from .sugerencias import IndiceSugerencias
+from . import (
+    circulacion, disponibilidad, duplicados, ejemplares, estado_cuenta, eventos, lecturas, notificaciones, politicas,
+    views
+)
+from .models import (
+    Bibliografia, Ejemplar, EstadoCuenta, EventoCirculacion, LecturaPrograma, Libro, Notificacion, PoliticaCirculacion,
+    Prestamo, PrestamoHistorico, Reserva, Sancion, TransicionSancion
+)
+
+
+def crear_usuario(rol, sufijo, **extra):
+    datos = {
+        'Estudiante': {'matricula': f'M{sufijo}', 'carrera': 'Sistemas'},
+        'Docente': {'numero_empleado': f'N{sufijo}', 'departamento': 'Ingeniería'},
+        'Administrador': {'area': 'Biblioteca'},
+    }[rol]
+    return Usuario.objects.create_user(
+        f'{sufijo}@edubooks.test', sufijo, 'clave-segura-123',
+        nombre=rol, apellido=sufijo, rol=rol, **{**datos, **extra}
+    )
+
+
+def crear_libro(numero, **extra):
+    datos = {
+        'titulo': f'Libro {numero}',
+        'autor': f'Autor {numero}',
+        'isbn': f'978{numero:010d}',
+        'categoria': 'Programación',
+        'ubicacion': 'A1',
+        'cantidad_total': 2,
+        'cantidad_disponible': 2,
+        **extra,
+    }
+    return Libro.objects.create(**datos)
+
+
+def crear_bibliografia(docente, curso, libros=(), **extra):
+    bibliografia = Bibliografia.objects.create(
+        docente=docente, curso=curso, programa=extra.pop('programa', 'Sistemas'), **extra
+    )
+    bibliografia.libros.add(*libros)
+    return bibliografia
+
+
+class EdubooksTestCase(TestCase):
+    """Base de las pruebas: usuarios de cada rol y cachés vacías"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.estudiante = crear_usuario('Estudiante', 'est')
+        cls.docente = crear_usuario('Docente', 'doc')
+        cls.admin = crear_usuario('Administrador', 'adm')
+
+    def setUp(self):
+        caches['default'].clear()
+        cache_catalogo.local.clear()
+        cache_paneles.local.clear()
+        # La tabla de políticas vive en memoria: no debe conservar reglas de otras pruebas
+        politicas.tabla_politicas.actualizar(forzar=True)
+        # Cada lectura recalcula el horizonte: las pruebas leen justo después de escribir
+        parche = mock.patch.object(eventos, 'INTERVALO_HORIZONTE', 0)
+        parche.start()
+        self.addCleanup(parche.stop)
+        eventos._horizontes.clear()
+
+    def cliente(self, usuario):
+        cliente = APIClient()
+        cliente.force_authenticate(usuario)
+        return cliente
+
+
+# ============ CACHÉ DEL CATÁLOGO ============
+
+class CacheCatalogoTests(EdubooksTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.libro = crear_libro(1)
+
+    def test_listado_se_sirve_de_cache_hasta_que_cambia_un_libro(self):
+        cliente = self.cliente(self.estudiante)
+        self.assertEqual(cliente.get('/api/libros/').json()['results'][0]['titulo'], 'Libro 1')
+
+        # Un UPDATE sin señales no invalida: la respuesta sigue viniendo de la caché
+        Libro.objects.filter(pk=self.libro.pk).update(titulo='Cambiado sin señales')
+        self.assertEqual(cliente.get('/api/libros/').json()['results'][0]['titulo'], 'Libro 1')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.libro.refresh_from_db()
+            self.libro.titulo = 'Título nuevo'
+            self.libro.save()
+        self.assertEqual(cliente.get('/api/libros/').json()['results'][0]['titulo'], 'Título nuevo')
+
+    def test_la_version_cambia_al_confirmar(self):
+        version = cache_catalogo.version(f'libro:{self.libro.pk}')
+        with self.captureOnCommitCallbacks() as al_confirmar:
+            self.libro.titulo = 'Sin confirmar'
+            self.libro.save()
+            Reserva.objects.create(libro=self.libro, usuario=self.estudiante)
+            # Una lectura concurrente aún ve la fila anterior: no debe guardarse bajo una versión nueva
+            self.assertEqual(cache_catalogo.version(f'libro:{self.libro.pk}'), version)
+
+        for callback in al_confirmar:
+            callback()
+        self.assertNotEqual(cache_catalogo.version(f'libro:{self.libro.pk}'), version)
+
+    def test_cada_rol_tiene_su_propia_entrada(self):
+        self.cliente(self.estudiante).get(f'/api/libros/{self.libro.pk}/')
+        Libro.objects.filter(pk=self.libro.pk).update(titulo='Cambiado sin señales')
+
+        self.assertEqual(self.cliente(self.estudiante).get(f'/api/libros/{self.libro.pk}/').json()['titulo'], 'Libro 1')
+        self.assertEqual(
+            self.cliente(self.admin).get(f'/api/libros/{self.libro.pk}/').json()['titulo'], 'Cambiado sin señales'
+        )
+
+    def test_parametros_normalizados_comparten_entrada(self):
+        cliente = self.cliente(self.estudiante)
+        cliente.get('/api/libros/?titulo=Libro')
+        Libro.objects.filter(pk=self.libro.pk).update(titulo='Libro cambiado')
+        self.assertEqual(cliente.get('/api/libros/?titulo=LIBRO%20').json()['results'][0]['titulo'], 'Libro 1')
+
+    def test_eliminar_libro_invalida_el_detalle(self):
+        cliente = self.cliente(self.estudiante)
+        self.assertEqual(cliente.get(f'/api/libros/{self.libro.pk}/').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cliente(self.admin).delete(f'/api/libros/{self.libro.pk}/eliminar/')
+        self.assertEqual(cliente.get(f'/api/libros/{self.libro.pk}/').status_code, 404)
+
+
+# ============ BIBLIOGRAFÍAS COMPACTAS ============
+
+class BibliografiaCompactaTests(EdubooksTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.libros = [crear_libro(numero) for numero in range(1, 4)]
+        crear_bibliografia(self.docente, 'Algoritmos', self.libros[:2])
+        crear_bibliografia(self.docente, 'Estructuras', self.libros[1:])
+
+    def test_listado_envia_ids_y_libros_deduplicados_aparte(self):
+        datos = self.cliente(self.estudiante).get('/api/bibliografias/').json()
+
+        self.assertEqual(
+            sorted(sorted(b['libros']) for b in datos['results']),
+            [[self.libros[0].pk, self.libros[1].pk], [self.libros[1].pk, self.libros[2].pk]]
+        )
+        self.assertEqual(set(datos['libros']), {str(libro.pk) for libro in self.libros})
+        self.assertEqual(datos['libros'][str(self.libros[1].pk)]['titulo'], 'Libro 2')
+        self.assertEqual({b['total_libros'] for b in datos['results']}, {2})
+
+    def test_expand_libros_incrusta_los_libros_completos(self):
+        datos = self.cliente(self.estudiante).get('/api/bibliografias/?expand=libros').json()
+
+        self.assertNotIn('libros', datos)
+        self.assertEqual(datos['results'][0]['libros'][0]['isbn'][:3], '978')
+
+    def test_consultas_constantes_con_mas_bibliografias(self):
+        cliente = self.cliente(self.estudiante)
+        with self.assertNumQueries(3):
+            cliente.get('/api/bibliografias/')
+        for numero in range(4, 10):
+            crear_bibliografia(self.docente, f'Curso {numero}', [crear_libro(numero)])
+        with self.assertNumQueries(3):
+            cliente.get('/api/bibliografias/')
+
+
+# ============ LIBROS DE BIBLIOGRAFÍAS EN LOTE ============
+
+class BibliografiaLibrosLoteTests(EdubooksTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.libros = [crear_libro(numero) for numero in range(1, 5)]
+        self.bibliografia = crear_bibliografia(self.docente, 'Algoritmos', self.libros[:2])
+        self.url = f'/api/bibliografias/{self.bibliografia.pk}/libros/'
+
+    def test_agrega_y_remueve_en_una_operacion(self):
+        antes = Bibliografia.objects.get(pk=self.bibliografia.pk).fecha_actualizacion
+        r = self.cliente(self.docente).post(self.url, {
+            'agregar': [self.libros[1].pk, self.libros[2].pk, self.libros[3].pk],
+            'remover': [self.libros[0].pk],
+        }, format='json')
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.data['agregados'], [self.libros[2].pk, self.libros[3].pk])
+        self.assertEqual(r.data['removidos'], [self.libros[0].pk])
+        self.assertEqual(r.data['ya_presentes'], [self.libros[1].pk])
+        self.assertEqual(r.data['total_libros'], 3)
+        self.assertEqual(
+            set(self.bibliografia.libros.values_list('id', flat=True)), {libro.pk for libro in self.libros[1:]}
+        )
+        self.assertGreater(Bibliografia.objects.get(pk=self.bibliografia.pk).fecha_actualizacion, antes)
+
+    def test_libros_inexistentes_no_cambian_nada(self):
+        r = self.cliente(self.docente).post(self.url, {'agregar': [self.libros[2].pk, 99999]}, format='json')
+
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(self.bibliografia.libros.count(), 2)
+
+    def test_mismo_libro_para_agregar_y_remover(self):
+        r = self.cliente(self.docente).post(
+            self.url, {'agregar': [self.libros[2].pk], 'remover': [self.libros[2].pk]}, format='json'
+        )
+        self.assertEqual(r.status_code, 400)
+
+    def test_solo_el_docente_propietario(self):
+        otro = crear_usuario('Docente', 'doc2')
+        r = self.cliente(otro).post(self.url, {'agregar': [self.libros[2].pk]}, format='json')
+        self.assertEqual(r.status_code, 404)
+
+
+# ============ LISTAS DE LECTURA POR PROGRAMA ============
+
+class LecturasProgramaTests(EdubooksTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.libros = [crear_libro(numero) for numero in range(1, 5)]
+        self.algoritmos = crear_bibliografia(self.docente, 'Algoritmos', self.libros[:2])
+        self.estructuras = crear_bibliografia(self.docente, 'Estructuras', self.libros[1:3])
+        crear_bibliografia(self.docente, 'Privada', [self.libros[3]], es_publica=False)
+
+    def lecturas(self):
+        return {
+            fila['libro_id']: fila['cursos']
+            for fila in self.cliente(self.estudiante).get('/api/mis-lecturas/').json()['results']
+        }
+
+    def test_lista_del_programa_con_cursos(self):
+        self.assertEqual(self.lecturas(), {
+            self.libros[0].pk: ['Algoritmos'],
+            self.libros[1].pk: ['Algoritmos', 'Estructuras'],
+            self.libros[2].pk: ['Estructuras'],
+        })
+
+    def test_refresco_solo_escribe_las_diferencias(self):
+        intactas = dict(
+            LecturaPrograma.objects.filter(libro__in=self.libros[1:3]).values_list('libro_id', 'id')
+        )
+        self.algoritmos.libros.remove(self.libros[0], self.libros[1])
+
+        self.assertEqual(self.lecturas(), {self.libros[1].pk: ['Estructuras'], self.libros[2].pk: ['Estructuras']})
+        # Los libros que siguen en el programa conservan su fila
+        self.assertEqual(
+            dict(LecturaPrograma.objects.filter(libro__in=self.libros[1:3]).values_list('libro_id', 'id')), intactas
+        )
+
+    def test_cambios_del_libro_se_propagan(self):
+        self.libros[2].titulo = 'Nuevo título'
+        self.libros[2].save()
+        self.assertEqual(LecturaPrograma.objects.get(libro=self.libros[2]).titulo, 'Nuevo título')
+
+    def test_insercion_concurrente_del_mismo_libro(self):
+        """Otra actualización del programa inserta la fila entre la lectura y el upsert"""
+        Through = Bibliografia.libros.through
+        Through.objects.create(bibliografia=self.estructuras, libro=self.libros[3])
+        filtrar = Libro.objects.filter
+
+        def insertar_antes(*args, **kwargs):
+            LecturaPrograma.objects.create(
+                programa='Sistemas', libro=self.libros[3], titulo='Libro 4', autor='Autor 4',
+                categoria='Programación', estado='Disponible', cantidad_disponible=2, cursos=['Otro']
+            )
+            return filtrar(*args, **kwargs)
+
+        with mock.patch.object(Libro.objects, 'filter', side_effect=insertar_antes):
+            lecturas.refrescar_programas(['Sistemas'])
+
+        self.assertEqual(LecturaPrograma.objects.get(libro=self.libros[3]).cursos, ['Estructuras'])
+
+
+# ============ ESTADO DE CUENTA ============
+
+class EstadoCuentaTests(EdubooksTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.libro = crear_libro(1)
+
+    def prestar(self, usuario):
+        return self.cliente(usuario).post('/api/prestamos/crear/', {'libro_id': self.libro.pk}, format='json')
+
+    def test_multa_bloquea_y_pagarla_desbloquea(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            multa = Sancion.objects.create(
+                usuario=self.estudiante, tipo='Multa', monto=Decimal('3000'), descripcion='Retraso'
+            )
+        r = self.prestar(self.estudiante)
+        self.assertEqual(r.status_code, 400)
+        self.assertIn('multas pendientes', str(r.data))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            r = self.cliente(self.estudiante).post(f'/api/sanciones/{multa.pk}/pagar/')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(self.prestar(self.estudiante).status_code, 201)
+
+    def test_suspension_vencida_no_bloquea(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Sancion.objects.create(
+                usuario=self.estudiante, tipo='Suspensión', descripcion='Pasada',
+                fecha_fin=timezone.now() - timedelta(days=1)
+            )
+        self.assertIsNone(estado_cuenta.motivo_bloqueo(self.estudiante))
+
+    def test_la_cache_solo_cambia_al_confirmar(self):
+        estado_cuenta.obtener(self.estudiante.pk)
+        with self.captureOnCommitCallbacks(execute=False) as pendientes:
+            Sancion.objects.create(usuario=self.estudiante, tipo='Multa', monto=Decimal('100'), descripcion='x')
+        self.assertEqual(estado_cuenta.obtener(self.estudiante.pk)['multas_pendientes'], 0)
+        # La conciliación escribe la caché al confirmar su propia transacción
+        with self.captureOnCommitCallbacks(execute=True):
+            for callback in pendientes:
+                callback()
+        self.assertEqual(estado_cuenta.obtener(self.estudiante.pk)['multas_pendientes'], Decimal('100'))
+
+    def test_una_conciliacion_por_transaccion(self):
+        with mock.patch.object(estado_cuenta, 'conciliar', wraps=estado_cuenta.conciliar) as conciliar:
+            with self.captureOnCommitCallbacks(execute=True):
+                Sancion.objects.create(usuario=self.estudiante, tipo='Multa', monto=Decimal('100'), descripcion='x')
+                Sancion.objects.create(usuario=self.docente, tipo='Multa', monto=Decimal('50'), descripcion='y')
+                Prestamo.objects.create(libro=self.libro, usuario=self.estudiante)
+        conciliar.assert_called_once_with({self.estudiante.pk, self.docente.pk})
+        estado = EstadoCuenta.objects.get(usuario=self.estudiante)
+        self.assertEqual((estado.multas_pendientes, estado.prestamos_activos), (Decimal('100'), 1))
+        self.assertIsNotNone(estado_cuenta.motivo_bloqueo(self.docente))
+
+    def test_conciliar_corrige_cambios_sin_senales(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            multa = Sancion.objects.create(usuario=self.docente, tipo='Multa', monto=Decimal('500'), descripcion='x')
+        Sancion.objects.filter(pk=multa.pk).update(estado='Pagada')
+        self.assertIsNotNone(estado_cuenta.motivo_bloqueo(self.docente))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('conciliar_estados_cuenta', stdout=StringIO())
+        self.assertIsNone(estado_cuenta.motivo_bloqueo(self.docente))
+        self.assertEqual(EstadoCuenta.objects.get(usuario=self.docente).multas_pendientes, 0)
+
+
+# ============ BARRIDO DE SUSPENSIONES ============
+
+class CompletarSuspensionesTests(EdubooksTestCase):
+
+    def suspender(self, usuario, dias):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Sancion.objects.create(
+                usuario=usuario, tipo='Suspensión', descripcion='Retraso',
+                fecha_fin=timezone.now() + timedelta(days=dias)
+            )
+
+    def test_completa_solo_las_vencidas_por_lotes(self):
+        vencidas = [self.suspender(self.estudiante, -dias) for dias in (1, 2, 3)]
+        vigente = self.suspender(self.docente, 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('completar_suspensiones', lote=2, stdout=StringIO())
+
+        self.assertEqual(
+            set(Sancion.objects.filter(estado='Completada').values_list('id', flat=True)),
+            {sancion.pk for sancion in vencidas}
+        )
+        self.assertEqual(Sancion.objects.get(pk=vigente.pk).estado, 'Activa')
+        self.assertEqual(TransicionSancion.objects.filter(estado_nuevo='Completada').count(), 3)
+        self.assertEqual(
+            EventoCirculacion.objects.filter(entidad='Sancion', accion='actualizado').count(), 3
+        )
+
+    def test_es_idempotente(self):
+        self.suspender(self.estudiante, -1)
+        call_command('completar_suspensiones', stdout=StringIO())
+        call_command('completar_suspensiones', stdout=StringIO())
+        self.assertEqual(TransicionSancion.objects.count(), 1)
+
+    def test_concilia_el_estado_de_cuenta(self):
+        sancion = self.suspender(self.estudiante, 1)
+        self.assertIsNotNone(estado_cuenta.motivo_bloqueo(self.estudiante))
+
+        Sancion.objects.filter(pk=sancion.pk).update(fecha_fin=timezone.now() - timedelta(minutes=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('completar_suspensiones', stdout=StringIO())
+        self.assertIsNone(EstadoCuenta.objects.get(usuario=self.estudiante).bloqueado_hasta)
+
+
+# ============ RÉPLICAS DE LECTURA ============
+
+class UsuarioFicticio:
+    is_authenticated = True
+
+    def __init__(self, pk):
+        self.pk = pk
+
+
+@override_settings(DB_REPLICA_MAX_LAG_S=10, DB_REPLICA_PEGADO_S=10)
+class ReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        self.retrasos = {'replica1': 0.5, 'replica2': 30}
+        for parche in (
+            mock.patch.object(replicas, 'replicas_configuradas', return_value=list(self.retrasos)),
+            mock.patch.object(replicas.estado_replicas, 'retraso', side_effect=self.retrasos.get),
+        ):
+            parche.start()
+            self.addCleanup(parche.stop)
+        self.fabrica = RequestFactory()
+
+    def lectura(self, usuario_id=1):
+        request = self.fabrica.get('/api/libros/')
+        request.user = UsuarioFicticio(usuario_id)
+        return request
+
+    def test_lecturas_van_a_replicas_con_poco_retraso(self):
+        self.assertEqual(replicas.elegir_base_lectura(self.lectura()), 'replica1')
+
+    def test_sin_peticion_de_lectura_se_usa_la_principal(self):
+        self.assertIsNone(replicas.elegir_base_lectura(None))
+
+    def test_sin_replicas_al_dia_se_usa_la_principal(self):
+        self.retrasos['replica1'] = 60
+        self.assertIsNone(replicas.elegir_base_lectura(self.lectura()))
+
+    def test_tras_escribir_el_usuario_lee_de_la_principal(self):
+        middleware = replicas.ReplicaMiddleware(lambda request: HttpResponse(status=201))
+        escritura = self.fabrica.post('/api/prestamos/crear/')
+        escritura.user = UsuarioFicticio(1)
+        middleware(escritura)
+
+        self.assertIsNone(replicas.elegir_base_lectura(self.lectura(1)))
+        self.assertEqual(replicas.elegir_base_lectura(self.lectura(2)), 'replica1')
+
+    def test_escrituras_fallidas_no_fijan_la_principal(self):
+        middleware = replicas.ReplicaMiddleware(lambda request: HttpResponse(status=400))
+        escritura = self.fabrica.post('/api/prestamos/crear/')
+        escritura.user = UsuarioFicticio(1)
+        middleware(escritura)
+        self.assertEqual(replicas.elegir_base_lectura(self.lectura(1)), 'replica1')
+
+    def test_el_router_solo_enruta_durante_peticiones_de_lectura(self):
+        router = replicas.ReplicaRouter()
+        vistos = []
+        middleware = replicas.ReplicaMiddleware(
+            lambda request: vistos.append(router.db_for_read(Libro)) or HttpResponse()
+        )
+        middleware(self.lectura())
+        escritura = self.fabrica.post('/api/libros/crear/')
+        escritura.user = UsuarioFicticio(3)
+        middleware(escritura)
+
+        self.assertEqual(vistos, ['replica1', None])
+        self.assertEqual(router.db_for_write(Libro), 'default')
+
+    def test_middleware_asincrono(self):
+        router = replicas.ReplicaRouter()
+        vistos = []
+
+        async def vista(request):
+            # Las consultas síncronas de la petición ven la marca de lectura
+            vistos.append(await sync_to_async(router.db_for_read)(Libro))
+            return HttpResponse(status=201)
+
+        middleware = replicas.ReplicaMiddleware(vista)
+        escritura = self.fabrica.post('/api/prestamos/crear/')
+        escritura.user = UsuarioFicticio(1)
+        async_to_sync(middleware)(self.lectura(2))
+        async_to_sync(middleware)(escritura)
+
+        self.assertEqual(vistos, ['replica1', None])
+        self.assertIsNone(replicas.elegir_base_lectura(self.lectura(1)))
+
+
+@override_settings(DB_REPLICA_MAX_LAG_S=10, DB_REPLICA_PEGADO_S=10)
+class ReplicaCacheTests(TransactionTestCase):
+    """Fuera de una transacción de prueba, para que el router elija réplica"""
+
+    def setUp(self):
+        caches['default'].clear()
+        cache_catalogo.local.clear()
+        self.admin = crear_usuario('Administrador', 'adm')
+        self.estudiante = crear_usuario('Estudiante', 'est')
+        self.libro = crear_libro(1)
+        # La "réplica" es la misma base: se registra a dónde envía el router cada lectura
+        self.lecturas = []
+        db_for_read = replicas.ReplicaRouter.db_for_read
+
+        def registrar(router, model, **hints):
+            alias = db_for_read(router, model, **hints)
+            self.lecturas.append((model, alias))
+            return alias
+
+        for parche in (
+            mock.patch.object(replicas.estado_replicas, 'disponibles', return_value=['default']),
+            mock.patch.object(replicas.ReplicaRouter, 'db_for_read', registrar),
+        ):
+            parche.start()
+            self.addCleanup(parche.stop)
+
+    def cliente(self, usuario):
+        cliente = APIClient()
+        cliente.force_authenticate(usuario)
+        return cliente
+
+    def test_la_cache_se_llena_desde_la_principal(self):
+        url = f'/api/libros/{self.libro.pk}/'
+        escritor = self.cliente(self.admin)
+        self.assertEqual(escritor.get(url).status_code, 200)
+        escritor.patch(f'/api/libros/{self.libro.pk}/actualizar/', {'titulo': 'Título nuevo'}, format='json')
+
+        self.lecturas.clear()
+        self.assertEqual(self.cliente(self.estudiante).get(url).json()['titulo'], 'Título nuevo')
+        # Otro usuario llena la caché, que luego sirve al que escribió: no puede venir de la réplica
+        # (solo el validador del ETag, que no se guarda, lee de ella)
+        self.assertEqual([alias for modelo, alias in self.lecturas[1:]], [None] * (len(self.lecturas) - 1))
+        self.assertEqual(escritor.get(url).json()['titulo'], 'Título nuevo')
+
+    def test_sin_cache_las_lecturas_siguen_yendo_a_la_replica(self):
+        self.lecturas.clear()
+        self.assertEqual(self.cliente(self.estudiante).get('/api/reservas/').status_code, 200)
+        self.assertIn((Reserva, 'default'), self.lecturas)
+
+
+class TransaccionEscrituraAsincronaTests(TransactionTestCase):
+
+    def test_la_cadena_asincrona_se_ejecuta_en_la_transaccion(self):
+        libro = crear_libro(1)
+        vistos = []
+
+        async def vista(request):
+            await Libro.objects.filter(pk=libro.pk).aupdate(cantidad_disponible=0)
+            vistos.append(await sync_to_async(lambda: connection.in_atomic_block)())
+            raise DatabaseError('fallo tras escribir')
+
+        middleware = TransaccionEscrituraMiddleware(vista)
+        with self.assertRaises(DatabaseError):
+            async_to_sync(middleware)(RequestFactory().post('/api/prestamos/crear/'))
+
+        self.assertEqual(vistos, [True])
+        libro.refresh_from_db()
+        self.assertEqual(libro.cantidad_disponible, 2)
+
+    def test_las_lecturas_asincronas_quedan_fuera(self):
+        vistos = []
+
+        async def vista(request):
+            vistos.append(await sync_to_async(lambda: connection.in_atomic_block)())
+            return HttpResponse()
+
+        async_to_sync(TransaccionEscrituraMiddleware(vista))(RequestFactory().get('/api/libros/'))
+        self.assertEqual(vistos, [False])
+
+
+class TransaccionEventosTests(TransactionTestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_al_deshacer_anota_los_ids_descartados(self):
+        with self.assertRaises(DatabaseError):
+            with eventos.transaccion():
+                libro = crear_libro(1)
+                ids = list(EventoCirculacion.objects.values_list('id', flat=True))
+                raise DatabaseError('fallo tras escribir')
+
+        self.assertFalse(Libro.objects.filter(pk=libro.pk).exists())
+        self.assertTrue(ids)
+        self.assertTrue(eventos._descartados(EventoCirculacion, ids[0], ids[-1] + 1))
+
+    def test_al_confirmar_no_anota_nada(self):
+        with eventos.transaccion():
+            crear_libro(1)
+        ids = list(EventoCirculacion.objects.values_list('id', flat=True))
+        self.assertFalse(eventos._descartados(EventoCirculacion, ids[0], ids[-1] + 1))
+
+    def test_los_ids_interiores_se_descartan_con_la_exterior(self):
+        with self.assertRaises(DatabaseError):
+            with eventos.transaccion():
+                with eventos.transaccion():
+                    crear_libro(1)
+                    ids = list(EventoCirculacion.objects.values_list('id', flat=True))
+                raise DatabaseError('fallo tras escribir')
+        self.assertTrue(eventos._descartados(EventoCirculacion, ids[0], ids[-1] + 1))
+
+
+# ============ DEVOLUCIONES EN LOTE ============
+
+class DevolucionLoteTests(EdubooksTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.libro = crear_libro(1)
+        self.otro = crear_libro(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.prestamos = [
+                Prestamo.objects.create(
+                    libro=libro, usuario=usuario, fecha_devolucion_esperada=timezone.localdate() + timedelta(days=7)
+                )
+                for libro, usuario in ((self.libro, self.estudiante), (self.libro, self.docente), (self.otro, self.estudiante))
+            ]
+
+    def devolver(self, **datos):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.cliente(self.admin).post('/api/prestamos/devolver-lote/', datos, format='json')
+
+    def test_devuelve_y_repone_la_disponibilidad(self):
+        r = self.devolver(prestamos=[self.prestamos[0].pk, self.prestamos[2].pk])
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.data['devueltos'], 2)
+        self.assertEqual(
+            set(Prestamo.objects.filter(estado='Devuelto').values_list('id', flat=True)),
+            {self.prestamos[0].pk, self.prestamos[2].pk}
+        )
+        self.assertEqual(Libro.objects.get(pk=self.libro.pk).cantidad_disponible, 1)
+        self.assertEqual(Libro.objects.get(pk=self.otro.pk).cantidad_disponible, 2)
+
+    def test_isbn_devuelve_el_prestamo_abierto_mas_antiguo(self):
+        Prestamo.objects.filter(pk=self.prestamos[1].pk).update(
+            fecha_devolucion_esperada=timezone.localdate() + timedelta(days=1)
+        )
+        r = self.devolver(isbns=[self.libro.isbn, self.libro.isbn, self.libro.isbn])
+
+        self.assertEqual([resultado['resultado'] for resultado in r.data['resultados']], [
+            'devuelto', 'devuelto', 'sin_prestamo_activo'
+        ])
+        self.assertEqual(r.data['resultados'][0]['prestamo_id'], self.prestamos[1].pk)
+        self.assertEqual(Libro.objects.get(pk=self.libro.pk).cantidad_disponible, 2)
+
+    def test_resultado_por_entrada(self):
+        self.devolver(prestamos=[self.prestamos[0].pk])
+        r = self.devolver(prestamos=[self.prestamos[0].pk, 99999, self.prestamos[1].pk, self.prestamos[1].pk])
+
+        self.assertEqual([resultado['resultado'] for resultado in r.data['resultados']], [
+            'no_activo', 'no_encontrado', 'devuelto', 'no_activo'
+        ])
+
+    def test_multa_por_retraso_sin_duplicar(self):
+        Prestamo.objects.filter(pk__in=[self.prestamos[0].pk, self.prestamos[1].pk]).update(
+            fecha_devolucion_esperada=timezone.localdate() - timedelta(days=3)
+        )
+        Sancion.objects.create(
+            usuario=self.docente, prestamo=self.prestamos[1], tipo='Multa', monto=Decimal('1'), descripcion='Ya generada'
+        )
+        r = self.devolver(prestamos=[self.prestamos[0].pk, self.prestamos[1].pk])
+
+        self.assertEqual(r.data['multas'], 1)
+        self.assertEqual(r.data['resultados'][0]['multa'], Decimal('15000'))
+        self.assertEqual(Sancion.objects.filter(prestamo=self.prestamos[1]).count(), 1)
+        self.assertEqual(estado_cuenta.obtener(self.estudiante.pk)['multas_pendientes'], Decimal('15000'))
+
+    def test_codigo_de_barras_del_ejemplar(self):
+        libro = crear_libro(3, cantidad_total=0, cantidad_disponible=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            ejemplares.crear_ejemplares(libro, 2)
+            r = self.cliente(self.estudiante).post('/api/prestamos/crear/', {'libro_id': libro.pk}, format='json')
+        codigo = Ejemplar.objects.get(pk=r.data['ejemplar']).codigo_barras
+
+        r = self.devolver(codigos=[codigo])
+
+        self.assertEqual(r.data['resultados'][0]['resultado'], 'devuelto')
+        self.assertEqual(Ejemplar.objects.get(codigo_barras=codigo).estado, 'Disponible')
+        self.assertEqual(Libro.objects.get(pk=libro.pk).cantidad_disponible, 2)
+
+    def test_solo_administradores(self):
+        r = self.cliente(self.estudiante).post(
+            '/api/prestamos/devolver-lote/', {'prestamos': [self.prestamos[0].pk]}, format='json'
+        )
+        self.assertEqual(r.status_code, 403)
+
+
+# ============ ARCHIVO DE PRÉSTAMOS ============
+
+class ArchivoPrestamosTests(EdubooksTestCase):
+
+    def setUp(self):
+        super().setUp()
+        libro = crear_libro(1, cantidad_total=5, cantidad_disponible=5)
+        hace_dos_anios = timezone.now() - timedelta(days=730)
+        self.prestamos = [
+            Prestamo.objects.create(
+                libro=libro, usuario=self.estudiante, fecha_devolucion_esperada=timezone.localdate() + timedelta(days=7)
+            )
+            for _ in range(4)
+        ]
+        # Tres devueltos hace dos años (uno con sanción) y uno abierto
+        Prestamo.objects.filter(pk__in=[p.pk for p in self.prestamos[:3]]).update(
+            estado='Devuelto', fecha_devolucion_real=hace_dos_anios
+        )
+        Sancion.objects.create(
+            usuario=self.estudiante, prestamo=self.prestamos[2], tipo='Multa', monto=Decimal('1'),
+            descripcion='x', estado='Pagada'
+        )
+
+    def test_archiva_los_devueltos_antiguos_sin_sanciones(self):
+        call_command('archivar_prestamos', lote=1, stdout=StringIO())
+
+        archivados = {p.pk for p in self.prestamos[:2]}
+        self.assertEqual(set(PrestamoHistorico.objects.values_list('id', flat=True)), archivados)
+        self.assertFalse(Prestamo.objects.filter(pk__in=archivados).exists())
+        self.assertTrue(Prestamo.objects.filter(pk=self.prestamos[2].pk).exists())
+
+    def test_simulacion_no_mueve_nada(self):
+        salida = StringIO()
+        call_command('archivar_prestamos', dry_run=True, stdout=salida)
+        self.assertIn('Préstamos a archivar: 2', salida.getvalue())
+        self.assertEqual(PrestamoHistorico.objects.count(), 0)
+
+    def test_historial_lee_activos_y_archivados(self):
+        call_command('archivar_prestamos', stdout=StringIO())
+        datos = self.cliente(self.estudiante).get('/api/prestamos/historial/').json()
+
+        self.assertEqual(datos['count'], 4)
+        self.assertEqual(
+            {fila['id']: fila['archivado'] for fila in datos['results']},
+            {self.prestamos[0].pk: True, self.prestamos[1].pk: True,
+             self.prestamos[2].pk: False, self.prestamos[3].pk: False}
+        )
+
+    def test_historial_filtra_por_estado(self):
+        call_command('archivar_prestamos', stdout=StringIO())
+        datos = self.cliente(self.estudiante).get('/api/prestamos/historial/?estado=Devuelto').json()
+        self.assertEqual(datos['count'], 3)
+
+    def test_historial_usuario_no_numerico(self):
+        r = self.cliente(self.admin).get('/api/prestamos/historial/?usuario=abc')
+        self.assertEqual(r.status_code, 400)
+        self.assertIn('error', r.json())
+        self.assertEqual(self.cliente(self.admin).get(
+            f'/api/prestamos/historial/?usuario={self.estudiante.pk}'
+        ).status_code, 200)
+
+
+# ============ RESPUESTAS CONDICIONALES ============
+
+class RespuestaCondicionalTests(EdubooksTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.libro = crear_libro(1)
+
+    def condicional(self, usuario, url):
+        cliente = self.cliente(usuario)
+        primera = cliente.get(url)
+        return cliente, primera, cliente.get(url, HTTP_IF_NONE_MATCH=primera['ETag'])
+
+    def test_detalle_de_libro_responde_304(self):
+        _, primera, segunda = self.condicional(self.estudiante, f'/api/libros/{self.libro.pk}/')
+
+        self.assertEqual(primera.status_code, 200)
+        self.assertTrue(primera['ETag'].startswith('W/"'))
+        self.assertEqual(primera['Cache-Control'], 'private, no-cache')
+        self.assertEqual(segunda.status_code, 304)
+        self.assertEqual(segunda.content, b'')
+        self.assertEqual(segunda['ETag'], primera['ETag'])
+
+    def test_un_prestamo_cambia_el_etag_del_libro(self):
+        url = f'/api/libros/{self.libro.pk}/'
+        cliente, primera, _ = self.condicional(self.estudiante, url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Prestamo.objects.create(libro=self.libro, usuario=self.docente)
+
+        r = cliente.get(url, HTTP_IF_NONE_MATCH=primera['ETag'])
+        self.assertEqual(r.status_code, 200)
+        self.assertNotEqual(r['ETag'], primera['ETag'])
+        self.assertEqual(r.json()['cantidad_disponible'], 1)
+
+    def test_una_reserva_cambia_el_etag_sin_escribir_el_libro(self):
+        url = f'/api/libros/{self.libro.pk}/'
+        cliente, primera, _ = self.condicional(self.estudiante, url)
+        antes = Libro.objects.get(pk=self.libro.pk).fecha_actualizacion
+        with self.captureOnCommitCallbacks(execute=True):
+            Reserva.objects.create(libro=self.libro, usuario=self.docente)
+
+        r = cliente.get(url, HTTP_IF_NONE_MATCH=primera['ETag'])
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()['reservas_activas'], 1)
+        self.assertEqual(Libro.objects.get(pk=self.libro.pk).fecha_actualizacion, antes)
+
+    def test_detalle_de_prestamo(self):
+        prestamo = Prestamo.objects.create(libro=self.libro, usuario=self.estudiante)
+        url = f'/api/prestamos/{prestamo.pk}/'
+        cliente, primera, segunda = self.condicional(self.estudiante, url)
+        self.assertEqual(segunda.status_code, 304)
+
+        # El préstamo incluye datos del usuario: editarlo invalida el ETag
+        Usuario.objects.get(pk=self.estudiante.pk).save()
+        self.assertEqual(cliente.get(url, HTTP_IF_NONE_MATCH=primera['ETag']).status_code, 200)
+        # Ni el ETag ni el 304 se ofrecen sobre préstamos ajenos
+        self.assertEqual(self.cliente(self.docente).get(url, HTTP_IF_NONE_MATCH=primera['ETag']).status_code, 404)
+
+    def test_detalle_de_bibliografia(self):
+        bibliografia = crear_bibliografia(self.docente, 'Algoritmos', [self.libro])
+        url = f'/api/bibliografias/{bibliografia.pk}/'
+        cliente, primera, segunda = self.condicional(self.estudiante, url)
+        self.assertEqual(segunda.status_code, 304)
+
+        bibliografia.libros.add(crear_libro(2))
+        self.assertEqual(cliente.get(url, HTTP_IF_NONE_MATCH=primera['ETag']).status_code, 200)
+
+    def test_etag_depende_del_formato(self):
+        cliente = self.cliente(self.estudiante)
+        url = f'/api/libros/{self.libro.pk}/'
+        self.assertNotEqual(cliente.get(url)['ETag'], cliente.get(url, {'format': 'api'})['ETag'])
+
+
+# ============ RENDERER JSON Y COMPRESIÓN ============
+
+class RendererJSONTests(SimpleTestCase):
+    datos = {
+        'fecha': datetime(2024, 3, 1, 12, 30, tzinfo=dt_timezone.utc),
+        'dia': date(2024, 3, 1),
+        'monto': Decimal('12.50'),
+        'texto': 'Diseño de algoritmos',
+        1: [None, True, 2.5],
+    }
+
+    def test_salida_identica_a_la_de_drf(self):
+        self.assertEqual(renderers.renderizar_json(self.datos), JSONRenderer().render(self.datos))
+
+    def test_sin_orjson_usa_drf(self):
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(renderers.renderizar_json(self.datos), JSONRenderer().render(self.datos))
+            self.assertEqual(renderers.cargar_json(b'{"a": [1, 2]}'), {'a': [1, 2]})
+
+    def test_parser(self):
+        self.assertEqual(renderers.JSONRapidoParser().parse(BytesIO(b'{"libros": [1, 2]}')), {'libros': [1, 2]})
+        with self.assertRaises(ParseError):
+            renderers.JSONRapidoParser().parse(BytesIO(b'{"libros": '))
+
+
+@override_settings(COMPRESION_MIN_BYTES=100)
+class CompresionTests(SimpleTestCase):
+
+    def comprimir(self, response, accept_encoding='gzip'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return compresion.CompresionMiddleware(lambda request: response)(request)
+
+    def test_elige_segun_q(self):
+        with mock.patch.object(compresion, 'brotli', mock.Mock()):
+            self.assertEqual(compresion.elegir_codificacion('gzip, br'), 'br')
+            self.assertEqual(compresion.elegir_codificacion('gzip;q=1.0, br;q=0.5'), 'gzip')
+            self.assertIsNone(compresion.elegir_codificacion('br;q=0, identity'))
+        with mock.patch.object(compresion, 'brotli', None):
+            self.assertEqual(compresion.elegir_codificacion('br, gzip;q=0.1'), 'gzip')
+            self.assertIsNone(compresion.elegir_codificacion('br'))
+
+    def test_comprime_con_gzip(self):
+        contenido = b'{"titulo": "Libro"}' * 50
+        response = self.comprimir(HttpResponse(contenido, headers={'ETag': '"v1"'}))
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), contenido)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['ETag'], 'W/"v1"')
+
+    def test_respuestas_pequenas_sin_comprimir(self):
+        response = self.comprimir(HttpResponse(b'{}'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_streams_sin_comprimir(self):
+        response = self.comprimir(StreamingHttpResponse(iter([b'x' * 500])))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertFalse(response.has_header('Vary'))
+
+    def test_middleware_asincrono(self):
+        contenido = b'{"titulo": "Libro"}' * 50
+
+        async def vista(request):
+            return HttpResponse(contenido)
+
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        response = async_to_sync(compresion.CompresionMiddleware(vista))(request)
+        self.assertEqual(gzip.decompress(response.content), contenido)
+
+
+# ============ NOTIFICACIONES ============
+
+class NotificacionesTests(EdubooksTestCase):
+
+    def setUp(self):
+        super().setUp()
+        hoy = timezone.localdate()
+        self.libro = crear_libro(1)
+        self.agotado = crear_libro(2, cantidad_disponible=0)
+        Prestamo.objects.create(libro=self.libro, usuario=self.estudiante, fecha_devolucion_esperada=hoy + timedelta(days=2))
+        Prestamo.objects.create(libro=self.libro, usuario=self.docente, fecha_devolucion_esperada=hoy - timedelta(days=1))
+        Reserva.objects.create(libro=self.libro, usuario=self.docente)
+        Reserva.objects.create(libro=self.agotado, usuario=self.estudiante)
+        Sancion.objects.create(
+            usuario=self.estudiante, tipo='Multa', monto=Decimal('5000'), descripcion='Retraso', estado='Activa'
+        )
+
+    def test_genera_un_aviso_por_hecho(self):
+        notificaciones.generar_todas()
+        self.assertEqual(
+            sorted(Notificacion.objects.values_list('usuario__username', 'tipo')),
+            [('doc', 'prestamo_vencido'), ('doc', 'reserva_disponible'),
+             ('est', 'sancion'), ('est', 'vencimiento_proximo')]
+        )
+
+    def test_repetir_la_pasada_no_duplica(self):
+        notificaciones.generar_todas()
+        notificaciones.generar_todas()
+        self.assertEqual(Notificacion.objects.count(), 4)
+
+    def test_delta_desde_el_cursor(self):
+        notificaciones.generar_todas()
+        cliente = self.cliente(self.estudiante)
+        datos = cliente.get('/api/notificaciones/').json()
+        self.assertEqual(len(datos['notificaciones']), 2)
+        self.assertEqual(datos['no_leidas'], 2)
+
+        Sancion.objects.create(
+            usuario=self.estudiante, tipo='Suspension', dias_suspension=3, descripcion='Daño', estado='Activa'
+        )
+        ultimo = Notificacion.objects.order_by('-id').values_list('id', flat=True).first()
+        notificaciones.generar_sanciones()
+        # Los avisos ya existentes no se reintentan: no consumen IDs ni dejan huecos que retengan el nuevo
+        self.assertEqual(Notificacion.objects.order_by('-id').values_list('id', flat=True).first(), ultimo + 1)
+
+        delta = cliente.get('/api/notificaciones/', {'desde': datos['cursor']}).json()
+        self.assertEqual([n['tipo'] for n in delta['notificaciones']], ['sancion'])
+        self.assertEqual(delta['no_leidas'], 3)
+        self.assertEqual(cliente.get('/api/notificaciones/', {'desde': delta['cursor']}).json()['notificaciones'], [])
+
+    def test_delta_por_paginas(self):
+        notificaciones.generar_todas()
+        notificaciones.generar_todas()
+        cliente = self.cliente(self.docente)
+        with mock.patch.object(views, 'LIMITE_NOTIFICACIONES', 1):
+            primera = cliente.get('/api/notificaciones/').json()
+            segunda = cliente.get('/api/notificaciones/', {'desde': primera['cursor']}).json()
+
+        # Ascendente desde el cursor: con más avisos que el límite no se salta ninguno
+        self.assertEqual([n['tipo'] for n in primera['notificaciones']], ['prestamo_vencido'])
+        self.assertTrue(primera['hay_mas'])
+        self.assertEqual([n['tipo'] for n in segunda['notificaciones']], ['reserva_disponible'])
+        self.assertEqual(primera['cursor'], primera['notificaciones'][0]['id'])
+
+    def test_no_leidas_no_adelanta_el_cursor_sobre_las_leidas(self):
+        notificaciones.generar_todas()
+        cliente = self.cliente(self.estudiante)
+        propias = list(Notificacion.objects.filter(usuario=self.estudiante).order_by('id'))
+        Notificacion.objects.filter(pk=propias[1].pk).update(leida=True)
+
+        datos = cliente.get('/api/notificaciones/', {'no_leidas': 'true'}).json()
+        self.assertEqual([n['id'] for n in datos['notificaciones']], [propias[0].pk])
+        self.assertEqual(datos['cursor'], propias[0].pk)
+        delta = cliente.get('/api/notificaciones/', {'desde': datos['cursor']}).json()
+        self.assertEqual([n['id'] for n in delta['notificaciones']], [propias[1].pk])
+
+    def test_delta_no_avanza_sobre_un_hueco_reciente(self):
+        notificaciones.generar_todas()
+        ids = list(Notificacion.objects.order_by('id').values_list('id', flat=True))
+        # El aviso intermedio aún no se confirmó: el cursor del docente no debe saltarlo
+        Notificacion.objects.filter(id=ids[1]).delete()
+        Notificacion.objects.filter(id__in=ids[2:]).update(usuario=self.docente)
+
+        datos = self.cliente(self.docente).get('/api/notificaciones/', {'desde': ids[0]}).json()
+        self.assertEqual((datos['notificaciones'], datos['cursor']), ([], ids[0]))
+
+    def test_marcar_leidas_y_eliminar(self):
+        notificaciones.generar_todas()
+        propia, ajena = (
+            Notificacion.objects.get(usuario=self.estudiante, tipo='sancion'),
+            Notificacion.objects.get(usuario=self.docente, tipo='prestamo_vencido'),
+        )
+        cliente = self.cliente(self.estudiante)
+
+        r = cliente.post(f'/api/notificaciones/{propia.pk}/leer/')
+        self.assertEqual(r.data['no_leidas'], 1)
+        self.assertEqual(cliente.post(f'/api/notificaciones/{ajena.pk}/leer/').status_code, 404)
+        self.assertEqual(cliente.delete(f'/api/notificaciones/{ajena.pk}/eliminar/').status_code, 404)
+
+        self.assertEqual(cliente.post('/api/notificaciones/leer-todas/').data['actualizadas'], 1)
+        self.assertEqual(cliente.get('/api/notificaciones/no-leidas/').data, {'no_leidas': 0})
+        self.assertFalse(Notificacion.objects.get(pk=ajena.pk).leida)
+
+
+# ============ PANEL DEL USUARIO ============
+
+class PanelUsuarioTests(EdubooksTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.libro = crear_libro(1, cantidad_total=1, cantidad_disponible=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.prestamo = Prestamo.objects.create(libro=self.libro, usuario=self.estudiante)
+            self.reservas = [
+                Reserva.objects.create(libro=self.libro, usuario=usuario) for usuario in (self.docente, self.admin)
+            ]
+
+    def reservas_panel(self, usuario):
+        return [
+            (reserva['posicion'], reserva['lista_para_recoger'])
+            for reserva in self.cliente(usuario).get('/api/mi-panel/').json()['reservas']
+        ]
+
+    def test_panel_cacheado(self):
+        self.assertEqual(self.reservas_panel(self.docente), [(1, False)])
+        with self.assertNumQueries(0):
+            self.cliente(self.docente).get('/api/mi-panel/')
+
+    def test_una_devolucion_ajena_actualiza_el_panel(self):
+        self.assertEqual(self.reservas_panel(self.docente), [(1, False)])
+        self.assertEqual(self.reservas_panel(self.admin), [(2, False)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            r = self.cliente(self.admin).post(f'/api/prestamos/{self.prestamo.pk}/devolver/')
+        self.assertEqual(r.status_code, 200)
+
+        self.assertEqual(self.reservas_panel(self.docente), [(1, True)])
+        self.assertEqual(self.reservas_panel(self.admin), [(2, False)])
+
+    def test_una_devolucion_en_lote_actualiza_el_panel(self):
+        self.assertEqual(self.reservas_panel(self.docente), [(1, False)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cliente(self.admin).post(
+                '/api/prestamos/devolver-lote/', {'prestamos': [self.prestamo.pk]}, format='json'
+            )
+        self.assertEqual(self.reservas_panel(self.docente), [(1, True)])
+
+    def test_un_nuevo_ejemplar_actualiza_el_panel(self):
+        self.assertEqual(self.reservas_panel(self.docente), [(1, False)])
+        with self.captureOnCommitCallbacks(execute=True):
+            Ejemplar.objects.create(libro=self.libro, codigo_barras='EJ-NUEVO')
+        self.assertEqual(self.reservas_panel(self.docente), [(1, True)])
+
+    def test_una_cancelacion_ajena_adelanta_la_cola(self):
+        self.assertEqual(self.reservas_panel(self.admin), [(2, False)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cliente(self.docente).post(f'/api/reservas/{self.reservas[0].pk}/cancelar/')
+        self.assertEqual(self.reservas_panel(self.admin), [(1, False)])
+
+
+# ============ CAMPOS PARCIALES ============
+
+class CamposParcialesTests(EdubooksTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.libros = [crear_libro(numero) for numero in range(3)]
+        self.prestamos = [Prestamo.objects.create(libro=libro, usuario=self.docente) for libro in self.libros]
+
+    def listar(self, url, **params):
+        with CaptureQueriesContext(connection) as consultas:
+            datos = self.cliente(self.admin).get(url, params).json()
+        return datos['results'], [consulta['sql'] for consulta in consultas]
+
+    def test_sin_fields_la_respuesta_no_cambia(self):
+        resultados, consultas = self.listar('/api/prestamos/')
+        self.assertEqual(set(resultados[0]), {
+            'id', 'libro', 'usuario_nombre', 'usuario_apellido', 'fecha_prestamo', 'fecha_devolucion_esperada', 'estado'
+        })
+        self.assertEqual(set(resultados[0]['libro']), {
+            'id', 'titulo', 'autor', 'categoria', 'estado', 'cantidad_disponible', 'imagen_portada'
+        })
+        # Libro y usuario se unen en la misma consulta: más préstamos no suman consultas
+        Prestamo.objects.create(libro=self.libros[0], usuario=self.estudiante)
+        self.assertEqual(len(self.listar('/api/prestamos/')[1]), len(consultas))
+
+    def test_fields_recorta_y_no_une_relaciones(self):
+        resultados, consultas = self.listar('/api/prestamos/', fields='id,estado')
+        self.assertEqual(set(resultados[0]), {'id', 'estado'})
+        listado = next(sql for sql in consultas if 'ORDER BY' in sql)
+        self.assertNotIn('JOIN', listado)
+        self.assertNotIn('observaciones', listado)
+
+    def test_relacion_sin_subcampos_es_su_id(self):
+        resultados, _ = self.listar('/api/prestamos/', fields='id,libro')
+        self.assertEqual({fila['libro'] for fila in resultados}, {libro.pk for libro in self.libros})
+
+    def test_subcampos_y_expand(self):
+        resultados, _ = self.listar('/api/prestamos/', fields='id,libro.titulo')
+        self.assertEqual(set(resultados[0]['libro']), {'titulo'})
+
+        resultados, _ = self.listar('/api/prestamos/', fields='id,libro', expand='libro')
+        self.assertIn('cantidad_disponible', resultados[0]['libro'])
+
+    def test_detalle_parcial(self):
+        url = f'/api/prestamos/{self.prestamos[0].pk}/'
+        datos = self.cliente(self.docente).get(url, {'fields': 'id,usuario.nombre,libro.isbn'}).json()
+        self.assertEqual(datos, {
+            'id': self.prestamos[0].pk, 'usuario': {'nombre': 'Docente'}, 'libro': {'isbn': self.libros[0].isbn}
+        })
+
+    def test_catalogo_cachea_cada_proyeccion_por_separado(self):
+        cliente = self.cliente(self.estudiante)
+        completo = cliente.get('/api/libros/').json()['results'][0]
+        parcial = cliente.get('/api/libros/', {'fields': 'id,titulo'}).json()['results'][0]
+
+        self.assertIn('autor', completo)
+        self.assertEqual(set(parcial), {'id', 'titulo'})
+        self.assertIn('autor', cliente.get('/api/libros/').json()['results'][0])
+
+
+# ============ CONSULTA DE LIBROS EN LOTE ============
+
+class LibrosLoteTests(EdubooksTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.libros = [crear_libro(numero) for numero in range(4)]
+        Prestamo.objects.create(libro=self.libros[0], usuario=self.estudiante)
+        Prestamo.objects.create(libro=self.libros[0], usuario=self.docente)
+        Reserva.objects.create(libro=self.libros[1], usuario=self.estudiante)
+
+    def consultar(self, **datos):
+        return self.cliente(self.estudiante).post('/api/libros/lote/', datos, format='json')
+
+    def test_ids_e_isbn_en_el_orden_pedido_sin_repetir(self):
+        r = self.consultar(
+            ids=[self.libros[2].pk, self.libros[0].pk, 999999],
+            isbns=[self.libros[1].isbn, self.libros[2].isbn, '9780000000000X']
+        )
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual([libro['id'] for libro in r.data['libros']], [
+            self.libros[2].pk, self.libros[0].pk, self.libros[1].pk
+        ])
+        self.assertEqual(r.data['total'], 3)
+        self.assertEqual(r.data['no_encontrados'], {'ids': [999999], 'isbns': ['9780000000000X']})
+
+    def test_contadores_en_consultas_fijas(self):
+        # Libros, préstamos y reservas activos agrupados (más el SAVEPOINT de la petición de escritura)
+        with self.assertNumQueries(5):
+            r = self.consultar(ids=[libro.pk for libro in self.libros])
+        contadores = {libro['id']: (libro['prestamos_activos'], libro['reservas_activas']) for libro in r.data['libros']}
+        self.assertEqual(contadores[self.libros[0].pk], (2, 0))
+        self.assertEqual(contadores[self.libros[1].pk], (0, 1))
+        self.assertEqual(contadores[self.libros[3].pk], (0, 0))
+
+    def test_valida_la_entrada(self):
+        self.assertEqual(self.consultar().status_code, 400)
+        self.assertEqual(self.consultar(ids=list(range(1, 502))).status_code, 400)
+
+
+# ============ FEED DE EVENTOS ============
+
+class FeedEventosTests(EdubooksTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.libros = [crear_libro(numero) for numero in range(3)]
+        self.ids = list(EventoCirculacion.objects.order_by('id').values_list('id', flat=True))
+        self.desde = self.ids[0] - 1
+
+    def feed(self, usuario, **params):
+        return self.cliente(usuario).get('/api/eventos/', params).json()
+
+    def test_sin_cursor_devuelve_el_ultimo(self):
+        self.assertEqual(self.feed(self.admin), {'eventos': [], 'cursor': self.ids[-1], 'hay_mas': False})
+
+    def test_eventos_posteriores_al_cursor(self):
+        datos = self.feed(self.admin, desde=self.desde, limite=2)
+        self.assertEqual([e['id'] for e in datos['eventos']], self.ids[:2])
+        self.assertEqual((datos['cursor'], datos['hay_mas']), (self.ids[1], True))
+
+        datos = self.feed(self.admin, desde=datos['cursor'], limite=2)
+        self.assertEqual([e['id'] for e in datos['eventos']], self.ids[2:])
+        self.assertEqual((datos['cursor'], datos['hay_mas']), (self.ids[-1], False))
+
+    def test_no_avanza_sobre_un_hueco_reciente(self):
+        # Un ID intermedio sin confirmar todavía: el cursor no debe dejarlo atrás
+        EventoCirculacion.objects.filter(id=self.ids[1]).delete()
+        datos = self.feed(self.admin, desde=self.desde)
+        self.assertEqual([e['id'] for e in datos['eventos']], self.ids[:1])
+        self.assertEqual(datos['cursor'], self.ids[0])
+        self.assertEqual(self.feed(self.admin)['cursor'], self.ids[0])
+
+    def test_salta_un_hueco_antiguo(self):
+        # Pasada la ventana el hueco se da por una transacción deshecha
+        EventoCirculacion.objects.filter(id=self.ids[1]).delete()
+        EventoCirculacion.objects.update(
+            fecha=timezone.now() - timedelta(seconds=eventos.VENTANA_VISIBILIDAD + 1)
+        )
+        datos = self.feed(self.admin, desde=self.desde)
+        self.assertEqual([e['id'] for e in datos['eventos']], [self.ids[0], self.ids[2]])
+        self.assertEqual(datos['cursor'], self.ids[2])
+
+    def test_salta_un_hueco_reciente_descartado(self):
+        # Los IDs de una transacción deshecha no esperan a la ventana
+        EventoCirculacion.objects.filter(id=self.ids[1]).delete()
+        eventos.descartar(EventoCirculacion, [self.ids[1]])
+        datos = self.feed(self.admin, desde=self.desde)
+        self.assertEqual([e['id'] for e in datos['eventos']], [self.ids[0], self.ids[2]])
+        self.assertEqual(datos['cursor'], self.ids[2])
+
+    def test_el_horizonte_se_reutiliza_durante_el_intervalo(self):
+        with mock.patch.object(eventos, 'INTERVALO_HORIZONTE', 60):
+            self.assertEqual(eventos.horizonte(), self.ids[-1])
+            crear_libro(10)
+            with self.assertNumQueries(0):
+                self.assertEqual(eventos.horizonte(), self.ids[-1])
+            # Por tabla: el de las notificaciones se calcula aparte
+            self.assertEqual(eventos.horizonte(Notificacion), 0)
+
+    def test_el_cursor_avanza_sobre_eventos_no_visibles(self):
+        Sancion.objects.create(
+            usuario=self.docente, tipo='Multa', monto=Decimal('1'), descripcion='x', estado='Activa'
+        )
+        ultimo = EventoCirculacion.objects.latest('id')
+        self.assertEqual(ultimo.usuario_id, self.docente.pk)
+
+        datos = self.feed(self.estudiante, desde=self.ids[-1])
+        self.assertEqual((datos['eventos'], datos['cursor']), ([], ultimo.id))
+
+    def test_feed_asincrono(self):
+        EventoCirculacion.objects.filter(id=self.ids[2]).delete()
+        cabecera = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.estudiante).access_token}'}
+        datos = self.client.get('/api/async/eventos/', {'desde': self.desde, 'espera': 0}, **cabecera).json()
+
+        self.assertEqual([e['id'] for e in datos['eventos']], self.ids[:2])
+        self.assertEqual((datos['cursor'], datos['hay_mas']), (self.ids[1], False))
+
+
+# ============ DISPONIBILIDAD EN VIVO ============
+
+class CanalDisponibilidadTests(EdubooksTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Dentro de la transacción de la prueba no se puede cerrar la conexión
+        mock.patch('libros.disponibilidad.close_old_connections').start()
+        self.addCleanup(mock.patch.stopall)
+        self.canal = disponibilidad.CanalDisponibilidad()
+        self.canal._cursor = eventos.ultimo_cursor()
+
+    def test_lee_solo_eventos_de_libros(self):
+        libro = crear_libro(1)
+        Sancion.objects.create(
+            usuario=self.estudiante, tipo='Multa', monto=Decimal('1'), descripcion='x', estado='Activa'
+        )
+        filas = self.canal._leer_eventos()
+
+        self.assertEqual([(fila['entidad_id'], fila['accion']) for fila in filas], [(libro.pk, 'creado')])
+        self.assertEqual(self.canal._cursor, EventoCirculacion.objects.latest('id').id)
+
+    def test_espera_a_los_eventos_sin_confirmar(self):
+        libros = [crear_libro(numero) for numero in range(3)]
+        pendiente = EventoCirculacion.objects.get(entidad='Libro', entidad_id=libros[1].pk)
+        pendiente_id = pendiente.id
+        pendiente.delete()
+
+        filas = self.canal._leer_eventos()
+        self.assertEqual([fila['entidad_id'] for fila in filas], [libros[0].pk])
+
+        # La transacción confirma: el evento llega aunque haya otros posteriores ya leídos
+        pendiente.id = pendiente_id
+        pendiente.save()
+        filas = self.canal._leer_eventos()
+        self.assertEqual([fila['entidad_id'] for fila in filas], [libros[1].pk, libros[2].pk])
+
+
+# ============ ÍNDICE DE DISPONIBILIDAD ============
+
+class IndiceDisponibilidadTests(EdubooksTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.libros = [crear_libro(numero) for numero in range(3)]
+        self.indice = IndiceDisponibilidad(intervalo=0)
+        self.indice.actualizar()
+
+    def test_carga_y_aplica_eventos(self):
+        self.assertEqual(self.indice.obtener(self.libros[0].pk), (2, 'Disponible'))
+        Prestamo.objects.create(libro=self.libros[0], usuario=self.estudiante)
+        Prestamo.objects.create(libro=self.libros[0], usuario=self.docente)
+        version = self.indice.version
+
+        self.indice.actualizar()
+        self.assertEqual(self.indice.obtener(self.libros[0].pk)[0], 0)
+        self.assertEqual(self.indice.agotados(), [self.libros[0].pk])
+        self.assertGreater(self.indice.version, version)
+
+    def test_espera_a_los_eventos_sin_confirmar(self):
+        for libro in self.libros[:2]:
+            Prestamo.objects.create(libro=libro, usuario=self.estudiante)
+        pendiente = EventoCirculacion.objects.filter(entidad='Libro', entidad_id=self.libros[0].pk).latest('id')
+        pendiente_id = pendiente.id
+        pendiente.delete()
+
+        self.indice.actualizar()
+        self.assertEqual(self.indice.obtener(self.libros[1].pk)[0], 2)
+        self.assertLess(self.indice._cursor, pendiente_id)
+
+        # La transacción confirma: el evento con ID menor se aplica igualmente
+        pendiente.id = pendiente_id
+        pendiente.save()
+        self.indice.actualizar()
+        self.assertEqual(self.indice.obtener(self.libros[0].pk)[0], 1)
+        self.assertEqual(self.indice.obtener(self.libros[1].pk)[0], 1)
+
+    def test_reconciliacion_fuera_de_las_peticiones(self):
+        # Un cambio cuyo evento se perdió (p. ej. confirmado después de la ventana)
+        Libro.objects.filter(pk=self.libros[2].pk).update(cantidad_disponible=0)
+        self.indice._ultima_reconciliacion -= self.indice.intervalo_reconciliacion
+        with mock.patch.object(self.indice, '_recorrer_tabla') as recorrer:
+            self.indice.actualizar()
+        # Las peticiones solo aplican eventos: el recorrido de la tabla es del hilo de mantenimiento
+        recorrer.assert_not_called()
+        self.assertEqual(self.indice.obtener(self.libros[2].pk)[0], 2)
+
+        self.indice.reconciliar()
+        self.assertEqual(self.indice.obtener(self.libros[2].pk)[0], 0)
+        self.assertEqual(self.indice.agotados(), [self.libros[2].pk])
+        self.assertIsNotNone(caches['default'].get('indice_disponibilidad'))
+
+    def test_reconciliar_aplica_los_eventos_posteriores_al_recorrido(self):
+        recorrido = self.indice._recorrer_tabla()
+        Prestamo.objects.create(libro=self.libros[0], usuario=self.estudiante)
+        # El recorrido terminó antes del préstamo: su evento se aplica al intercambiar los arrays
+        with mock.patch.object(self.indice, '_recorrer_tabla', return_value=recorrido):
+            self.indice.reconciliar()
+        self.assertEqual(self.indice.obtener(self.libros[0].pk)[0], 1)
+
+    def test_reconciliar_sin_cambios_conserva_la_version(self):
+        crear_libro(10)
+        self.indice.actualizar()
+        version = self.indice.version
+        self.indice.reconciliar()
+        self.assertEqual(self.indice.version, version)
+
+    def test_listado_cacheado_como_plantilla(self):
+        cliente = self.cliente(self.estudiante)
+        with mock.patch('libros.indice_disponibilidad.indice_disponibilidad', self.indice):
+            cliente.get('/api/libros/')
+            # Préstamo con los listados cacheados: el índice rellena la plantilla sin decodificar el JSON
+            Prestamo.objects.create(libro=self.libros[1], usuario=self.estudiante)
+            with mock.patch('libros.indice_disponibilidad.renderizar_json') as renderizar, \
+                    mock.patch('edubooks.renderers.cargar_json') as cargar:
+                datos = cliente.get('/api/libros/').json()
+            renderizar.assert_not_called()
+            cargar.assert_not_called()
+
+        filas = {fila['id']: fila for fila in datos['results']}
+        self.assertEqual(filas[self.libros[1].pk]['cantidad_disponible'], 1)
+        self.assertEqual(filas[self.libros[0].pk]['cantidad_disponible'], 2)
+        self.assertEqual(filas[self.libros[0].pk]['estado'], 'Disponible')
+        self.assertEqual(filas[self.libros[1].pk]['titulo'], 'Libro 1')
+
+
+# ============ SUGERENCIAS ============
+
+class SugerenciasTests(EdubooksTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cien = crear_libro(1, titulo='Cien años de soledad', autor='Gabriel García Márquez')
+        self.coronel = crear_libro(2, titulo='El coronel no tiene quien le escriba', autor='Gabriel García Márquez')
+        self.ciencia = crear_libro(3, titulo='Ciencia de datos', autor='Joel Grus')
+        Prestamo.objects.create(libro=self.coronel, usuario=self.estudiante)
+        self.indice = IndiceSugerencias(intervalo=0)
+        self.indice.actualizar()
+
+    def test_prefijos_sin_tildes_por_popularidad(self):
+        self.assertEqual(self.indice.buscar('marq'), [self.coronel.pk, self.cien.pk])
+        self.assertEqual(self.indice.buscar('CIEN'), [self.cien.pk, self.ciencia.pk])
+        self.assertEqual(self.indice.buscar('gab sol'), [self.cien.pk])
+        self.assertEqual(self.indice.buscar(''), [])
+
+    def test_aplica_prestamos_y_ediciones(self):
+        Prestamo.objects.create(libro=self.ciencia, usuario=self.estudiante)
+        Prestamo.objects.create(libro=self.ciencia, usuario=self.docente)
+        self.cien.titulo = 'Crónica de una muerte anunciada'
+        self.cien.save()
+        self.coronel.delete()
+
+        self.indice.actualizar()
+        self.assertEqual(self.indice.buscar('ci'), [self.ciencia.pk])
+        self.assertEqual(self.indice.buscar('cron'), [self.cien.pk])
+        self.assertEqual(self.indice.popularidad(self.ciencia.pk), 2)
+
+    def test_espera_a_los_eventos_sin_confirmar(self):
+        Prestamo.objects.create(libro=self.cien, usuario=self.docente)
+        Prestamo.objects.create(libro=self.cien, usuario=self.admin)
+        pendiente = EventoCirculacion.objects.filter(entidad='Prestamo').latest('id')
+        pendiente_id = pendiente.id
+        pendiente.delete()
+        crear_libro(4, titulo='Soledad compartida')
+
+        self.indice.actualizar()
+        self.assertEqual(self.indice.popularidad(self.cien.pk), 1)
+        self.assertEqual(self.indice.buscar('soledad compartida'), [])
+
+        pendiente.id = pendiente_id
+        pendiente.save()
+        self.indice.actualizar()
+        self.assertEqual(self.indice.popularidad(self.cien.pk), 2)
+        self.assertEqual(len(self.indice.buscar('soledad compartida')), 1)
+
+    def test_reconstruccion_periodica(self):
+        # Un cambio cuyo evento se perdió (p. ej. confirmado después de la ventana)
+        Libro.objects.filter(pk=self.ciencia.pk).update(titulo='Estadística práctica')
+        self.indice.actualizar()
+        self.assertEqual(self.indice.buscar('estad'), [])
+
+        self.indice._ultima_reconciliacion -= self.indice.intervalo_reconciliacion
+        self.indice.actualizar()
+        self.assertEqual(self.indice.buscar('estad'), [self.ciencia.pk])
+
+    def test_endpoint(self):
+        with mock.patch.object(views, 'indice_sugerencias', self.indice):
+            r = self.cliente(self.estudiante).get('/api/libros/sugerencias/', {'q': 'garcia', 'limite': 1})
+            self.assertEqual(r.data['sugerencias'], [{
+                'id': self.coronel.pk, 'titulo': self.coronel.titulo, 'autor': self.coronel.autor,
+                'categoria': 'Programación', 'popularidad': 1,
+            }])
+            r = self.cliente(self.estudiante).get('/api/libros/sugerencias/', {'q': 'garcia', 'limite': 'x'})
+            self.assertEqual(r.status_code, 400)
+
+
+# ============ LIBROS DUPLICADOS ============
+
+class DuplicadosTests(EdubooksTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.original = crear_libro(1, titulo='Cien años de soledad', autor='Gabriel García Márquez')
+        self.copia = crear_libro(2, titulo='CIEN AÑOS DE SOLEDAD', autor='García Márquez, Gabriel', isbn=None,
+                                 cantidad_total=1, cantidad_disponible=1)
+        self.otro = crear_libro(3, titulo='Rayuela', autor='Julio Cortázar')
+
+    def test_normalizar_isbn(self):
+        self.assertEqual(duplicados.normalizar_isbn('0-306-40615-2'), '9780306406157')
+        self.assertEqual(duplicados.normalizar_isbn('978-0-306-40615-7'), '9780306406157')
+        self.assertIsNone(duplicados.normalizar_isbn('12345'))
+
+    def test_detecta_variantes_y_elige_el_libro_con_isbn(self):
+        propuestas, estadisticas = duplicados.detectar()
+        self.assertEqual(
+            [(p['canonico'], p['duplicado']) for p in propuestas], [(self.original.pk, self.copia.pk)]
+        )
+        self.assertEqual(estadisticas['grupos'], 1)
+
+    def test_isbn_distintos_son_ediciones_distintas(self):
+        Libro.objects.filter(pk=self.copia.pk).update(isbn='9780000000999')
+        self.assertEqual(duplicados.detectar()[0], [])
+
+    def test_fusion_mueve_la_circulacion(self):
+        bibliografia = crear_bibliografia(self.docente, 'Literatura', [self.original, self.copia])
+        otra = crear_bibliografia(self.docente, 'Narrativa', [self.copia])
+        ejemplar = Ejemplar.objects.create(libro=self.copia, codigo_barras='DUP-1')
+        prestamo = Prestamo.objects.create(libro=self.copia, usuario=self.estudiante)
+        # El mismo usuario con reservas activas de ambos libros: se conserva la más antigua
+        conservada = Reserva.objects.create(libro=self.copia, usuario=self.docente)
+        descartada = Reserva.objects.create(libro=self.original, usuario=self.docente)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            totales = duplicados.fusionar({self.copia.pk: self.original.pk})
+
+        self.assertEqual(totales['libros_eliminados'], 1)
+        self.assertEqual(totales['reservas_descartadas'], 1)
+        self.assertFalse(Libro.objects.filter(pk=self.copia.pk).exists())
+        self.assertEqual(Ejemplar.objects.get(pk=ejemplar.pk).libro_id, self.original.pk)
+        self.assertEqual(Prestamo.objects.get(pk=prestamo.pk).libro_id, self.original.pk)
+        self.assertEqual(Reserva.objects.get(pk=conservada.pk).libro_id, self.original.pk)
+        self.assertFalse(Reserva.objects.filter(pk=descartada.pk).exists())
+        self.assertEqual(list(bibliografia.libros.values_list('id', flat=True)), [self.original.pk])
+        self.assertEqual(list(otra.libros.values_list('id', flat=True)), [self.original.pk])
+        # El canónico acaba con ejemplares: sus cantidades salen del recuento, no de la suma
+        original = Libro.objects.get(pk=self.original.pk)
+        self.assertEqual((original.cantidad_total, original.cantidad_disponible), (1, 1))
+
+    def test_sin_ejemplares_se_suman_las_cantidades(self):
+        Prestamo.objects.create(libro=self.copia, usuario=self.estudiante)
+        with self.captureOnCommitCallbacks(execute=True):
+            duplicados.fusionar({self.copia.pk: self.original.pk})
+        original = Libro.objects.get(pk=self.original.pk)
+        self.assertEqual((original.cantidad_total, original.cantidad_disponible), (3, 2))
+
+    def test_cadenas_de_duplicados(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            duplicados.fusionar({self.otro.pk: self.copia.pk, self.copia.pk: self.original.pk})
+        self.assertEqual(list(Libro.objects.values_list('id', flat=True)), [self.original.pk])
+
+    def test_comando(self):
+        salida = StringIO()
+        call_command('deduplicar_libros', stdout=salida)
+        self.assertIn(f'{self.copia.pk} -> {self.original.pk}', salida.getvalue())
+        self.assertTrue(Libro.objects.filter(pk=self.copia.pk).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('deduplicar_libros', fusionar=True, stdout=StringIO())
+        self.assertFalse(Libro.objects.filter(pk=self.copia.pk).exists())
+
+
+# ============ EJEMPLARES ============
+
+class EjemplaresTests(EdubooksTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.libro = crear_libro(1, cantidad_total=0, cantidad_disponible=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ejemplares = ejemplares.crear_ejemplares(self.libro, 2)
+
+    def prestar(self, usuario, **datos):
+        return self.cliente(usuario).post('/api/prestamos/crear/', {'libro_id': self.libro.pk, **datos}, format='json')
+
+    def disponibles(self):
+        return Libro.objects.values_list('cantidad_disponible', 'estado').get(pk=self.libro.pk)
+
+    def test_crear_ejemplares_deriva_las_cantidades(self):
+        libro = Libro.objects.get(pk=self.libro.pk)
+        self.assertEqual((libro.cantidad_total, libro.cantidad_disponible), (2, 2))
+        self.assertEqual(
+            [ejemplar.codigo_barras for ejemplar in self.ejemplares],
+            [f'EB{self.libro.pk:08d}0001', f'EB{self.libro.pk:08d}0002']
+        )
+
+    def test_el_prestamo_solo_escribe_el_ejemplar(self):
+        with CaptureQueriesContext(connection) as consultas, self.captureOnCommitCallbacks() as al_confirmar:
+            r = self.prestar(self.estudiante)
+
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(Ejemplar.objects.get(pk=r.data['ejemplar']).estado, 'Prestado')
+        # La fila del libro no se toca dentro de la transacción del préstamo
+        self.assertFalse([q['sql'] for q in consultas if q['sql'].startswith('UPDATE "libros"')])
+        self.assertEqual(self.disponibles(), (2, 'Disponible'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for callback in al_confirmar:
+                callback()
+        self.assertEqual(self.disponibles(), (1, 'Disponible'))
+
+    def test_toma_un_ejemplar_libre_y_agota_el_libro(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            primero = self.prestar(self.estudiante)
+            segundo = self.prestar(self.docente)
+
+        self.assertNotEqual(primero.data['ejemplar'], segundo.data['ejemplar'])
+        self.assertIsNone(ejemplares.tomar_ejemplar(self.libro.pk))
+        self.assertEqual(self.disponibles(), (0, 'Prestado'))
+
+        # El ejemplar decide aunque el contador del libro aún no refleje los préstamos
+        Libro.objects.filter(pk=self.libro.pk).update(cantidad_disponible=2, estado='Disponible')
+        r = self.prestar(self.admin)
+        self.assertEqual(r.status_code, 400)
+        self.assertIn('libro_id', r.data)
+
+    def test_prestamo_por_codigo_de_barras(self):
+        codigo = self.ejemplares[1].codigo_barras
+        with self.captureOnCommitCallbacks(execute=True):
+            r = self.cliente(self.estudiante).post('/api/prestamos/crear/', {'codigo_barras': codigo}, format='json')
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(r.data['ejemplar'], self.ejemplares[1].pk)
+
+        r = self.cliente(self.docente).post('/api/prestamos/crear/', {'codigo_barras': codigo}, format='json')
+        self.assertEqual(r.status_code, 400)
+        self.assertIn('codigo_barras', r.data)
+
+    def test_devolver_repone_el_ejemplar_y_el_contador(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            prestamo = Prestamo.objects.get(pk=self.prestar(self.estudiante).data['id'])
+        prestamo.estado = 'Devuelto'
+        with self.captureOnCommitCallbacks(execute=True):
+            prestamo.save()
+
+        self.assertEqual(Ejemplar.objects.get(pk=prestamo.ejemplar_id).estado, 'Disponible')
+        self.assertEqual(self.disponibles(), (2, 'Disponible'))
+
+    def test_recuento_intermedio_no_descuenta_dos_veces(self):
+        with self.captureOnCommitCallbacks() as al_confirmar:
+            self.prestar(self.estudiante)
+        # Otro proceso recuenta (p. ej. al editar un ejemplar) antes de que corra el callback del préstamo
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ejemplares[1].ubicacion = 'B2'
+            self.ejemplares[1].save()
+        self.assertEqual(self.disponibles(), (1, 'Disponible'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for callback in al_confirmar:
+                callback()
+        self.assertEqual(self.disponibles(), (1, 'Disponible'))
+
+    def test_un_recuento_fallido_no_afecta_al_prestamo(self):
+        with mock.patch.object(ejemplares, 'recontar', side_effect=DatabaseError('caída')), \
+                self.assertLogs(level='ERROR'), \
+                self.captureOnCommitCallbacks(execute=True):
+            r = self.prestar(self.estudiante)
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(self.disponibles(), (2, 'Disponible'))
+
+        # El comando periódico corrige el contador
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('recontar_ejemplares', stdout=StringIO())
+        self.assertEqual(self.disponibles(), (1, 'Disponible'))
+
+    def test_libro_sin_ejemplares_descuenta_en_la_transaccion(self):
+        libro = crear_libro(2, cantidad_total=1, cantidad_disponible=1)
+        # Sin ejecutar los callbacks de confirmación: el contador ya está descontado, sin bajar de cero
+        with self.captureOnCommitCallbacks():
+            Prestamo.objects.create(libro=libro, usuario=self.estudiante)
+            Prestamo.objects.create(libro=libro, usuario=self.docente)
+
+        self.assertEqual(
+            Libro.objects.values_list('cantidad_disponible', 'estado').get(pk=libro.pk), (0, 'Prestado')
+        )
+
+    def test_renovar_no_escribe_el_libro(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            prestamo_id = self.prestar(self.estudiante).data['id']
+        antes = Libro.objects.get(pk=self.libro.pk).fecha_actualizacion
+
+        with CaptureQueriesContext(connection) as consultas, self.captureOnCommitCallbacks(execute=True):
+            resultados = circulacion.renovar_prestamos([prestamo_id])
+
+        self.assertEqual(resultados[0]['resultado'], 'renovado')
+        self.assertFalse([q['sql'] for q in consultas if q['sql'].startswith('UPDATE "libros"')])
+        self.assertEqual(Libro.objects.get(pk=self.libro.pk).fecha_actualizacion, antes)
+
+
+# ============ POLÍTICAS DE CIRCULACIÓN ============
+
+class PoliticasCirculacionTests(EdubooksTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.libro = crear_libro(1, categoria='Referencia')
+
+    def regla(self, **datos):
+        with self.captureOnCommitCallbacks(execute=True):
+            return PoliticaCirculacion.objects.create(**datos)
+
+    def test_herencia_de_reglas(self):
+        base = politicas.politica_base()
+        tabla = politicas.TablaPoliticas()
+        tabla.compilar([
+            {'rol': '', 'categoria': '', **dict.fromkeys(politicas.CAMPOS), 'multa_diaria': Decimal('100')},
+            {'rol': 'Docente', 'categoria': '', **dict.fromkeys(politicas.CAMPOS), 'dias_prestamo': 30},
+            {'rol': 'Docente', 'categoria': 'Referencia', **dict.fromkeys(politicas.CAMPOS), 'max_renovaciones': 0},
+        ], base)
+
+        referencia = tabla.obtener('Docente', 'Referencia')
+        self.assertEqual(
+            (referencia.dias_prestamo, referencia.max_renovaciones, referencia.multa_diaria, referencia.dias_reserva),
+            (30, 0, Decimal('100'), base.dias_reserva)
+        )
+        # Categorías y roles sin regla propia toman la más general
+        self.assertEqual(tabla.obtener('Docente', 'Novela').max_renovaciones, base.max_renovaciones)
+        self.assertEqual(tabla.obtener('Estudiante', 'Referencia').dias_prestamo, base.dias_prestamo)
+
+    def test_consultar_no_hace_consultas(self):
+        self.regla(rol='Estudiante', dias_prestamo=7)
+        with self.assertNumQueries(0):
+            self.assertEqual(politicas.obtener('Estudiante', 'Referencia').dias_prestamo, 7)
+
+    def test_el_prestamo_toma_el_plazo_de_la_politica(self):
+        self.regla(rol='Estudiante', categoria='Referencia', dias_prestamo=3)
+        cliente = self.cliente(self.estudiante)
+
+        r = cliente.post('/api/prestamos/crear/', {
+            'libro_id': self.libro.pk, 'fecha_devolucion_esperada': timezone.localdate() + timedelta(days=10)
+        }, format='json')
+        self.assertEqual(r.status_code, 400)
+        self.assertIn('fecha_devolucion_esperada', r.data)
+
+        r = cliente.post('/api/prestamos/crear/', {'libro_id': self.libro.pk}, format='json')
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(r.data['fecha_devolucion_esperada'], str(date.today() + timedelta(days=3)))
+
+    def test_renovacion_limitada_por_la_politica(self):
+        self.regla(categoria='Referencia', max_renovaciones=1, dias_renovacion=5)
+        prestamo = Prestamo.objects.create(libro=self.libro, usuario=self.estudiante)
+        esperada = prestamo.fecha_devolucion_esperada
+        cliente = self.cliente(self.estudiante)
+
+        r = cliente.post(f'/api/prestamos/{prestamo.pk}/renovar/')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.data['fecha_devolucion_esperada'], str(esperada + timedelta(days=5)))
+        r = cliente.post(f'/api/prestamos/{prestamo.pk}/renovar/')
+        self.assertEqual(r.status_code, 400)
+        self.assertIn('(1)', r.data['error'])
+
+    def test_reserva_y_multa_segun_la_politica(self):
+        self.regla(rol='Docente', dias_reserva=1, multa_diaria=Decimal('250'))
+        reserva = Reserva.objects.create(libro=self.libro, usuario=self.docente)
+        self.assertLessEqual(reserva.fecha_expiracion - reserva.fecha_reserva, timedelta(days=1, seconds=1))
+
+        prestamo = Prestamo.objects.create(
+            libro=self.libro, usuario=self.docente, fecha_devolucion_esperada=timezone.localdate() + timedelta(days=1)
+        )
+        Prestamo.objects.filter(pk=prestamo.pk).update(fecha_devolucion_esperada=timezone.localdate() - timedelta(days=4))
+        with self.captureOnCommitCallbacks(execute=True):
+            r = self.cliente(self.admin).post(f'/api/prestamos/{prestamo.pk}/devolver/')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(Sancion.objects.get(prestamo=prestamo).monto, Decimal('1000'))
+
+    def test_cambios_desde_la_api(self):
+        admin = self.cliente(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            r = admin.post('/api/politicas/crear/', {'rol': 'Estudiante', 'dias_prestamo': 21}, format='json')
+        self.assertEqual(r.status_code, 201)
+        vigente = self.cliente(self.estudiante).get('/api/politicas/vigente/', {'categoria': 'Referencia'})
+        self.assertEqual(vigente.data['dias_prestamo'], 21)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            admin.delete(f"/api/politicas/{r.data['id']}/eliminar/")
+        self.assertEqual(politicas.obtener('Estudiante', 'Referencia'), politicas.politica_base())
+
+    def test_solo_administradores_editan(self):
+        r = self.cliente(self.estudiante).post('/api/politicas/crear/', {'dias_prestamo': 60}, format='json')
+        self.assertEqual(r.status_code, 403)
+
+
+# ============ RENOVACIONES EN LOTE ============
+
+class RenovacionLoteTests(EdubooksTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.libros = [crear_libro(numero) for numero in range(1, 4)]
+        self.hoy = timezone.localdate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.prestamos = [
+                Prestamo.objects.create(
+                    libro=libro, usuario=self.estudiante, fecha_devolucion_esperada=self.hoy + timedelta(days=7)
+                )
+                for libro in self.libros
+            ]
+
+    def renovar(self, usuario, url='/api/prestamos/renovar-lote/', **datos):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.cliente(usuario).post(url, datos, format='json')
+
+    def test_renueva_todos_los_activos_con_un_resultado_por_prestamo(self):
+        Reserva.objects.create(libro=self.libros[1], usuario=self.docente)
+        Prestamo.objects.filter(pk=self.prestamos[2].pk).update(renovaciones=politicas.politica_base().max_renovaciones)
+
+        r = self.renovar(self.estudiante)
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.data['renovados'], 1)
+        self.assertEqual({resultado['prestamo_id']: resultado['resultado'] for resultado in r.data['resultados']}, {
+            self.prestamos[0].pk: 'renovado',
+            self.prestamos[1].pk: 'reservas_pendientes',
+            self.prestamos[2].pk: 'maximo_renovaciones',
+        })
+        renovado = Prestamo.objects.get(pk=self.prestamos[0].pk)
+        self.assertEqual(renovado.renovaciones, 1)
+        self.assertEqual(
+            renovado.fecha_devolucion_esperada, self.hoy + timedelta(days=7 + politicas.politica_base().dias_renovacion)
+        )
+        self.assertEqual(r.data['resultados'][0]['fecha_devolucion_esperada'], renovado.fecha_devolucion_esperada)
+
+    def test_prestamos_indicados_y_ajenos(self):
+        ajeno = Prestamo.objects.create(libro=self.libros[0], usuario=self.docente)
+        Prestamo.objects.filter(pk=self.prestamos[1].pk).update(estado='Devuelto')
+
+        r = self.renovar(self.estudiante, prestamos=[self.prestamos[1].pk, ajeno.pk, 99999])
+
+        self.assertEqual([resultado['resultado'] for resultado in r.data['resultados']], [
+            'no_activo', 'no_encontrado', 'no_encontrado'
+        ])
+        self.assertEqual(Prestamo.objects.get(pk=ajeno.pk).renovaciones, 0)
+
+    def test_consultas_constantes(self):
+        def consultas():
+            Prestamo.objects.filter(usuario=self.estudiante).update(
+                renovaciones=0, fecha_devolucion_esperada=self.hoy + timedelta(days=7)
+            )
+            with CaptureQueriesContext(connection) as capturadas:
+                circulacion.renovar_prestamos(usuario_id=self.estudiante.pk)
+            return len(capturadas)
+
+        antes = consultas()
+        with self.captureOnCommitCallbacks(execute=True):
+            for libro in self.libros:
+                Reserva.objects.create(libro=libro, usuario=self.estudiante)
+                Prestamo.objects.create(libro=libro, usuario=self.estudiante)
+        self.assertEqual(consultas(), antes)
+
+    def test_usuario_bloqueado(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Sancion.objects.create(usuario=self.estudiante, tipo='Multa', monto=Decimal('10'), descripcion='x')
+        self.assertEqual(estado_cuenta.bloqueados([self.estudiante.pk, self.docente.pk]), {self.estudiante.pk})
+
+        self.assertEqual(self.renovar(self.estudiante).status_code, 400)
+        # Sin pasar por la vista, el bloqueo se informa por préstamo
+        resultados = circulacion.renovar_prestamos(usuario_id=self.estudiante.pk)
+        self.assertEqual({resultado['resultado'] for resultado in resultados}, {'usuario_bloqueado'})
+
+    def test_variante_de_administracion(self):
+        otro = Prestamo.objects.create(
+            libro=self.libros[0], usuario=self.docente, fecha_devolucion_esperada=self.hoy + timedelta(days=7)
+        )
+        url = '/api/prestamos/renovar-lote/admin/'
+        self.assertEqual(self.renovar(self.estudiante, url, dias=10).status_code, 403)
+
+        r = self.renovar(self.admin, url, dias=10)
+
+        self.assertEqual(r.data['renovados'], 4)
+        self.assertEqual(
+            set(Prestamo.objects.values_list('fecha_devolucion_esperada', flat=True)), {self.hoy + timedelta(days=17)}
+        )
+        r = self.renovar(self.admin, url, usuario_id=self.docente.pk, dias=1)
+        self.assertEqual([resultado['prestamo_id'] for resultado in r.data['resultados']], [otro.pk])
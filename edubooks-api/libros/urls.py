@@ -9,15 +9,27 @@ urlpatterns = [
     path('libros/', views.LibroListView.as_view(), name='libro-list'),
     path('libros/<int:pk>/', views.LibroDetailView.as_view(), name='libro-detail'),
     path('libros/crear/', views.LibroCreateView.as_view(), name='libro-create'),
+    path('libros/lote/', views.consultar_libros_lote, name='libro-lote'),
+    path('libros/sugerencias/', views.sugerir_libros, name='libro-sugerencias'),
     path('libros/<int:pk>/actualizar/', views.LibroUpdateView.as_view(), name='libro-update'),
     path('libros/<int:pk>/eliminar/', views.LibroDeleteView.as_view(), name='libro-delete'),
     path('categorias/', views.obtener_categorias, name='categorias'),
     
+    # URLs de Ejemplares
+    path('ejemplares/', views.EjemplarListView.as_view(), name='ejemplar-list'),
+    path('ejemplares/crear/', views.EjemplarCreateView.as_view(), name='ejemplar-create'),
+    path('ejemplares/<int:pk>/actualizar/', views.EjemplarUpdateView.as_view(), name='ejemplar-update'),
+    path('ejemplares/codigo/<str:codigo_barras>/', views.consultar_ejemplar, name='ejemplar-codigo'),
+    
     # URLs de Préstamos
     path('prestamos/', views.PrestamoListView.as_view(), name='prestamo-list'),
+    path('prestamos/historial/', views.HistorialPrestamosView.as_view(), name='prestamo-historial'),
     path('prestamos/crear/', views.PrestamoCreateView.as_view(), name='prestamo-create'),
     path('prestamos/<int:pk>/', views.PrestamoDetailView.as_view(), name='prestamo-detail'),
+    path('prestamos/devolver-lote/', views.devolver_libros_lote, name='devolver-libros-lote'),
     path('prestamos/<int:prestamo_id>/devolver/', views.devolver_libro, name='devolver-libro'),
+    path('prestamos/renovar-lote/', views.renovar_prestamos_lote, name='renovar-prestamos-lote'),
+    path('prestamos/renovar-lote/admin/', views.renovar_prestamos_lote_admin, name='renovar-prestamos-lote-admin'),
     path('prestamos/<int:prestamo_id>/renovar/', views.renovar_prestamo, name='renovar-prestamo'),
     
     # URLs de Reservas
@@ -32,6 +44,9 @@ urlpatterns = [
     path('bibliografias/<int:pk>/actualizar/', views.BibliografiaUpdateView.as_view(), name='bibliografia-update'),
     path('bibliografias/<int:bibliografia_id>/agregar-libro/', views.agregar_libro_bibliografia, name='agregar-libro-bibliografia'),
     path('bibliografias/<int:bibliografia_id>/remover-libro/<int:libro_id>/', views.remover_libro_bibliografia, name='remover-libro-bibliografia'),
+    path('bibliografias/<int:bibliografia_id>/libros/', views.actualizar_libros_bibliografia, name='actualizar-libros-bibliografia'),
+    path('mi-panel/', views.MiPanelView.as_view(), name='mi-panel'),
+    path('mis-lecturas/', views.LecturasProgramaView.as_view(), name='lecturas-programa'),
     path('programas/', views.obtener_programas, name='obtener-programas'),
     path('bibliografias/programa/<str:programa>/', views.bibliografias_por_programa, name='bibliografias-por-programa'),
     
@@ -40,6 +55,13 @@ urlpatterns = [
     path('sanciones/crear/', views.SancionCreateView.as_view(), name='sancion-create'),
     path('sanciones/<int:sancion_id>/pagar/', views.pagar_multa, name='pagar-multa'),
     
+    # URLs de Políticas de Circulación
+    path('politicas/', views.PoliticaCirculacionListView.as_view(), name='politica-list'),
+    path('politicas/crear/', views.PoliticaCirculacionCreateView.as_view(), name='politica-create'),
+    path('politicas/vigente/', views.politica_vigente, name='politica-vigente'),
+    path('politicas/<int:pk>/actualizar/', views.PoliticaCirculacionUpdateView.as_view(), name='politica-update'),
+    path('politicas/<int:pk>/eliminar/', views.PoliticaCirculacionDeleteView.as_view(), name='politica-delete'),
+    
     # URLs de Estadísticas y Reportes
     path('estadisticas/', views.estadisticas_biblioteca, name='estadisticas'),
     path('prestamos-vencidos/', views.prestamos_vencidos, name='prestamos-vencidos'),
@@ -50,4 +72,14 @@ urlpatterns = [
     path('sanciones/<int:sancion_id>/aprobar/', views.aprobar_sancion, name='aprobar-sancion'),
     path('sanciones/<int:sancion_id>/rechazar/', views.rechazar_sancion, name='rechazar-sancion'),
     path('dashboard-sanciones/', views.dashboard_sanciones, name='dashboard-sanciones'),
+    
+    # URLs de Eventos
+    path('eventos/', views.feed_eventos, name='feed-eventos'),
+    
+    # URLs de Notificaciones
+    path('notificaciones/', views.mis_notificaciones, name='notificaciones'),
+    path('notificaciones/no-leidas/', views.notificaciones_no_leidas, name='notificaciones-no-leidas'),
+    path('notificaciones/leer-todas/', views.marcar_todas_leidas, name='notificaciones-leer-todas'),
+    path('notificaciones/<int:notificacion_id>/leer/', views.marcar_notificacion_leida, name='notificacion-leer'),
+    path('notificaciones/<int:notificacion_id>/eliminar/', views.eliminar_notificacion, name='notificacion-eliminar'),
 ]
\ No newline at end of file
@@ -0,0 +1,23 @@
+# libros/urls_async.py
+from django.urls import path
+from . import async_views
+
+app_name = 'libros_async'
+
+urlpatterns = [
+    # URLs de Libros
+    path('libros/', async_views.libro_list, name='libro-list'),
+    path('libros/<int:pk>/', async_views.libro_detail, name='libro-detail'),
+    path('libros/disponibilidad/', async_views.disponibilidad_libros, name='disponibilidad-libros'),
+    path('categorias/', async_views.obtener_categorias, name='categorias'),
+    
+    # URLs de Préstamos
+    path('prestamos/', async_views.mis_prestamos, name='prestamo-list'),
+    
+    # URLs de Estadísticas
+    path('estadisticas/', async_views.estadisticas_biblioteca, name='estadisticas'),
+    path('dashboard-sanciones/', async_views.dashboard_sanciones, name='dashboard-sanciones'),
+    
+    # URLs de Eventos
+    path('eventos/', async_views.feed_eventos, name='feed-eventos'),
+]
@@ -2,17 +2,31 @@
 from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
-from django.db.models import Q, Count
+from rest_framework.pagination import PageNumberPagination, CursorPagination
+from django.db import transaction
+from django.db.models import Q, Count, Max, Prefetch, Value, BooleanField
 from django.utils import timezone
 from datetime import timedelta
-from .models import Libro, Prestamo, Reserva, Bibliografia, Sancion
+from .models import (
+    Libro, Ejemplar, Prestamo, PrestamoHistorico, Reserva, Bibliografia, Sancion, LecturaPrograma, Notificacion,
+    PoliticaCirculacion
+)
 from .serializers import (
-    LibroSerializer, LibroDetalleSerializer, LibroListSerializer,
-    PrestamoSerializer, PrestamoListSerializer,
+    LibroSerializer, LibroDetalleSerializer, LibroListSerializer, LibroCirculacionSerializer, LibrosLoteSerializer,
+    EjemplarSerializer,
+    PrestamoSerializer, PrestamoListSerializer, DevolucionLoteSerializer, RenovacionLoteSerializer,
+    RenovacionLoteAdminSerializer, HistorialPrestamoSerializer,
+    NotificacionSerializer, PanelUsuarioSerializer,
     ReservaSerializer, ReservaListSerializer,
-    BibliografiaSerializer, SancionSerializer
+    BibliografiaSerializer, BibliografiaCompactaSerializer, BibliografiaLibrosLoteSerializer,
+    LecturaProgramaSerializer, SancionSerializer, PoliticaCirculacionSerializer
 )
+from . import circulacion, ejemplares, estado_cuenta, eventos, lecturas, politicas
+from .cache import RespuestaCacheadaMixin, cache_paneles
+from .indice_disponibilidad import DisponibilidadEnMemoriaMixin, filtrar_disponibles
+from .sugerencias import indice_sugerencias
+from usuarios.campos import ProyeccionCamposMixin
+from usuarios.condicional import RespuestaCondicionalMixin
 from usuarios.permissions import IsAdministrador, IsDocente, IsEstudiante
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -20,42 +34,66 @@ class StandardResultsSetPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+class LecturasCursorPagination(CursorPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('titulo', 'id')
+
 # ============ VISTAS DE LIBROS ============
 
-class LibroListView(generics.ListAPIView):
+def filtrar_catalogo(params):
+    """Aplica los filtros de búsqueda del catálogo (compartido por las vistas síncronas y asíncronas)"""
+    queryset = Libro.objects.all()
+    
+    # Filtros de búsqueda
+    titulo = params.get('titulo', None)
+    autor = params.get('autor', None)
+    categoria = params.get('categoria', None)
+    isbn = params.get('isbn', None)
+    disponible = params.get('disponible', None)
+    
+    if titulo:
+        queryset = queryset.filter(titulo__icontains=titulo)
+    if autor:
+        queryset = queryset.filter(autor__icontains=autor)
+    if categoria:
+        queryset = queryset.filter(categoria__icontains=categoria)
+    if isbn:
+        queryset = queryset.filter(isbn__icontains=isbn)
+    if disponible == 'true':
+        queryset = filtrar_disponibles(queryset)
+    
+    return queryset.order_by('titulo')
+
+class LibroListView(DisponibilidadEnMemoriaMixin, RespuestaCacheadaMixin, ProyeccionCamposMixin, generics.ListAPIView):
     """Lista y búsqueda de libros en el catálogo"""
     serializer_class = LibroListSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.IsAuthenticated]
+    parametros_cache = ('titulo', 'autor', 'categoria', 'isbn', 'disponible', 'page', 'page_size', 'fields', 'expand')
+    
+    def get_ambitos_cache(self):
+        return ['libros']
     
     def get_queryset(self):
-        queryset = Libro.objects.all()
-        
-        # Filtros de búsqueda
-        titulo = self.request.query_params.get('titulo', None)
-        autor = self.request.query_params.get('autor', None)
-        categoria = self.request.query_params.get('categoria', None)
-        isbn = self.request.query_params.get('isbn', None)
-        disponible = self.request.query_params.get('disponible', None)
-        
-        if titulo:
-            queryset = queryset.filter(titulo__icontains=titulo)
-        if autor:
-            queryset = queryset.filter(autor__icontains=autor)
-        if categoria:
-            queryset = queryset.filter(categoria__icontains=categoria)
-        if isbn:
-            queryset = queryset.filter(isbn__icontains=isbn)
-        if disponible == 'true':
-            queryset = queryset.filter(cantidad_disponible__gt=0)
-        
-        return queryset.order_by('titulo')
-
-class LibroDetailView(generics.RetrieveAPIView):
+        return filtrar_catalogo(self.request.query_params)
+
+class LibroDetailView(RespuestaCondicionalMixin, RespuestaCacheadaMixin, ProyeccionCamposMixin, generics.RetrieveAPIView):
     """Detalle de un libro específico"""
     queryset = Libro.objects.all()
     serializer_class = LibroDetalleSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # Los contadores del detalle forman parte de la versión: préstamos y reservas no escriben en el libro
+    campos_validador = (
+        'fecha_actualizacion',
+        circulacion.contador_por_libro(Prestamo.objects.filter(estado='Activo')),
+        circulacion.contador_por_libro(Reserva.objects.filter(estado='Activa')),
+    )
+    parametros_cache = ('fields', 'expand')
+    
+    def get_ambitos_cache(self):
+        return [f"libro:{self.kwargs['pk']}"]
 
 class LibroCreateView(generics.CreateAPIView):
     """Registro de nuevos libros (solo administradores)"""
@@ -73,6 +111,13 @@ class LibroCreateView(generics.CreateAPIView):
         self.perform_create(serializer)
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=201, headers=headers)
+    
+    def perform_create(self, serializer):
+        libro = serializer.save()
+        # Un ejemplar con código de barras por cada copia registrada
+        if libro.cantidad_total:
+            ejemplares.crear_ejemplares(libro, libro.cantidad_total)
+            libro.refresh_from_db()
 
 class LibroUpdateView(generics.UpdateAPIView):
     """Actualización de libros (solo administradores)"""
@@ -85,6 +130,51 @@ class LibroDeleteView(generics.DestroyAPIView):
     queryset = Libro.objects.all()
     permission_classes = [permissions.IsAuthenticated, IsAdministrador]
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def consultar_libros_lote(request):
+    """Resuelve en una petición varios libros por ID o ISBN (bibliografías, lectores de código de barras)"""
+    serializer = LibrosLoteSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    
+    libros, no_encontrados = circulacion.buscar_libros(
+        serializer.validated_data['ids'],
+        serializer.validated_data['isbns']
+    )
+    
+    return Response({
+        'total': len(libros),
+        'libros': LibroCirculacionSerializer(libros, many=True).data,
+        'no_encontrados': no_encontrados
+    })
+
+LIMITE_SUGERENCIAS = 20
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def sugerir_libros(request):
+    """Autocompletado: libros más prestados cuyo título o autor tiene palabras con los prefijos de ?q="""
+    consulta = request.query_params.get('q', '')
+    try:
+        limite = max(1, min(int(request.query_params.get('limite', 10)), LIMITE_SUGERENCIAS))
+    except ValueError:
+        return Response(
+            {'error': 'El parámetro limite debe ser un número entero'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    indice_sugerencias.actualizar()
+    ids = indice_sugerencias.buscar(consulta, limite)
+    libros = {
+        libro['id']: libro
+        for libro in Libro.objects.filter(id__in=ids).values('id', 'titulo', 'autor', 'categoria')
+    }
+    sugerencias = [
+        {**libros[libro_id], 'popularidad': indice_sugerencias.popularidad(libro_id)}
+        for libro_id in ids if libro_id in libros
+    ]
+    return Response({'q': consulta, 'sugerencias': sugerencias})
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def obtener_categorias(request):
@@ -92,9 +182,64 @@ def obtener_categorias(request):
     categorias = Libro.objects.values_list('categoria', flat=True).distinct().order_by('categoria')
     return Response({'categorias': list(categorias)})
 
+# ============ VISTAS DE EJEMPLARES ============
+
+class EjemplarListView(generics.ListAPIView):
+    """Ejemplares de los libros, filtrables por libro y estado (solo administradores)"""
+    serializer_class = EjemplarSerializer
+    pagination_class = StandardResultsSetPagination
+    permission_classes = [permissions.IsAuthenticated, IsAdministrador]
+    
+    def get_queryset(self):
+        queryset = Ejemplar.objects.select_related('libro')
+        
+        libro = self.request.query_params.get('libro', None)
+        if libro:
+            queryset = queryset.filter(libro_id=libro)
+        
+        estado = self.request.query_params.get('estado', None)
+        if estado:
+            queryset = queryset.filter(estado=estado)
+        
+        return queryset.order_by('libro_id', 'codigo_barras')
+
+class EjemplarCreateView(generics.CreateAPIView):
+    """Registro de un ejemplar; sin código de barras se genera uno (solo administradores)"""
+    queryset = Ejemplar.objects.all()
+    serializer_class = EjemplarSerializer
+    permission_classes = [permissions.IsAuthenticated, IsAdministrador]
+
+class EjemplarUpdateView(generics.UpdateAPIView):
+    """Cambio de ubicación o estado de un ejemplar: mantenimiento, baja (solo administradores)"""
+    queryset = Ejemplar.objects.all()
+    serializer_class = EjemplarSerializer
+    permission_classes = [permissions.IsAuthenticated, IsAdministrador]
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated, IsAdministrador])
+def consultar_ejemplar(request, codigo_barras):
+    """Ejemplar escaneado en el mostrador, con su libro y su préstamo abierto"""
+    try:
+        ejemplar = Ejemplar.objects.select_related('libro').get(codigo_barras=codigo_barras)
+    except Ejemplar.DoesNotExist:
+        return Response(
+            {'error': 'Ejemplar no encontrado'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    prestamo = ejemplar.prestamos.filter(
+        estado__in=estado_cuenta.ESTADOS_PRESTAMO_ABIERTOS
+    ).select_related('libro', 'usuario').first()
+    
+    return Response({
+        'ejemplar': EjemplarSerializer(ejemplar).data,
+        'libro': LibroListSerializer(ejemplar.libro).data,
+        'prestamo': PrestamoListSerializer(prestamo).data if prestamo else None
+    })
+
 # ============ VISTAS DE PRÉSTAMOS ============
 
-class PrestamoListView(generics.ListAPIView):
+class PrestamoListView(ProyeccionCamposMixin, generics.ListAPIView):
     """Lista de préstamos (filtrada por usuario o todos para admin)"""
     serializer_class = PrestamoListSerializer
     pagination_class = StandardResultsSetPagination
@@ -123,21 +268,56 @@ class PrestamoCreateView(generics.CreateAPIView):
     
     def perform_create(self, serializer):
         from rest_framework import serializers
-        # Verificar si el usuario tiene sanciones activas
-        sanciones_activas = Sancion.objects.filter(
-            usuario=self.request.user,
-            estado='Activa'
-        )
+        # Verificar si el usuario tiene sanciones vigentes (suspensión o multas pendientes)
+        motivo = estado_cuenta.motivo_bloqueo(self.request.user)
         
-        if sanciones_activas.exists():
-            raise serializers.ValidationError("No puedes solicitar préstamos mientras tengas sanciones activas.")
+        if motivo:
+            raise serializers.ValidationError(
+                f"No puedes solicitar préstamos mientras tengas sanciones activas. {motivo}"
+            )
         
         serializer.save()
 
-class PrestamoDetailView(generics.RetrieveAPIView):
+class HistorialPrestamosView(generics.ListAPIView):
+    """Historial completo de préstamos, leyendo de forma transparente los activos y los archivados"""
+    serializer_class = HistorialPrestamoSerializer
+    pagination_class = StandardResultsSetPagination
+    permission_classes = [permissions.IsAuthenticated]
+    
+    CAMPOS = [
+        'id', 'libro_id', 'libro__titulo', 'libro__autor', 'fecha_prestamo',
+        'fecha_devolucion_esperada', 'fecha_devolucion_real', 'estado', 'renovaciones', 'archivado'
+    ]
+    
+    def get_queryset(self):
+        from rest_framework import serializers
+        user = self.request.user
+        filtro = Q(usuario=user)
+        
+        if user.rol == 'Administrador':
+            usuario_id = self.request.query_params.get('usuario', None)
+            if usuario_id and not usuario_id.isdigit():
+                raise serializers.ValidationError({'error': 'usuario debe ser un número entero'})
+            filtro = Q(usuario_id=usuario_id) if usuario_id else Q()
+        
+        estado = self.request.query_params.get('estado', None)
+        if estado:
+            filtro &= Q(estado=estado)
+        
+        recientes = Prestamo.objects.filter(filtro).annotate(
+            archivado=Value(False, output_field=BooleanField())
+        ).values(*self.CAMPOS).order_by()
+        archivados = PrestamoHistorico.objects.filter(filtro).annotate(
+            archivado=Value(True, output_field=BooleanField())
+        ).values(*self.CAMPOS).order_by()
+        
+        return recientes.union(archivados, all=True).order_by('-fecha_prestamo', '-id')
+
+class PrestamoDetailView(RespuestaCondicionalMixin, ProyeccionCamposMixin, generics.RetrieveAPIView):
     """Detalle de un préstamo específico"""
     serializer_class = PrestamoSerializer
     permission_classes = [permissions.IsAuthenticated]
+    campos_validador = ('fecha_actualizacion', 'libro__fecha_actualizacion', 'usuario__fecha_actualizacion')
     
     def get_queryset(self):
         user = self.request.user
@@ -151,7 +331,7 @@ class PrestamoDetailView(generics.RetrieveAPIView):
 def devolver_libro(request, prestamo_id):
     """Procesar devolución de libro (solo administradores)"""
     try:
-        prestamo = Prestamo.objects.get(id=prestamo_id)
+        prestamo = Prestamo.objects.select_related('libro', 'usuario').get(id=prestamo_id)
         
         if prestamo.estado != 'Activo':
             return Response(
@@ -160,13 +340,14 @@ def devolver_libro(request, prestamo_id):
             )
         
         prestamo.estado = 'Devuelto'
-        prestamo.fecha_devolucion_real = timezone.now().date()
+        prestamo.fecha_devolucion_real = timezone.now()
         prestamo.save()
         
-        # Verificar si hay retraso y aplicar sanción si es necesario
-        if prestamo.fecha_devolucion_real > prestamo.fecha_devolucion_esperada:
-            dias_retraso = (prestamo.fecha_devolucion_real - prestamo.fecha_devolucion_esperada).days
-            monto_multa = dias_retraso * 5000  # $5000 por día de retraso
+        # Verificar si hay retraso y aplicar la multa diaria de la política
+        dias_retraso = (timezone.localdate(prestamo.fecha_devolucion_real) - prestamo.fecha_devolucion_esperada).days
+        if dias_retraso > 0:
+            politica = politicas.obtener(prestamo.usuario.rol, prestamo.libro.categoria)
+            monto_multa = politica.multa(dias_retraso)
             
             Sancion.objects.create(
                 usuario=prestamo.usuario,
@@ -186,12 +367,32 @@ def devolver_libro(request, prestamo_id):
             status=status.HTTP_404_NOT_FOUND
         )
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated, IsAdministrador])
+def devolver_libros_lote(request):
+    """Procesar en lote las devoluciones del buzón por ID de préstamo o ISBN (solo administradores)"""
+    serializer = DevolucionLoteSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    
+    resultados = circulacion.devolver_prestamos(
+        serializer.validated_data['prestamos'],
+        serializer.validated_data['isbns'],
+        serializer.validated_data['codigos']
+    )
+    
+    return Response({
+        'message': 'Devoluciones procesadas',
+        'devueltos': sum(1 for r in resultados if r['resultado'] == 'devuelto'),
+        'multas': sum(1 for r in resultados if 'multa' in r),
+        'resultados': resultados
+    })
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def renovar_prestamo(request, prestamo_id):
     """Renovar préstamo (si es posible)"""
     try:
-        prestamo = Prestamo.objects.get(id=prestamo_id, usuario=request.user)
+        prestamo = Prestamo.objects.select_related('libro').get(id=prestamo_id, usuario=request.user)
         
         if prestamo.estado != 'Activo':
             return Response(
@@ -199,9 +400,17 @@ def renovar_prestamo(request, prestamo_id):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        if prestamo.renovaciones >= 2:
+        motivo = estado_cuenta.motivo_bloqueo(request.user)
+        if motivo:
             return Response(
-                {'error': 'Ya has alcanzado el máximo de renovaciones (2)'},
+                {'error': f'No puedes renovar préstamos mientras tengas sanciones activas. {motivo}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        politica = politicas.obtener(request.user.rol, prestamo.libro.categoria)
+        if prestamo.renovaciones >= politica.max_renovaciones:
+            return Response(
+                {'error': f'Ya has alcanzado el máximo de renovaciones ({politica.max_renovaciones})'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
@@ -219,7 +428,7 @@ def renovar_prestamo(request, prestamo_id):
         
         # Renovar préstamo
         prestamo.renovaciones += 1
-        prestamo.fecha_devolucion_esperada += timedelta(days=15)
+        prestamo.fecha_devolucion_esperada += timedelta(days=politica.dias_renovacion)
         prestamo.save()
         
         serializer = PrestamoSerializer(prestamo)
@@ -231,9 +440,53 @@ def renovar_prestamo(request, prestamo_id):
             status=status.HTTP_404_NOT_FOUND
         )
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def renovar_prestamos_lote(request):
+    """Renovar varios préstamos propios (todos los activos si no se indican)"""
+    serializer = RenovacionLoteSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    
+    motivo = estado_cuenta.motivo_bloqueo(request.user)
+    if motivo:
+        return Response(
+            {'error': f'No puedes renovar préstamos mientras tengas sanciones activas. {motivo}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    resultados = circulacion.renovar_prestamos(
+        serializer.validated_data.get('prestamos'),
+        usuario_id=request.user.pk
+    )
+    
+    return Response({
+        'message': 'Renovaciones procesadas',
+        'renovados': sum(1 for r in resultados if r['resultado'] == 'renovado'),
+        'resultados': resultados
+    })
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated, IsAdministrador])
+def renovar_prestamos_lote_admin(request):
+    """Renovar en lote préstamos de cualquier usuario, p. ej. por un cierre de la biblioteca (solo administradores)"""
+    serializer = RenovacionLoteAdminSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    
+    resultados = circulacion.renovar_prestamos(
+        serializer.validated_data.get('prestamos'),
+        usuario_id=serializer.validated_data.get('usuario_id'),
+        dias=serializer.validated_data.get('dias')
+    )
+    
+    return Response({
+        'message': 'Renovaciones procesadas',
+        'renovados': sum(1 for r in resultados if r['resultado'] == 'renovado'),
+        'resultados': resultados
+    })
+
 # ============ VISTAS DE RESERVAS ============
 
-class ReservaListView(generics.ListAPIView):
+class ReservaListView(ProyeccionCamposMixin, generics.ListAPIView):
     """Lista de reservas (filtrada por usuario o todas para admin)"""
     serializer_class = ReservaListSerializer
     pagination_class = StandardResultsSetPagination
@@ -286,12 +539,48 @@ def cancelar_reserva(request, reserva_id):
 
 # ============ VISTAS DE BIBLIOGRAFÍA ============
 
-class BibliografiaListView(generics.ListAPIView):
+def expandir_libros(request):
+    """Indica si se pidieron las bibliografías con los libros completos (?expand=libros)"""
+    return 'libros' in request.query_params.get('expand', '').split(',')
+
+def precargar_libros(queryset, expandir=False):
+    """Precarga docente y libros; en modo compacto solo se leen las columnas del listado"""
+    if expandir:
+        return queryset.select_related('docente').prefetch_related('libros')
+    libros = Libro.objects.only(*LibroListSerializer.Meta.fields)
+    return queryset.select_related('docente').prefetch_related(Prefetch('libros', queryset=libros))
+
+def libros_relacionados(bibliografias):
+    """Diccionario deduplicado {id: libro} con los libros de las bibliografías dadas"""
+    libros = {}
+    for bibliografia in bibliografias:
+        for libro in bibliografia.libros.all():
+            libros.setdefault(libro.pk, libro)
+    return {
+        str(pk): datos
+        for pk, datos in zip(libros, LibroListSerializer(libros.values(), many=True).data)
+    }
+
+class BibliografiaListView(ProyeccionCamposMixin, generics.ListAPIView):
     """Lista de bibliografías (propias para docentes, filtradas por programa para estudiantes)"""
-    serializer_class = BibliografiaSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.IsAuthenticated]
     
+    def get_serializer_class(self):
+        if expandir_libros(self.request):
+            return BibliografiaSerializer
+        return BibliografiaCompactaSerializer
+    
+    def list(self, request, *args, **kwargs):
+        if expandir_libros(request):
+            return super().list(request, *args, **kwargs)
+        
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        serializer = self.get_serializer(page, many=True)
+        response = self.get_paginated_response(serializer.data)
+        response.data['libros'] = libros_relacionados(page)
+        return response
+    
     def get_queryset(self):
         user = self.request.user
         queryset = Bibliografia.objects.none()
@@ -321,6 +610,7 @@ class BibliografiaListView(generics.ListAPIView):
         if activa is not None:
             queryset = queryset.filter(activa=activa.lower() == 'true')
         
+        queryset = precargar_libros(queryset, expandir_libros(self.request))
         return queryset.order_by('-fecha_creacion')
 
 class BibliografiaCreateView(generics.CreateAPIView):
@@ -337,10 +627,14 @@ class BibliografiaUpdateView(generics.UpdateAPIView):
     def get_queryset(self):
         return Bibliografia.objects.filter(docente=self.request.user)
 
-class BibliografiaDetailView(generics.RetrieveAPIView):
+class BibliografiaDetailView(RespuestaCondicionalMixin, ProyeccionCamposMixin, generics.RetrieveAPIView):
     """Detalle de una bibliografía"""
     serializer_class = BibliografiaSerializer
     permission_classes = [permissions.IsAuthenticated]
+    campos_validador = (
+        'fecha_actualizacion', 'docente__fecha_actualizacion',
+        Max('libros__fecha_actualizacion'), Count('libros')
+    )
     
     def get_queryset(self):
         user = self.request.user
@@ -436,6 +730,61 @@ def remover_libro_bibliografia(request, bibliografia_id, libro_id):
             status=status.HTTP_404_NOT_FOUND
         )
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated, IsDocente])
+def actualizar_libros_bibliografia(request, bibliografia_id):
+    """Agregar y remover varios libros de una bibliografía en una sola operación (solo docente propietario)"""
+    try:
+        bibliografia = Bibliografia.objects.get(id=bibliografia_id, docente=request.user)
+    except Bibliografia.DoesNotExist:
+        return Response(
+            {'error': 'Bibliografía no encontrada o no tienes permisos'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    serializer = BibliografiaLibrosLoteSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    agregar = set(serializer.validated_data['agregar'])
+    remover = set(serializer.validated_data['remover'])
+    
+    # Validar todos los libros a agregar con una sola consulta
+    existentes = set(Libro.objects.filter(id__in=agregar).values_list('id', flat=True))
+    no_encontrados = agregar - existentes
+    if no_encontrados:
+        return Response(
+            {'error': f'Los siguientes IDs de libros no existen: {sorted(no_encontrados)}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    Through = Bibliografia.libros.through
+    with transaction.atomic():
+        actuales = set(
+            Through.objects.filter(bibliografia_id=bibliografia.id).values_list('libro_id', flat=True)
+        )
+        nuevos = agregar - actuales
+        quitados = remover & actuales
+        
+        Through.objects.bulk_create(
+            [Through(bibliografia_id=bibliografia.id, libro_id=libro_id) for libro_id in nuevos],
+            ignore_conflicts=True
+        )
+        if quitados:
+            Through.objects.filter(bibliografia_id=bibliografia.id, libro_id__in=quitados).delete()
+        
+        # Las operaciones masivas sobre la tabla intermedia no emiten m2m_changed
+        if nuevos or quitados:
+            lecturas.refrescar_programas([bibliografia.programa])
+            Bibliografia.objects.filter(id=bibliografia.id).update(fecha_actualizacion=timezone.now())
+    
+    return Response({
+        'message': 'Bibliografía actualizada exitosamente',
+        'agregados': sorted(nuevos),
+        'removidos': sorted(quitados),
+        'ya_presentes': sorted(agregar & actuales),
+        'no_presentes': sorted(remover - actuales),
+        'total_libros': len(actuales) + len(nuevos) - len(quitados)
+    })
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def obtener_programas(request):
@@ -469,12 +818,39 @@ def bibliografias_por_programa(request, programa):
     else:
         bibliografias = Bibliografia.objects.none()
     
-    serializer = BibliografiaSerializer(bibliografias, many=True)
-    return Response(serializer.data)
+    if expandir_libros(request):
+        bibliografias = precargar_libros(bibliografias, expandir=True)
+        serializer = BibliografiaSerializer(bibliografias, many=True)
+        return Response(serializer.data)
+    
+    bibliografias = list(precargar_libros(bibliografias))
+    serializer = BibliografiaCompactaSerializer(bibliografias, many=True)
+    return Response({
+        'bibliografias': serializer.data,
+        'libros': libros_relacionados(bibliografias)
+    })
+
+class LecturasProgramaView(generics.ListAPIView):
+    """Libros de todas las bibliografías del programa del estudiante, con disponibilidad"""
+    serializer_class = LecturaProgramaSerializer
+    pagination_class = LecturasCursorPagination
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get_queryset(self):
+        user = self.request.user
+        
+        if user.rol == 'Estudiante':
+            programa = user.carrera
+        else:
+            programa = self.request.query_params.get('programa', None)
+        
+        if not programa:
+            return LecturaPrograma.objects.none()
+        return LecturaPrograma.objects.filter(programa=programa)
 
 # ============ VISTAS DE SANCIONES ============
 
-class SancionListView(generics.ListAPIView):
+class SancionListView(ProyeccionCamposMixin, generics.ListAPIView):
     """Lista de sanciones (propias o todas para admin)"""
     serializer_class = SancionSerializer
     pagination_class = StandardResultsSetPagination
@@ -520,7 +896,7 @@ def pagar_multa(request, sancion_id):
             )
         
         sancion.estado = 'Pagada'
-        sancion.fecha_fin = timezone.now().date()
+        sancion.fecha_fin = timezone.now()
         sancion.save()
         
         serializer = SancionSerializer(sancion)
@@ -532,6 +908,38 @@ def pagar_multa(request, sancion_id):
             status=status.HTTP_404_NOT_FOUND
         )
 
+# ============ VISTAS DE POLÍTICAS DE CIRCULACIÓN ============
+
+class PoliticaCirculacionListView(generics.ListAPIView):
+    """Reglas de circulación configuradas (solo administradores)"""
+    queryset = PoliticaCirculacion.objects.all()
+    serializer_class = PoliticaCirculacionSerializer
+    permission_classes = [permissions.IsAuthenticated, IsAdministrador]
+
+class PoliticaCirculacionCreateView(generics.CreateAPIView):
+    """Nueva regla de circulación por rol y categoría (solo administradores)"""
+    queryset = PoliticaCirculacion.objects.all()
+    serializer_class = PoliticaCirculacionSerializer
+    permission_classes = [permissions.IsAuthenticated, IsAdministrador]
+
+class PoliticaCirculacionUpdateView(generics.UpdateAPIView):
+    """Actualización de una regla de circulación (solo administradores)"""
+    queryset = PoliticaCirculacion.objects.all()
+    serializer_class = PoliticaCirculacionSerializer
+    permission_classes = [permissions.IsAuthenticated, IsAdministrador]
+
+class PoliticaCirculacionDeleteView(generics.DestroyAPIView):
+    """Eliminación de una regla de circulación (solo administradores)"""
+    queryset = PoliticaCirculacion.objects.all()
+    permission_classes = [permissions.IsAuthenticated, IsAdministrador]
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def politica_vigente(request):
+    """Política que se aplica al usuario actual para la categoría indicada (?categoria=)"""
+    politica = politicas.obtener(request.user.rol, request.query_params.get('categoria', ''))
+    return Response(politica._asdict())
+
 # ============ VISTAS DE ESTADÍSTICAS ============
 
 @api_view(['GET'])
@@ -664,7 +1072,7 @@ def rechazar_sancion(request, sancion_id):
         
         # Marcar como completada (rechazada)
         sancion.estado = 'Completada'
-        sancion.fecha_fin = timezone.now().date()
+        sancion.fecha_fin = timezone.now()
         sancion.save()
         
         serializer = SancionSerializer(sancion)
@@ -733,3 +1141,115 @@ def obtener_categorias(request):
     return Response({
         'categorias': list(categorias)
     })
+
+# ============ VISTAS DE EVENTOS ============
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def feed_eventos(request):
+    """Eventos de circulación posteriores al cursor `desde`; sin cursor devuelve el cursor actual"""
+    desde, limite, _ = eventos.parametros_feed(request.query_params)
+    if desde is None:
+        return Response({'eventos': [], 'cursor': eventos.ultimo_cursor(), 'hay_mas': False})
+    
+    lista, cursor, hay_mas = eventos.leer(eventos.visibles(request.user), desde, limite)
+    return Response(eventos.respuesta_feed(lista, cursor, hay_mas))
+
+# ============ VISTAS DE NOTIFICACIONES ============
+
+LIMITE_NOTIFICACIONES = 100
+
+def contar_no_leidas(usuario):
+    # Recorre solo el índice parcial de notificaciones no leídas
+    return Notificacion.objects.filter(usuario=usuario, leida=False).count()
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def mis_notificaciones(request):
+    """Notificaciones del usuario; con ?desde=<cursor> solo las posteriores (delta para la app, por páginas)"""
+    try:
+        desde = int(request.query_params.get('desde') or 0)
+    except ValueError:
+        return Response(
+            {'error': 'desde debe ser un número entero'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    queryset = Notificacion.objects.filter(usuario=request.user)
+    no_leidas = request.query_params.get('no_leidas') == 'true'
+    if no_leidas:
+        queryset = queryset.filter(leida=False)
+    
+    # En orden ascendente y solo hasta el horizonte: un aviso confirmado tarde con un ID menor
+    # no queda detrás del cursor, y con más de LIMITE_NOTIFICACIONES se sigue desde el último entregado
+    notificaciones, cursor, hay_mas = eventos.leer(queryset, desde, LIMITE_NOTIFICACIONES)
+    if no_leidas and not hay_mas:
+        # El cursor no avanza sobre las leídas que se omitieron
+        cursor = notificaciones[-1].id if notificaciones else desde
+    return Response({
+        'notificaciones': NotificacionSerializer(notificaciones, many=True).data,
+        'no_leidas': contar_no_leidas(request.user),
+        'cursor': cursor,
+        'hay_mas': hay_mas
+    })
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def notificaciones_no_leidas(request):
+    """Número de notificaciones sin leer (para el contador de la app)"""
+    return Response({'no_leidas': contar_no_leidas(request.user)})
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def marcar_notificacion_leida(request, notificacion_id):
+    """Marcar una notificación como leída"""
+    actualizadas = Notificacion.objects.filter(
+        id=notificacion_id,
+        usuario=request.user
+    ).update(leida=True)
+    
+    if not actualizadas:
+        return Response(
+            {'error': 'Notificación no encontrada'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    return Response({'message': 'Notificación marcada como leída', 'no_leidas': contar_no_leidas(request.user)})
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def marcar_todas_leidas(request):
+    """Marcar todas las notificaciones del usuario como leídas"""
+    actualizadas = Notificacion.objects.filter(usuario=request.user, leida=False).update(leida=True)
+    return Response({'message': 'Notificaciones marcadas como leídas', 'actualizadas': actualizadas, 'no_leidas': 0})
+
+@api_view(['DELETE'])
+@permission_classes([permissions.IsAuthenticated])
+def eliminar_notificacion(request, notificacion_id):
+    """Eliminar una notificación del usuario"""
+    eliminadas, _ = Notificacion.objects.filter(id=notificacion_id, usuario=request.user).delete()
+    
+    if not eliminadas:
+        return Response(
+            {'error': 'Notificación no encontrada'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    return Response({'message': 'Notificación eliminada'})
+
+# ============ PANEL DEL USUARIO ============
+
+class MiPanelView(RespuestaCacheadaMixin, generics.RetrieveAPIView):
+    """Préstamos, reservas, multas y bibliografías del usuario en una sola respuesta (pantalla de inicio)"""
+    serializer_class = PanelUsuarioSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    cache_respuestas = cache_paneles
+    
+    def get_object(self):
+        return self.request.user
+    
+    def get_ambitos_cache(self):
+        user = self.request.user
+        # La fecha forma parte de la clave porque los días restantes cambian a medianoche
+        ambitos = [f'usuario:{user.pk}', f'dia:{timezone.localdate().isoformat()}']
+        if user.carrera:
+            ambitos.append(f'programa:{user.carrera}')
+        return ambitos
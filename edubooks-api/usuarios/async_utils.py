@@ -0,0 +1,116 @@
+# usuarios/async_utils.py
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import HttpResponse
+from rest_framework import exceptions
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from edubooks.renderers import renderizar_json
+
+
+def respuesta_json(data, status=200):
+    """Codifica la respuesta con el mismo renderer JSON que usan las vistas de DRF"""
+    return HttpResponse(renderizar_json(data), status=status, content_type='application/json')
+
+
+def _error(exc):
+    # Mismo cuerpo que genera el manejador de excepciones de DRF
+    data = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+    return respuesta_json(data, status=exc.status_code)
+
+
+def api_async(roles=None):
+    """
+    Equivalente asíncrono de @api_view(['GET']) + @permission_classes.
+
+    Autentica con JWT igual que las vistas de DRF y, si se indican `roles`,
+    exige que el usuario tenga uno de ellos.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        async def envoltura(request, *args, **kwargs):
+            if request.method != 'GET':
+                return _error(exceptions.MethodNotAllowed(request.method))
+
+            try:
+                resultado = await sync_to_async(JWTAuthentication().authenticate)(request)
+            except exceptions.AuthenticationFailed as exc:
+                return _error(exc)
+            if resultado is None:
+                return _error(exceptions.NotAuthenticated())
+
+            request.user = resultado[0]
+            if roles and request.user.rol not in roles:
+                return _error(exceptions.PermissionDenied())
+
+            try:
+                return await vista(request, *args, **kwargs)
+            except exceptions.APIException as exc:
+                return _error(exc)
+        return envoltura
+    return decorador
+
+
+async def paginar(request, queryset, serializer_class, page_size=50, max_page_size=100):
+    """Paginación asíncrona con el mismo formato que StandardResultsSetPagination"""
+    try:
+        pagina = max(int(request.GET.get('page', 1)), 1)
+        tamano = min(max(int(request.GET.get('page_size', page_size)), 1), max_page_size)
+    except ValueError:
+        raise exceptions.NotFound('Página inválida.')
+
+    inicio = (pagina - 1) * tamano
+    # Las consultas del ORM asíncrono comparten un único hilo, así que un gather
+    # no las solaparía: se ejecutan una tras otra
+    total = await queryset.acount()
+    objetos = await _listar(queryset[inicio:inicio + tamano])
+    if pagina > 1 and not objetos:
+        raise exceptions.NotFound('Página inválida.')
+
+    url = request.build_absolute_uri()
+    siguiente = replace_query_param(url, 'page', pagina + 1) if inicio + tamano < total else None
+    if pagina == 1:
+        anterior = None
+    elif pagina == 2:
+        anterior = remove_query_param(url, 'page')
+    else:
+        anterior = replace_query_param(url, 'page', pagina - 1)
+
+    return {
+        'count': total,
+        'next': siguiente,
+        'previous': anterior,
+        'results': serializer_class(objetos, many=True).data
+    }
+
+
+async def _listar(queryset):
+    return [objeto async for objeto in queryset]
+
+
+async def consultas_concurrentes(**consultas):
+    """
+    Ejecuta consultas independientes en paralelo con asyncio.gather.
+
+    El ORM asíncrono de Django serializa las consultas en un único hilo, así
+    que cada consulta se ejecuta en un hilo del ejecutor. Los hilos se
+    reutilizan y conservan su conexión mientras lo permita CONN_MAX_AGE,
+    igual que al final de una petición síncrona.
+    """
+    def ejecutar(consulta):
+        close_old_connections()
+        try:
+            return consulta()
+        finally:
+            close_old_connections()
+
+    nombres = list(consultas)
+    resultados = await asyncio.gather(*(
+        sync_to_async(ejecutar, thread_sensitive=False)(consultas[nombre])
+        for nombre in nombres
+    ))
+    return dict(zip(nombres, resultados))
@@ -0,0 +1,26 @@
+# usuarios/async_views.py
+from .async_utils import api_async, consultas_concurrentes, respuesta_json
+from .models import Usuario
+
+@api_async(roles=['Administrador'])
+async def estadisticas_usuarios(request):
+    """Estadísticas de usuarios para el dashboard con las consultas en paralelo"""
+    datos = await consultas_concurrentes(
+        total_usuarios=lambda: Usuario.objects.count(),
+        usuarios_activos=lambda: Usuario.objects.filter(activo=True).count(),
+        usuarios_inactivos=lambda: Usuario.objects.filter(activo=False).count(),
+        estudiantes=lambda: Usuario.objects.filter(rol='Estudiante').count(),
+        docentes=lambda: Usuario.objects.filter(rol='Docente').count(),
+        administradores=lambda: Usuario.objects.filter(rol='Administrador').count(),
+    )
+    
+    return respuesta_json({
+        'total_usuarios': datos['total_usuarios'],
+        'usuarios_activos': datos['usuarios_activos'],
+        'usuarios_inactivos': datos['usuarios_inactivos'],
+        'por_rol': {
+            'estudiantes': datos['estudiantes'],
+            'docentes': datos['docentes'],
+            'administradores': datos['administradores']
+        }
+    })
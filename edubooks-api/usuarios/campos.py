@@ -0,0 +1,196 @@
+# usuarios/campos.py
+"""
+Representaciones parciales: ?fields= y ?expand=.
+
+`?fields=id,titulo,libro.titulo` limita la respuesta a los campos pedidos
+(con notación de punto para los objetos anidados) y `?expand=libro` pide
+una relación completa. Cuando se usa `fields`, una relación nombrada sin
+subcampos ni expansión se devuelve solo como su ID. Sin `fields` la
+respuesta es la de siempre.
+
+Las vistas derivan del serializer ya recortado el select_related y el
+only() del queryset: una petición más estrecha lee menos columnas y no
+hace JOIN con relaciones que no se devuelven.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+METODOS_PARCIALES = ('GET', 'HEAD')
+
+
+def _arbol(valor):
+    """'id,libro.titulo' -> {'id': {}, 'libro': {'titulo': {}}}"""
+    arbol = {}
+    for ruta in valor.split(','):
+        nodo = arbol
+        for parte in ruta.strip().split('.'):
+            if parte:
+                nodo = nodo.setdefault(parte, {})
+    return arbol
+
+
+def campos_solicitados(request):
+    """Árbol de ?fields= (None si no se pidió) y rutas de ?expand= de una petición de lectura"""
+    if request is None or request.method not in METODOS_PARCIALES:
+        return None, set()
+    fields = request.query_params.get('fields', '')
+    expand = request.query_params.get('expand', '')
+    campos = _arbol(fields) if fields.strip() else None
+    expandir = {ruta.strip() for ruta in expand.split(',') if ruta.strip()}
+    return campos, expandir
+
+
+def _anidado(campo):
+    """Serializer anidado de un campo (el hijo si es una lista) o None"""
+    if isinstance(campo, serializers.ListSerializer):
+        return campo.child
+    if isinstance(campo, serializers.BaseSerializer):
+        return campo
+    return None
+
+
+def _subexpansion(expandir, nombre):
+    prefijo = f'{nombre}.'
+    return {ruta[len(prefijo):] for ruta in expandir if ruta.startswith(prefijo)}
+
+
+class CamposParcialesMixin:
+    """
+    ModelSerializer que respeta ?fields= y ?expand= de la petición.
+
+    Los serializers anidados reciben su parte del árbol como argumentos
+    (`campos`, `expandir`). `Meta.columnas_metodos` declara las columnas
+    que lee cada SerializerMethodField, para que la vista pueda seguir
+    usando only() cuando se piden.
+    """
+
+    def __init__(self, *args, campos=None, expandir=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if expandir is None:
+            campos, expandir = campos_solicitados(self.context.get('request'))
+        if campos is not None:
+            self._recortar(campos, expandir)
+
+    def _recortar(self, campos, expandir):
+        for nombre in list(self.fields):
+            campo = self.fields[nombre]
+            if nombre not in campos or campo.write_only:
+                self.fields.pop(nombre)
+                continue
+
+            anidado = _anidado(campo)
+            if anidado is None or not isinstance(anidado, CamposParcialesMixin):
+                continue
+
+            many = isinstance(campo, serializers.ListSerializer)
+            fuente = {} if campo.source == nombre else {'source': campo.source}
+            if nombre in expandir:
+                self.fields[nombre] = type(anidado)(
+                    campos=None, expandir=set(), read_only=True, many=many, **fuente
+                )
+            elif campos[nombre]:
+                self.fields[nombre] = type(anidado)(
+                    campos=campos[nombre], expandir=_subexpansion(expandir, nombre),
+                    read_only=True, many=many, **fuente
+                )
+            else:
+                self.fields[nombre] = serializers.PrimaryKeyRelatedField(read_only=True, many=many, **fuente)
+
+
+def _relacion_directa(modelo, nombre):
+    """Campo ForeignKey/OneToOne de `modelo` llamado `nombre`, o None"""
+    try:
+        campo = modelo._meta.get_field(nombre)
+    except FieldDoesNotExist:
+        return None
+    if campo.concrete and (campo.many_to_one or campo.one_to_one):
+        return campo
+    return None
+
+
+def _proyeccion(serializer, prefijo=''):
+    """
+    Columnas para only() (None si no se pueden deducir) y relaciones para
+    select_related necesarias para representar con `serializer`.
+    """
+    modelo = serializer.Meta.model
+    columnas = {prefijo + modelo._meta.pk.name}
+    relaciones = []
+    exacto = True
+    columnas_metodos = getattr(serializer.Meta, 'columnas_metodos', {})
+
+    for nombre, campo in serializer.fields.items():
+        if campo.write_only:
+            continue
+        if isinstance(campo, serializers.SerializerMethodField):
+            if nombre in columnas_metodos:
+                columnas.update(prefijo + columna for columna in columnas_metodos[nombre])
+            else:
+                exacto = False
+            continue
+
+        ruta = campo.source.split('.')
+        anidado = _anidado(campo)
+        many = isinstance(campo, (serializers.ListSerializer, serializers.ManyRelatedField))
+
+        if len(ruta) == 1 and many:
+            # Relaciones múltiples: se cargan con consultas aparte (prefetch) a partir de la PK
+            continue
+        if len(ruta) == 1 and _relacion_directa(modelo, ruta[0]):
+            columnas.add(prefijo + ruta[0])
+            if anidado is not None:
+                relaciones.append(prefijo + ruta[0])
+                subcolumnas, subrelaciones = _proyeccion(anidado, f'{prefijo}{ruta[0]}__')
+                relaciones.extend(subrelaciones)
+                # Sin columnas deducibles, la relación se carga completa
+                columnas.update(subcolumnas or ())
+        elif len(ruta) == 1:
+            try:
+                columna = modelo._meta.get_field(ruta[0])
+            except FieldDoesNotExist:
+                columna = None
+            if columna is not None and columna.concrete:
+                columnas.add(prefijo + ruta[0])
+            else:
+                exacto = False
+        elif len(ruta) == 2 and _relacion_directa(modelo, ruta[0]):
+            # Campo de una relación (p. ej. source='usuario.nombre')
+            relaciones.append(prefijo + ruta[0])
+            columnas.update((prefijo + ruta[0], f'{prefijo}{ruta[0]}__{ruta[1]}'))
+        else:
+            exacto = False
+
+    return (columnas if exacto else None), relaciones
+
+
+def _rutas_unidas(arbol, prefijo=''):
+    """Rutas de un select_related ya aplicado ({'prestamo': {'libro': {}}} -> prestamo, prestamo__libro)"""
+    for nombre, subarbol in arbol.items():
+        yield prefijo + nombre
+        yield from _rutas_unidas(subarbol, f'{prefijo}{nombre}__')
+
+
+def proyectar(queryset, serializer, parcial=False):
+    """Aplica al queryset los JOIN (y, si la representación es parcial, las columnas) de `serializer`"""
+    columnas, relaciones = _proyeccion(serializer)
+    if parcial and columnas is not None:
+        unidas = queryset.query.select_related
+        if unidas is True:
+            columnas = None
+        elif unidas:
+            # Las relaciones que la vista ya une no pueden quedar diferidas
+            columnas.update(_rutas_unidas(unidas))
+    if relaciones:
+        queryset = queryset.select_related(*relaciones)
+    if parcial and columnas is not None:
+        queryset = queryset.only(*columnas)
+    return queryset
+
+
+class ProyeccionCamposMixin:
+    """Vista genérica que ajusta select_related/only() a los campos que va a serializar"""
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        campos, _ = campos_solicitados(self.request)
+        return proyectar(queryset, self.get_serializer(), parcial=campos is not None)
@@ -0,0 +1,74 @@
+# usuarios/condicional.py
+"""
+Respuestas condicionales (ETag / If-None-Match) para endpoints de detalle.
+
+El ETag se deriva de columnas de versión (fecha_actualizacion) leídas con
+una consulta mínima, sin serializar el recurso; si el cliente ya tiene la
+versión vigente se responde 304 Not Modified sin cuerpo.
+"""
+import hashlib
+
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def calcular_etag(request, validador):
+    """ETag débil a partir del validador y del formato de la respuesta"""
+    formato = getattr(getattr(request, 'accepted_renderer', None), 'format', '')
+    resumen = hashlib.md5(f'{formato}:{validador!r}'.encode(), usedforsecurity=False).hexdigest()
+    return f'W/"{resumen}"'
+
+
+def _sin_debil(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def coincide(request, etag):
+    """Comparación débil contra If-None-Match (RFC 9110)"""
+    cabecera = request.headers.get('If-None-Match')
+    if not cabecera:
+        return False
+    if cabecera.strip() == '*':
+        return True
+    return any(_sin_debil(candidato) == _sin_debil(etag) for candidato in parse_etags(cabecera))
+
+
+def con_etag(response, etag):
+    if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+        response['ETag'] = etag
+        # El cliente puede guardar la respuesta pero debe revalidarla en cada uso
+        response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def no_modificado(etag):
+    return con_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+
+
+class RespuestaCondicionalMixin:
+    """
+    Añade ETag y 304 Not Modified a una vista de detalle genérica.
+
+    `campos_validador` son los campos (o expresiones) cuyo valor identifica
+    la versión de la representación; se leen sobre el mismo queryset de la
+    vista, así que las restricciones de acceso se mantienen.
+    """
+    campos_validador = ('fecha_actualizacion',)
+
+    def get_validador(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        return queryset.filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        ).order_by().values_list(*self.campos_validador).first()
+
+    def get(self, request, *args, **kwargs):
+        validador = self.get_validador()
+        if validador is None:
+            return super().get(request, *args, **kwargs)
+
+        etag = calcular_etag(request, validador)
+        if coincide(request, etag):
+            return no_modificado(etag)
+        return con_etag(super().get(request, *args, **kwargs), etag)
@@ -1,6 +1,7 @@
 # usuarios/serializers.py
 from rest_framework import serializers
 from django.contrib.auth import authenticate
+from .campos import CamposParcialesMixin
 from .models import Usuario
 
 class UsuarioRegistroSerializer(serializers.ModelSerializer):
@@ -74,7 +75,7 @@ class UsuarioLoginSerializer(serializers.Serializer):
         else:
             raise serializers.ValidationError('Debe incluir email y contraseña')
 
-class UsuarioPerfilSerializer(serializers.ModelSerializer):
+class UsuarioPerfilSerializer(CamposParcialesMixin, serializers.ModelSerializer):
     class Meta:
         model = Usuario
         fields = [
@@ -84,7 +85,7 @@ class UsuarioPerfilSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'fecha_registro']
 
-class UsuarioListSerializer(serializers.ModelSerializer):
+class UsuarioListSerializer(CamposParcialesMixin, serializers.ModelSerializer):
     """Serializer para lista de usuarios en administración"""
     fecha_registro = serializers.DateField(format='%Y-%m-%d', read_only=True)
     is_active = serializers.BooleanField(source='activo', read_only=True)
@@ -1,3 +1,153 @@
-from django.test import TestCase
+import importlib.util
+import os
+import threading
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .async_utils import consultas_concurrentes
+from .models import Usuario
+
+
+def crear_usuario(rol, sufijo, **extra):
+    datos = {
+        'Estudiante': {'matricula': f'M{sufijo}', 'carrera': 'Sistemas'},
+        'Docente': {'numero_empleado': f'N{sufijo}', 'departamento': 'Ingeniería'},
+        'Administrador': {'area': 'Biblioteca'},
+    }[rol]
+    return Usuario.objects.create_user(
+        f'{sufijo}@edubooks.test', sufijo, 'clave-segura-123',
+        nombre=rol, apellido=sufijo, rol=rol, **{**datos, **extra}
+    )
+
+
+def cabecera_jwt(usuario):
+    return {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(usuario).access_token}'}
+
+
+# ============ VISTAS ASÍNCRONAS ============
+
+class ConsultasConcurrentesTests(TransactionTestCase):
+    """Las consultas se ejecutan en hilos del ejecutor: se necesitan datos confirmados"""
+
+    def setUp(self):
+        self.admin = crear_usuario('Administrador', 'adm')
+        crear_usuario('Estudiante', 'est')
+        crear_usuario('Estudiante', 'est2', activo=False)
+
+    def test_estadisticas_asincronas(self):
+        r = self.client.get('/api/async/auth/estadisticas/', **cabecera_jwt(self.admin))
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json(), {
+            'total_usuarios': 3,
+            'usuarios_activos': 2,
+            'usuarios_inactivos': 1,
+            'por_rol': {'estudiantes': 2, 'docentes': 0, 'administradores': 1},
+        })
+
+    def test_solo_administradores(self):
+        estudiante = Usuario.objects.get(username='est')
+        r = self.client.get('/api/async/auth/estadisticas/', **cabecera_jwt(estudiante))
+        self.assertEqual(r.status_code, 403)
+        self.assertEqual(self.client.get('/api/async/auth/estadisticas/').status_code, 401)
+
+    def test_los_hilos_reutilizan_su_conexion(self):
+        creadas = []
+
+        def contar(sender, connection, **kwargs):
+            creadas.append(threading.get_ident())
+
+        async def rondas():
+            resultados = []
+            for _ in range(3):
+                resultados.append(await consultas_concurrentes(
+                    total=lambda: Usuario.objects.count(),
+                    estudiantes=lambda: Usuario.objects.filter(rol='Estudiante').count(),
+                ))
+            # Cierra las conexiones de los hilos del ejecutor antes de terminar la prueba
+            await consultas_concurrentes(a=connections.close_all, b=connections.close_all)
+            return resultados
+
+        connection_created.connect(contar)
+        self.addCleanup(connection_created.disconnect, contar)
+        with mock.patch.dict(connection.settings_dict, {'CONN_MAX_AGE': 60}):
+            resultados = async_to_sync(rondas)()
+
+        self.assertEqual(resultados, [{'total': 3, 'estudiantes': 2}] * 3)
+        # Una conexión por hilo del ejecutor, no una por consulta
+        self.assertEqual(len(creadas), len(set(creadas)))
+
+
+# ============ PERFIL CONDICIONAL ============
+
+class PerfilCondicionalTests(TestCase):
+
+    def setUp(self):
+        self.usuario = crear_usuario('Estudiante', 'est')
+        self.client.defaults.update(cabecera_jwt(self.usuario))
+
+    def test_perfil_responde_304(self):
+        primera = self.client.get('/api/auth/perfil/')
+        segunda = self.client.get('/api/auth/perfil/', HTTP_IF_NONE_MATCH=primera['ETag'])
+
+        self.assertEqual(primera.status_code, 200)
+        self.assertEqual(segunda.status_code, 304)
+        self.assertEqual(segunda.content, b'')
+
+    def test_editar_el_perfil_cambia_el_etag(self):
+        etag = self.client.get('/api/auth/perfil/')['ETag']
+        self.client.put('/api/auth/actualizar-perfil/', {'carrera': 'Matemáticas'}, content_type='application/json')
+
+        r = self.client.get('/api/auth/perfil/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(r.status_code, 200)
+        self.assertNotEqual(r['ETag'], etag)
+        self.assertEqual(r.json()['user']['carrera'], 'Matemáticas')
+
+
+# ============ CONFIGURACIÓN DE CONEXIONES ============
+
+def cargar_settings(**entorno):
+    """Ejecuta edubooks/settings.py con las variables de entorno indicadas"""
+    ruta = os.path.join(settings.BASE_DIR, 'edubooks', 'settings.py')
+    especificacion = importlib.util.spec_from_file_location('settings_prueba', ruta)
+    modulo = importlib.util.module_from_spec(especificacion)
+    with mock.patch.dict(os.environ, entorno):
+        especificacion.loader.exec_module(modulo)
+    return modulo
+
+
+class ConfiguracionConexionesTests(SimpleTestCase):
+
+    def test_modo_persistente_por_defecto(self):
+        modulo = cargar_settings(DB_CONN_MAX_AGE='120', DB_STATEMENT_TIMEOUT_MS='5000')
+        base = modulo.DATABASES['default']
+
+        self.assertEqual(base['CONN_MAX_AGE'], 120)
+        self.assertTrue(base['CONN_HEALTH_CHECKS'])
+        self.assertEqual(base['OPTIONS']['options'], '-c statement_timeout=5000')
+
+    def test_modo_pgbouncer_sin_cursores_de_servidor(self):
+        base = cargar_settings(DB_MODO='pgbouncer').DATABASES['default']
+
+        self.assertTrue(base['DISABLE_SERVER_SIDE_CURSORS'])
+        self.assertNotIn('options', base['OPTIONS'])
+
+    def test_modo_pool_exige_django_y_psycopg_compatibles(self):
+        with mock.patch('django.VERSION', (4, 2, 7, 'final', 0)):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'DB_MODO=pool'):
+                cargar_settings(DB_MODO='pool')
+        with mock.patch('django.VERSION', (5, 1, 0, 'final', 0)), \
+                mock.patch('importlib.util.find_spec', return_value=None):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'psycopg'):
+                cargar_settings(DB_MODO='pool')
+
+    def test_modo_desconocido(self):
+        with self.assertRaises(ImproperlyConfigured):
+            cargar_settings(DB_MODO='piscina')
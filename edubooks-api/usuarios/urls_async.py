@@ -0,0 +1,9 @@
+# usuarios/urls_async.py
+from django.urls import path
+from . import async_views
+
+app_name = 'usuarios_async'
+
+urlpatterns = [
+    path('estadisticas/', async_views.estadisticas_usuarios, name='estadisticas-usuarios'),
+]
@@ -12,6 +12,8 @@ from .serializers import (
     UsuarioPerfilSerializer,
     UsuarioListSerializer
 )
+from .campos import ProyeccionCamposMixin
+from .condicional import calcular_etag, coincide, con_etag, no_modificado
 from .models import Usuario
 from .permissions import IsAdministrador
 
@@ -90,11 +92,16 @@ def logout_view(request):
 @permission_classes([IsAuthenticated])
 def perfil_view(request):
     """Vista para obtener perfil del usuario"""
+    # El usuario ya viene cargado por la autenticación: el validador no cuesta consultas
+    etag = calcular_etag(request, (request.user.pk, request.user.fecha_actualizacion))
+    if coincide(request, etag):
+        return no_modificado(etag)
+    
     serializer = UsuarioPerfilSerializer(request.user)
-    return Response({
+    return con_etag(Response({
         'message': 'Perfil obtenido exitosamente',
         'user': serializer.data
-    }, status=status.HTTP_200_OK)
+    }, status=status.HTTP_200_OK), etag)
 
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
@@ -121,7 +128,7 @@ class StandardResultsSetPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
-class UsuarioListView(generics.ListAPIView):
+class UsuarioListView(ProyeccionCamposMixin, generics.ListAPIView):
     """Lista de usuarios para administradores"""
     serializer_class = UsuarioListSerializer
     pagination_class = StandardResultsSetPagination